@@ -0,0 +1,78 @@
+"""Throughput and memory ceiling of RequestQueue's out-of-core (np.memmap) matmul.
+
+Usage:
+    python benchmark_out_of_core.py [--size 8192] [--tile-mib 32] [--workers 2]
+                                    [--multiprocessing] [--dir /scratch] [--check 16]
+
+Writes two random size x size float64 operands to memmap files in --dir,
+multiplies them through a RequestQueue and reports wall time, GFLOP/s and
+peak RSS of the submitting process and of the busiest tile task next to the
+size of the operand files. --check samples that many result entries and
+compares them with a direct dot product.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from concurrency import RequestQueue
+from out_of_core import peak_rss
+
+ROWS_PER_FILL = 256
+
+
+def random_memmap(size, directory):
+    """Random operand written with plain file I/O, so none of it is mapped into this process."""
+    fd, path = tempfile.mkstemp(suffix=".dat", dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        for start in range(0, size, ROWS_PER_FILL):
+            np.random.rand(min(ROWS_PER_FILL, size - start), size).tofile(f)
+    return np.memmap(path, np.float64, "r", shape=(size, size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=8192)
+    parser.add_argument("--tile-mib", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--multiprocessing", action="store_true")
+    parser.add_argument("--dir", default=None, help="directory for operand and result files")
+    parser.add_argument("--check", type=int, default=16)
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.gettempdir()
+    a, b = random_memmap(args.size, directory), random_memmap(args.size, directory)
+    rq = RequestQueue(use_multiprocessing=args.multiprocessing, num_workers=args.workers,
+                      tile_bytes=args.tile_mib << 20, spill_dir=directory)
+    rq.start()
+    result = None
+    try:
+        start = time.perf_counter()
+        result = rq.submit(a, b).result()
+        elapsed = time.perf_counter() - start
+
+        print(f"size {args.size}, tile {args.tile_mib} MiB, {args.workers} "
+              f"{'processes' if args.multiprocessing else 'threads'}")
+        print(f"  operand files   {2 * a.nbytes / 2**20:10.1f} MiB")
+        print(f"  wall time       {elapsed:10.2f} s")
+        print(f"  throughput      {2 * args.size ** 3 / elapsed / 1e9:10.2f} GFLOP/s")
+        print(f"  peak RSS        {peak_rss() / 2**20:10.1f} MiB (submitting process)")
+        print(f"  peak tile RSS   {rq.peak_tile_rss / 2**20:10.1f} MiB (busiest tile task process)")
+
+        # Checked last: reading columns of b maps pages into this process.
+        rng = np.random.default_rng(0)
+        for i, j in rng.integers(0, args.size, size=(args.check, 2)):
+            expected = np.dot(a[i], b[:, j])
+            assert np.isclose(result[i, j], expected), (i, j, result[i, j], expected)
+        print(f"  checked {args.check} sampled entries")
+    finally:
+        rq.stop()
+        for array in (a, b, result):
+            if array is not None:
+                os.unlink(array.filename)
+
+
+if __name__ == "__main__":
+    main()
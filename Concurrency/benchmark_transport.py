@@ -0,0 +1,67 @@
+"""Per-request latency and bytes copied for RequestQueue's multiprocessing transports.
+
+Usage:
+    python benchmark_transport.py [--sizes 256 1024 2048] [--requests 20]
+
+Modes:
+    pickle          matrices are pickled through the process pool's pipes
+    shared_memory   operands are copied once into pooled shared memory
+    shm+allocate    operands are built in rq.allocate() buffers (zero copy)
+
+For pickle, "copied/request" counts each operand and the result once, the
+serialised payload; the pipe adds further kernel copies on top of that.
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from concurrency import RequestQueue
+
+
+def run_mode(mode, n, requests):
+    transport = "pickle" if mode == "pickle" else "shared_memory"
+    rq = RequestQueue(maxsize=4, use_multiprocessing=True, num_workers=1, transport=transport)
+    rq.start()
+    latencies, copied = [], 0
+    try:
+        for i in range(requests + 1):
+            if mode == "shm+allocate":
+                a, b = rq.allocate((n, n)), rq.allocate((n, n))
+                a[...] = np.random.rand(n, n)
+                b[...] = np.random.rand(n, n)
+            else:
+                a, b = np.random.rand(n, n), np.random.rand(n, n)
+            before = rq.transport.bytes_copied if rq.transport else 0
+            start = time.perf_counter()
+            result = rq.submit(a, b).result()
+            elapsed = time.perf_counter() - start
+            if i == 0:
+                continue  # warm-up: process start and first segment allocations
+            latencies.append(elapsed)
+            if rq.transport:
+                copied += rq.transport.bytes_copied - before
+            else:
+                copied += a.nbytes + b.nbytes + result.nbytes
+            del result
+    finally:
+        rq.stop()
+    return statistics.median(latencies), copied / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 1024, 2048])
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'n':>6} {'mode':>14} {'median latency':>16} {'copied/request':>16}")
+    for n in args.sizes:
+        for mode in ("pickle", "shared_memory", "shm+allocate"):
+            latency, copied = run_mode(mode, n, args.requests)
+            print(f"{n:>6} {mode:>14} {latency * 1e3:>13.2f} ms {copied / 2**20:>12.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
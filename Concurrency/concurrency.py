@@ -1,63 +1,728 @@
+import asyncio
+import functools
+import json
 import numpy as np
 import queue
 import threading
 import multiprocessing
 import time
+import weakref
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from out_of_core import TILE_BYTES, is_memmap, tiled_matmul
+from shared_transport import SharedMemoryTransport, matmul_shape, multiply_shared
+
+
+def multiply(matrix1, matrix2):
+    return np.matmul(matrix1, matrix2)
+
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+BACKPRESSURE_POLICIES = ("block", "reject", "drop_oldest")
+
+
+class RequestRejected(queue.Full):
+    """Raised by submit() when a request is not admitted to the queue."""
+
+
+class RequestDropped(Exception):
+    """Set on the Future of a queued request evicted by the drop_oldest policy."""
+
+
+class Request:
+    """A queued multiplication and the Future its result is delivered to."""
+
+    __slots__ = ("future", "matrix1", "matrix2", "batch_key", "priority", "nbytes", "enqueued_at",
+                 "__weakref__")
+
+    def __init__(self, matrix1, matrix2, priority=PRIORITY_NORMAL):
+        self.future = Future()
+        self.matrix1 = matrix1
+        self.matrix2 = matrix2
+        self.batch_key = _batch_key(matrix1, matrix2)
+        self.priority = priority
+        self.nbytes = resident_bytes(matrix1, matrix2)
+        self.enqueued_at = time.perf_counter()
+
+
+def operand_bytes(*operands):
+    """Bytes held by the ndarray operands; anything else counts as zero."""
+    return sum(getattr(operand, "nbytes", 0) for operand in operands)
+
+
+def resident_bytes(*operands):
+    """operand_bytes without np.memmap operands, which stay on disk while queued."""
+    return operand_bytes(*(operand for operand in operands if not is_memmap(operand)))
+
+
+def _batch_key(matrix1, matrix2):
+    """Requests with equal keys can be stacked into one 3D np.matmul; None never batches."""
+    if not (isinstance(matrix1, np.ndarray) and isinstance(matrix2, np.ndarray)):
+        return None
+    if is_memmap(matrix1) or is_memmap(matrix2):
+        return None
+    if matrix1.ndim != 2 or matrix2.ndim != 2:
+        return None
+    return matrix1.shape, matrix1.dtype, matrix2.shape, matrix2.dtype
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class JobQueue:
+    """Bounded queue of Requests with priority lanes and byte-based admission.
+
+    Each priority (lower value first) has its own FIFO lane, and get_batch
+    always serves the most urgent non-empty lane. A request is admitted while
+    the queue holds fewer than maxsize requests and its operands fit in
+    max_bytes on top of the bytes already queued; an empty queue admits any
+    single request, however large. When a request does not fit, policy
+    decides what happens:
+
+        block        wait for room, raising RequestRejected on timeout
+        reject       raise RequestRejected straight away
+        drop_oldest  evict the oldest requests of the same or lower priority
+                     until it fits; their Futures fail with RequestDropped
+    """
+
+    def __init__(self, maxsize=0, max_bytes=None, policy="block"):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._lanes = {}
+        self._count = 0
+        self.queued_bytes = 0
+        self.rejected = 0
+        self.dropped = 0
+        self._cond = threading.Condition()
+        self._async_waiters = []
+        self._closed = False
+
+    def __len__(self):
+        return self._count
+
+    def _fits(self, nbytes, count=None, queued_bytes=None):
+        count = self._count if count is None else count
+        queued_bytes = self.queued_bytes if queued_bytes is None else queued_bytes
+        if count == 0:
+            return True
+        if self.maxsize > 0 and count >= self.maxsize:
+            return False
+        return self.max_bytes is None or queued_bytes + nbytes <= self.max_bytes
+
+    def put(self, request, timeout=None, block=True):
+        """Admit a request according to the policy (see the class docstring).
+
+        With block=False the "block" policy does not wait: put returns False
+        instead of queueing when there is no room. Returns True once the
+        request is queued. Raises RuntimeError if the queue is closed before
+        the request gets in.
+        """
+        dropped = []
+        with self._cond:
+            if self.policy == "block":
+                if not block and not self._fits(request.nbytes):
+                    return False
+                self._cond.wait_for(lambda: self._closed or self._fits(request.nbytes), timeout)
+            if self._closed:
+                raise RuntimeError("JobQueue is closed")
+            if self.policy == "drop_oldest":
+                dropped = self._evict_for(request)
+            if not self._fits(request.nbytes):
+                self.rejected += 1
+                raise RequestRejected(
+                    f"Queue full: {self._count} requests, {self.queued_bytes} bytes queued")
+            self._lanes.setdefault(request.priority, deque()).append(request)
+            self._count += 1
+            self.queued_bytes += request.nbytes
+            self._notify()
+        for victim in dropped:
+            if victim.future.set_running_or_notify_cancel():
+                victim.future.set_exception(RequestDropped("Evicted from a full queue"))
+        return True
+
+    async def put_async(self, request, timeout=None):
+        """Coroutine version of put() for the running event loop.
+
+        Waits for room without blocking the loop or holding a thread. If the
+        awaiting task is cancelled while waiting, the request is never queued.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            with self._cond:
+                if self.put(request, block=False):
+                    return True
+                if self._closed:
+                    raise RuntimeError("JobQueue is closed")
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            remaining = None if deadline is None else deadline - loop.time()
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                with self._cond:
+                    if self.put(request, block=False):
+                        return True
+                    self.rejected += 1
+                    raise RequestRejected(
+                        f"Queue full: {self._count} requests, {self.queued_bytes} bytes queued") from None
+
+    def _notify(self):
+        # Called with self._cond held.
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:
+                pass  # the waiter's loop has closed
+
+    def _evict_for(self, request):
+        """Remove and return the oldest requests whose eviction makes room for request.
+
+        Only lanes with the same or lower priority are considered; if evicting
+        all of them is not enough, nothing is removed.
+        """
+        count, queued_bytes, victims = self._count, self.queued_bytes, []
+        for priority in sorted(self._lanes, reverse=True):
+            if priority < request.priority:
+                break
+            for victim in self._lanes[priority]:
+                if self._fits(request.nbytes, count, queued_bytes):
+                    break
+                victims.append(victim)
+                count -= 1
+                queued_bytes -= victim.nbytes
+        if not self._fits(request.nbytes, count, queued_bytes):
+            return []
+        # Victims are a prefix of each lane, oldest first.
+        for victim in victims:
+            self._lanes[victim.priority].popleft()
+        self._count = count
+        self.queued_bytes = queued_bytes
+        self.dropped += len(victims)
+        return victims
+
+    def wait_for_room(self, nbytes, timeout=None):
+        """Block until a request holding nbytes of operands would be admitted.
+
+        Returns False on timeout or once the queue is closed.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._closed or self._fits(nbytes), timeout)
+            return not self._closed and self._fits(nbytes)
+
+    def _next_lane(self):
+        for priority in sorted(self._lanes):
+            if self._lanes[priority]:
+                return priority
+        return None
+
+    def get_batch(self, max_size=1, max_wait=0.0):
+        """Remove and return the most urgent request plus up to max_size - 1 others like it.
+
+        Batch-mates come from the same priority lane and share its batch key;
+        up to max_wait seconds are spent waiting for them to arrive. Blocks
+        while the queue is empty; returns an empty list once the queue is
+        closed and empty.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._count or self._closed)
+            if not self._count:
+                return []
+            priority = self._next_lane()
+            batch = [self._lanes[priority].popleft()]
+            self._taken(batch[0])
+            key = batch[0].batch_key
+            if key is not None and max_size > 1:
+                deadline = time.perf_counter() + max_wait
+                while True:
+                    self._take_matching(priority, key, batch, max_size)
+                    remaining = deadline - time.perf_counter()
+                    if len(batch) >= max_size or remaining <= 0 or self._closed:
+                        break
+                    self._notify()  # room was freed for blocked producers
+                    self._cond.wait(remaining)
+            self._notify()
+            return batch
+
+    def _taken(self, request):
+        self._count -= 1
+        self.queued_bytes -= request.nbytes
+
+    def _take_matching(self, priority, key, batch, max_size):
+        lane, kept = self._lanes[priority], deque()
+        while lane and len(batch) < max_size:
+            request = lane.popleft()
+            if request.batch_key == key:
+                batch.append(request)
+                self._taken(request)
+            else:
+                kept.append(request)
+        kept.extend(lane)
+        self._lanes[priority] = kept
+
+    def close(self):
+        """Wake all waiting producers and workers; get_batch returns [] once the queue is empty."""
+        with self._cond:
+            self._closed = True
+            self._notify()
+
+    def discard(self, request):
+        """Remove a request that is still queued; returns False if a worker already took it."""
+        with self._cond:
+            lane = self._lanes.get(request.priority)
+            try:
+                lane.remove(request)
+            except (AttributeError, ValueError):
+                return False
+            self._taken(request)
+            self._notify()
+            return True
+
+    def drain(self):
+        """Remove and return every queued request, most urgent first."""
+        with self._cond:
+            items = [request for priority in sorted(self._lanes) for request in self._lanes[priority]]
+            self._lanes = {}
+            self._count = 0
+            self.queued_bytes = 0
+            self._notify()
+            return items
+
+
+class BatchMetrics:
+    """Size of every dispatched batch and how long its oldest request waited.
+
+    The wait covers time queued plus the batching window. Running totals are
+    kept along with the most recent `history` batches, so max_batch_size and
+    max_batch_wait can be tuned against real traffic.
+    """
+
+    def __init__(self, history=10000):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent = deque(maxlen=history)
+
+    def record(self, size, wait):
+        with self._lock:
+            self.batches += 1
+            self.requests += size
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.recent.append((size, wait))
+
+    def snapshot(self):
+        with self._lock:
+            sizes = {}
+            for size, _ in self.recent:
+                sizes[size] = sizes.get(size, 0) + 1
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+                "mean_wait": self.total_wait / self.batches if self.batches else 0.0,
+                "max_wait": self.max_wait,
+                "recent_size_histogram": dict(sorted(sizes.items())),
+            }
+
+
+def matmul_flops(matrix1, matrix2):
+    """Floating-point operations in matrix1 @ matrix2 (2 per multiply-add); 0 if unknown."""
+    shape1, shape2 = np.shape(matrix1), np.shape(matrix2)
+    if len(shape1) < 2 or len(shape2) < 2:
+        return 0
+    try:
+        out_shape = matmul_shape(shape1, shape2)
+    except ValueError:
+        return 0
+    return 2 * int(np.prod(out_shape)) * shape1[-1]
+
+
+def _percentiles(values):
+    if not values:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]).tolist()
+    return {"count": len(values), "mean": float(np.mean(values)),
+            "p50": p50, "p95": p95, "p99": p99, "max": max(values)}
+
+
+class RequestStats:
+    """Per-request timings, queue depth samples and worker busy time.
+
+    For each finished request it keeps the enqueue wait (queued until a
+    worker started it), the compute time of its batch, the end-to-end time
+    and the GFLOP/s the batch achieved. Percentiles cover the most recent
+    `history` requests; counters cover the queue's whole life.
+    """
+
+    def __init__(self, num_workers, history=10000):
+        self._lock = threading.Lock()
+        self.num_workers = num_workers
+        self.started_at = time.perf_counter()
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.total_flops = 0
+        self.busy_time = 0.0
+        self.waits = deque(maxlen=history)
+        self.computes = deque(maxlen=history)
+        self.end_to_end = deque(maxlen=history)
+        self.gflops = deque(maxlen=history)
+        self.depths = deque(maxlen=history)
+
+    def record_depth(self, depth):
+        with self._lock:
+            self.depths.append(depth)
+
+    def record_cancelled(self, count=1):
+        with self._lock:
+            self.cancelled += count
+
+    def record_batch(self, requests, started, finished, flops, failed=False):
+        """Record a batch of requests that ran from started to finished (perf_counter)."""
+        compute = finished - started
+        with self._lock:
+            self.busy_time += compute
+            if failed:
+                self.failed += len(requests)
+                return
+            self.completed += len(requests)
+            self.total_flops += flops
+            for request in requests:
+                self.waits.append(started - request.enqueued_at)
+                self.computes.append(compute)
+                self.end_to_end.append(finished - request.enqueued_at)
+                if flops and compute > 0:
+                    self.gflops.append(flops / compute / 1e9)
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self.started_at
+            return {
+                "uptime": elapsed,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "throughput": self.completed / elapsed if elapsed > 0 else 0.0,
+                "utilisation": self.busy_time / (elapsed * self.num_workers) if elapsed > 0 else 0.0,
+                "gflops_total": self.total_flops / self.busy_time / 1e9 if self.busy_time > 0 else 0.0,
+                "enqueue_wait": _percentiles(list(self.waits)),
+                "compute": _percentiles(list(self.computes)),
+                "end_to_end": _percentiles(list(self.end_to_end)),
+                "gflops_per_job": _percentiles(list(self.gflops)),
+                "queue_depth": _percentiles(list(self.depths)),
+            }
+
 
 class RequestQueue:
-    def __init__(self, maxsize=10, use_multiprocessing=False):
-        self.queue = queue.Queue(maxsize=maxsize)
+    """Queue of matrix multiplication requests served by a pool of workers.
+
+    submit() returns a concurrent.futures.Future that resolves to the product.
+    Each worker is a thread; with use_multiprocessing=True the threads hand
+    the multiplication to a process pool of the same size instead of running
+    it in-process.
+
+    In multiprocessing mode, transport="shared_memory" (the default) places
+    operands and results in pooled shared memory and sends the processes only
+    descriptors; transport="pickle" pickles the matrices through the pool's
+    pipes. Operands created with allocate() are never copied.
+
+    With max_batch_size > 1, a worker that picks up a 2D request waits up to
+    max_batch_wait seconds for other requests with the same shapes and
+    dtypes, multiplies them as one stacked 3D np.matmul and scatters the
+    slices back to each Future. batch_metrics records every batch.
+
+    Admission is bounded by maxsize requests and, optionally, by
+    max_queued_bytes of queued operands; policy ("block", "reject" or
+    "drop_oldest") chooses what happens when a request does not fit (see
+    JobQueue). Requests whose operands total at most small_request_bytes go
+    to the PRIORITY_HIGH lane unless submit() is given a priority, so small
+    interactive jobs are served ahead of large queued ones.
+
+    Jobs with an np.memmap operand run out of core: the product is computed
+    in tiles of about tile_bytes per operand block, spread over the process
+    pool (or a thread pool of num_workers without multiprocessing), and
+    returned as an np.memmap in a temporary file under spill_dir, which the
+    caller should delete when done. peak_tile_rss is the largest peak RSS
+    any tile task's process has reported.
+
+    stats() returns a snapshot of request timings, queue depth, worker
+    utilisation, GFLOP/s and dropped/rejected/cancelled counters. With
+    stats_path set, a snapshot is also appended to that file as a JSON line
+    every stats_interval seconds and once more on stop().
+    """
+
+    def __init__(self, maxsize=10, use_multiprocessing=False, num_workers=None,
+                 transport="shared_memory", max_batch_size=1, max_batch_wait=0.0,
+                 policy="block", max_queued_bytes=None, small_request_bytes=1 << 20,
+                 tile_bytes=TILE_BYTES, spill_dir=None, stats_path=None, stats_interval=10.0):
+        if transport not in ("shared_memory", "pickle"):
+            raise ValueError(f"Unknown transport: {transport}")
+        self.queue = JobQueue(maxsize=maxsize, max_bytes=max_queued_bytes, policy=policy)
+        self.small_request_bytes = small_request_bytes
         self.use_multiprocessing = use_multiprocessing
-        
-        if use_multiprocessing:
-            self.process = multiprocessing.Process(target=self.worker)
-        else:
-            self.thread = threading.Thread(target=self.worker)
-        
-        self.running = True
-    
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait = max_batch_wait
+        self.batch_metrics = BatchMetrics()
+        self.request_stats = RequestStats(self.num_workers)
+        self.stats_path = stats_path
+        self.stats_interval = stats_interval
+        self._stats_stop = threading.Event()
+        self._stats_thread = None
+        self.tile_bytes = tile_bytes
+        self.spill_dir = spill_dir
+        self.peak_tile_rss = 0
+        self.executor = None
+        self.tile_executor = None
+        self.transport = None
+        if use_multiprocessing and transport == "shared_memory":
+            self.transport = SharedMemoryTransport()
+        self.threads = [
+            threading.Thread(target=self.worker, name=f"RequestQueue-worker-{i}", daemon=True)
+            for i in range(self.num_workers)
+        ]
+        self.running = False
+
     def start(self):
         if self.use_multiprocessing:
-            self.process.start()
+            self.executor = ProcessPoolExecutor(max_workers=self.num_workers)
+            self.tile_executor = self.executor
         else:
-            self.thread.start()
-    
-    def stop(self):
+            self.tile_executor = ThreadPoolExecutor(self.num_workers, thread_name_prefix="RequestQueue-tile")
+        self.request_stats.started_at = time.perf_counter()
+        self.running = True
+        for thread in self.threads:
+            thread.start()
+        if self.stats_path is not None:
+            self._stats_thread = threading.Thread(target=self._export_periodically,
+                                                  name="RequestQueue-stats", daemon=True)
+            self._stats_thread.start()
+
+    def stop(self, drain=True):
+        """Stop accepting requests and shut the workers down.
+
+        With drain=True every queued request is processed first; otherwise
+        requests that have not started yet are cancelled.
+        """
         self.running = False
-        if self.use_multiprocessing:
-            self.process.join()
-        else:
-            self.thread.join()
-    
+        if not drain:
+            self._cancel_pending()
+        self.queue.close()
+        for thread in self.threads:
+            thread.join()
+        # Anything submitted while the workers were shutting down will never run.
+        self._cancel_pending()
+        if self.tile_executor is not None:
+            self.tile_executor.shutdown()
+            self.tile_executor = None
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.transport is not None:
+            self.transport.close()
+        if self._stats_thread is not None:
+            self._stats_stop.set()
+            self._stats_thread.join()
+            self._stats_thread = None
+            self.export_stats(self.stats_path)
+
+    def _cancel_pending(self):
+        cancelled = sum(request.future.cancel() for request in self.queue.drain())
+        self.request_stats.record_cancelled(cancelled)
+
+    def stats(self):
+        """Snapshot of timings, throughput and counters; every duration is in seconds."""
+        snapshot = self.request_stats.snapshot()
+        snapshot.update({
+            "queue_depth_now": len(self.queue),
+            "queued_bytes": self.queue.queued_bytes,
+            "rejected": self.queue.rejected,
+            "dropped": self.queue.dropped,
+            "batches": self.batch_metrics.snapshot(),
+            "peak_tile_rss": self.peak_tile_rss,
+        })
+        return snapshot
+
+    def export_stats(self, path):
+        """Append a stats() snapshot, stamped with the wall-clock time, to path as a JSON line."""
+        record = {"time": time.time(), **self.stats()}
+        with open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def _export_periodically(self):
+        while not self._stats_stop.wait(self.stats_interval):
+            self.export_stats(self.stats_path)
+
+    def allocate(self, shape, dtype=np.float64):
+        """Return an empty array that can be submitted without being copied.
+
+        In shared-memory mode the array lives in a pooled segment that worker
+        processes map directly; otherwise it is a plain np.empty array.
+        """
+        if self.transport is not None:
+            return self.transport.allocate(shape, dtype)
+        return np.empty(shape, dtype)
+
+    def submit(self, matrix1, matrix2, timeout=None, priority=None):
+        """Queue matrix1 @ matrix2 and return a Future for the result.
+
+        priority defaults to PRIORITY_HIGH for small requests and
+        PRIORITY_NORMAL otherwise; lower values are served first. Raises
+        RequestRejected when the backpressure policy refuses the request
+        (for "block", once timeout expires).
+        """
+        if not self.running:
+            raise RuntimeError("RequestQueue is not running")
+        request = self._request(matrix1, matrix2, priority)
+        self.queue.put(request, timeout=timeout)
+        self._admitted(request)
+        return request.future
+
+    async def submit_async(self, matrix1, matrix2, priority=None, timeout=None):
+        """Coroutine version of submit(): await it for the product.
+
+        Never blocks the event loop. When the "block" policy has to wait for
+        room, the coroutine waits without tying up a thread, and cancelling it
+        then leaves the request unqueued. Cancelling the awaiting task later
+        cancels the request and, if no worker has started it, removes it from
+        the queue.
+        """
+        if not self.running:
+            raise RuntimeError("RequestQueue is not running")
+        request = self._request(matrix1, matrix2, priority)
+        await self.queue.put_async(request, timeout)
+        self._admitted(request)
+        return await asyncio.wrap_future(request.future)
+
+    def _request(self, matrix1, matrix2, priority):
+        if priority is None:
+            small = operand_bytes(matrix1, matrix2) <= self.small_request_bytes
+            priority = PRIORITY_HIGH if small else PRIORITY_NORMAL
+        return Request(matrix1, matrix2, priority)
+
+    def _admitted(self, request):
+        self.request_stats.record_depth(len(self.queue))
+        # A weak reference: the request owns the Future, and a cycle through
+        # the callback would keep the result alive until the next gc run.
+        request.future.add_done_callback(functools.partial(self._discard_if_cancelled, weakref.ref(request)))
+
+    def _discard_if_cancelled(self, request_ref, future):
+        # A Future can only be cancelled before a worker starts it, so a
+        # cancelled request still in the queue is dead weight: free its room.
+        request = request_ref()
+        if future.cancelled() and request is not None and self.queue.discard(request):
+            self.request_stats.record_cancelled()
+
     def add_request(self, matrix1, matrix2):
-        try:
-            self.queue.put((matrix1, matrix2), timeout=1)
-        except queue.Full:
-            print("Queue is full, dropping request")
-    
+        """Same as submit(); a rejected request raises instead of being dropped silently."""
+        return self.submit(matrix1, matrix2)
+
+    def wait_for_capacity(self, nbytes, timeout=None):
+        """Block until a request with nbytes of operands would be admitted.
+
+        Lets a producer hold off building large operands until the queue can
+        take them. Returns False on timeout or after stop().
+        """
+        return self.queue.wait_for_room(nbytes, timeout)
+
     def worker(self):
-        while self.running:
-            try:
-                matrix1, matrix2 = self.queue.get(timeout=1)
-                result = np.matmul(matrix1, matrix2)
-                print("Processed matrix multiplication result shape:", result.shape)
-                self.queue.task_done()
-            except queue.Empty:
-                pass
-
-# Test configuration
-queue_size = 10000
-num_requests = 100
-matrix_size = 10000 
-use_multiprocessing = False
-
-rq = RequestQueue(maxsize=queue_size, use_multiprocessing=use_multiprocessing)
-rq.start()
-
-for _ in range(num_requests):
-    A = np.random.rand(matrix_size, matrix_size)
-    B = np.random.rand(matrix_size, matrix_size)
-    rq.add_request(A, B)
-    time.sleep(0.1) 
-
-rq.stop()
\ No newline at end of file
+        while True:
+            batch = self.queue.get_batch(self.max_batch_size, self.max_batch_wait)
+            if not batch:
+                return
+            self.request_stats.record_depth(len(self.queue))
+            self.batch_metrics.record(len(batch), time.perf_counter() - batch[0].enqueued_at)
+            self._process(batch)
+            # Drop the references before blocking on the next get, so an idle
+            # worker does not keep the last operands alive.
+            batch = None
+
+    def _process(self, batch):
+        queued = len(batch)
+        batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+        self.request_stats.record_cancelled(queued - len(batch))
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            if len(batch) == 1:
+                results = [self._execute(batch[0].matrix1, batch[0].matrix2)]
+            else:
+                stacked1 = self._stack([request.matrix1 for request in batch])
+                stacked2 = self._stack([request.matrix2 for request in batch])
+                results = list(self._execute(stacked1, stacked2))
+        except BaseException as e:
+            self.request_stats.record_batch(batch, started, time.perf_counter(), 0, failed=True)
+            for request in batch:
+                request.future.set_exception(e)
+        else:
+            flops = sum(matmul_flops(request.matrix1, request.matrix2) for request in batch)
+            self.request_stats.record_batch(batch, started, time.perf_counter(), flops)
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+
+    def _stack(self, matrices):
+        out = self.allocate((len(matrices),) + matrices[0].shape, matrices[0].dtype)
+        np.stack(matrices, out=out)
+        return out
+
+    def _execute(self, matrix1, matrix2):
+        if is_memmap(matrix1) or is_memmap(matrix2):
+            result, peak = tiled_matmul(self.tile_executor, np.asanyarray(matrix1), np.asanyarray(matrix2),
+                                        tile_bytes=self.tile_bytes, directory=self.spill_dir)
+            self.peak_tile_rss = max(self.peak_tile_rss, peak)
+            return result
+        if self.transport is not None and np.ndim(matrix1) >= 2 and np.ndim(matrix2) >= 2:
+            return self.transport.run(self.executor, multiply_shared, matrix1, matrix2)
+        if self.executor is not None:
+            return self.executor.submit(multiply, matrix1, matrix2).result()
+        return multiply(matrix1, matrix2)
+
+
+if __name__ == "__main__":
+    # Test configuration
+    queue_size = 10000
+    num_requests = 100
+    matrix_size = 10000
+    use_multiprocessing = False
+
+    matrix_bytes = matrix_size * matrix_size * np.dtype(np.float64).itemsize
+    # Keep at most a few requests' worth of operands queued at once.
+    rq = RequestQueue(maxsize=queue_size, use_multiprocessing=use_multiprocessing,
+                      max_queued_bytes=4 * 2 * matrix_bytes)
+    rq.start()
+
+    def report(future):
+        if not future.cancelled() and future.exception() is None:
+            print("Processed matrix multiplication result shape:", future.result().shape)
+
+    for _ in range(num_requests):
+        # Only build the next operands once the queue has room for them.
+        rq.wait_for_capacity(2 * matrix_bytes)
+        A = np.random.rand(matrix_size, matrix_size)
+        B = np.random.rand(matrix_size, matrix_size)
+        rq.submit(A, B).add_done_callback(report)
+        del A, B  # the queue holds the only references until a worker is done
+        time.sleep(0.1)
+
+    rq.stop()
+    stats = rq.stats()
+    print(f"{stats['completed']} completed, {stats['dropped'] + stats['rejected']} dropped/rejected, "
+          f"utilisation {stats['utilisation']:.0%}, {stats['gflops_total']:.1f} GFLOP/s")
+    for name in ("enqueue_wait", "compute", "end_to_end"):
+        timing = stats[name]
+        if timing["count"]:
+            print(f"{name:>13}: p50 {timing['p50']:.3f} s, p95 {timing['p95']:.3f} s, max {timing['max']:.3f} s")
@@ -0,0 +1,163 @@
+"""Tiled matrix multiplication for np.memmap operands larger than RAM.
+
+The product is split into square output tiles. Each tile task reads one
+block of each operand at a time, accumulates the tile in memory and writes it
+back to the memory-mapped result. Blocks are moved with positioned reads and
+writes on the backing files rather than through a mapping: touching a mapping
+makes the kernel map whole neighbourhoods of pages into the task's resident
+set, while a pread lands in the block buffer only. A task therefore holds
+about four tiles of memory whatever the size of the matrices.
+
+Tasks take MemmapDescriptor tuples instead of arrays, so they can run in a
+thread pool or a process pool alike.
+"""
+import math
+import mmap
+import os
+import resource
+import sys
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import numpy as np
+
+MemmapDescriptor = namedtuple("MemmapDescriptor", ["filename", "offset", "shape", "dtype"])
+
+# Default bytes per operand block; a tile task peaks at about four of these.
+TILE_BYTES = 32 << 20
+
+
+def is_memmap(array):
+    return isinstance(array, np.memmap)
+
+
+def describe_memmap(array):
+    """Descriptor for a whole, C-contiguous np.memmap (not a slice of one)."""
+    if not isinstance(array.base, mmap.mmap) or not array.flags.c_contiguous:
+        raise ValueError("Out-of-core operands must be whole C-contiguous np.memmap arrays")
+    return MemmapDescriptor(os.fspath(array.filename), array.offset, array.shape, array.dtype.str)
+
+
+def create_memmap(shape, dtype=np.float64, path=None, directory=None):
+    """Create a zero-filled np.memmap file; a temporary file in directory if path is None.
+
+    The caller owns the file and is responsible for deleting it.
+    """
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix=".dat", dir=directory)
+        os.close(fd)
+    return np.memmap(path, np.dtype(dtype), "w+", shape=tuple(shape))
+
+
+def spill(array, directory=None):
+    """Copy an in-memory operand to a temporary memmap file that worker processes can read."""
+    out = create_memmap(array.shape, array.dtype, directory=directory)
+    out[...] = array
+    out.flush()
+    return out
+
+
+def tile_size(dtype, tile_bytes=TILE_BYTES):
+    """Edge length of a square block of dtype that fits in tile_bytes."""
+    return max(1, math.isqrt(tile_bytes // np.dtype(dtype).itemsize))
+
+
+def tiles(shape, tile):
+    """(row, col) origins of the output tiles covering a matrix of this shape."""
+    return [(row, col) for row in range(0, shape[0], tile) for col in range(0, shape[1], tile)]
+
+
+def _row_spans(descriptor, rows, cols):
+    """(row index in block, file offset, byte count) for each row of a block."""
+    itemsize = np.dtype(descriptor.dtype).itemsize
+    row_bytes = descriptor.shape[1] * itemsize
+    start = descriptor.offset + cols.start * itemsize
+    if cols.start == 0 and cols.stop == descriptor.shape[1]:
+        # Whole rows are contiguous in the file: one transfer for the block.
+        return [(slice(None), start + rows.start * row_bytes, (rows.stop - rows.start) * row_bytes)]
+    width = (cols.stop - cols.start) * itemsize
+    return [(i, start + row * row_bytes, width) for i, row in enumerate(range(rows.start, rows.stop))]
+
+
+def _read_block(operand, rows, cols):
+    if not isinstance(operand, MemmapDescriptor):
+        return np.asarray(operand[rows, cols])
+    block = np.empty((rows.stop - rows.start, cols.stop - cols.start), np.dtype(operand.dtype))
+    with open(operand.filename, "rb", buffering=0) as f:
+        for index, offset, nbytes in _row_spans(operand, rows, cols):
+            if os.preadv(f.fileno(), [block[index]], offset) != nbytes:
+                raise EOFError(f"{operand.filename} is shorter than its descriptor")
+    return block
+
+
+def _write_block(descriptor, rows, cols, block):
+    with open(descriptor.filename, "r+b", buffering=0) as f:
+        for index, offset, _ in _row_spans(descriptor, rows, cols):
+            os.pwrite(f.fileno(), block[index], offset)
+
+
+def multiply_tile(a, b, out, row, col, tile):
+    """Compute out[row:row+tile, col:col+tile] of a @ b block by block.
+
+    a and b are MemmapDescriptors or, within a single process, arrays; out is
+    always a MemmapDescriptor. Returns the peak resident set size of the
+    calling process in bytes.
+    """
+    rows = slice(row, min(row + tile, a.shape[0]))
+    cols = slice(col, min(col + tile, b.shape[1]))
+    acc = np.zeros((rows.stop - rows.start, cols.stop - cols.start), np.dtype(out.dtype))
+    for k in range(0, a.shape[1], tile):
+        inner = slice(k, min(k + tile, a.shape[1]))
+        acc += _read_block(a, rows, inner) @ _read_block(b, inner, cols)
+    _write_block(out, rows, cols, acc)
+    return peak_rss()
+
+
+def peak_rss():
+    """Peak resident set size of the current process, in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def tiled_matmul(executor, matrix1, matrix2, out=None, tile_bytes=TILE_BYTES, directory=None):
+    """matrix1 @ matrix2 for 2D operands, computed tile by tile on executor.
+
+    Memory-mapped operands reach the tasks as descriptors. Other operands are
+    used directly, or spilled to a temporary file in directory when executor
+    is a process pool. The product is written to out, an np.memmap, or to a
+    new temporary memmap in directory. Returns (product, peak RSS in bytes of
+    the busiest tile task's process).
+    """
+    if matrix1.ndim != 2 or matrix2.ndim != 2:
+        raise ValueError("Out-of-core matmul needs 2D operands")
+    if matrix1.shape[1] != matrix2.shape[0]:
+        raise ValueError(f"matmul: mismatch in core dimension ({matrix1.shape} @ {matrix2.shape})")
+    shape = (matrix1.shape[0], matrix2.shape[1])
+    dtype = np.result_type(matrix1, matrix2)
+    if out is None:
+        out = create_memmap(shape, dtype, directory=directory)
+    elif not is_memmap(out) or out.shape != shape:
+        raise ValueError(f"out must be an np.memmap of shape {shape}")
+    out.flush()
+
+    spilled = []
+    operands = []
+    for array in (matrix1, matrix2):
+        if not is_memmap(array) and isinstance(executor, ProcessPoolExecutor):
+            array = spill(array, directory)
+            spilled.append(array.filename)
+        operands.append(describe_memmap(array) if is_memmap(array) else array)
+
+    tile = tile_size(dtype, tile_bytes)
+    futures = [executor.submit(multiply_tile, *operands, describe_memmap(out), row, col, tile)
+               for row, col in tiles(shape, tile)]
+    try:
+        return out, max((future.result() for future in futures), default=0)
+    finally:
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        for filename in spilled:
+            os.unlink(filename)
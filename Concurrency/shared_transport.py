@@ -0,0 +1,189 @@
+"""Shared-memory transport for handing matrices to worker processes.
+
+Operands and results live in multiprocessing.shared_memory segments; only
+small MatrixDescriptor tuples (segment name, shape, dtype) cross the process
+boundary. Segments come from a SharedBufferPool and are reused between
+requests instead of being created and unlinked every time.
+"""
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+MatrixDescriptor = namedtuple("MatrixDescriptor", ["name", "shape", "dtype"])
+
+# Segments are rounded up to a power of two (at least this many bytes) so
+# requests of similar size can reuse each other's segments.
+MIN_SEGMENT_BYTES = 1 << 12
+
+
+def _segment_size(nbytes):
+    return max(MIN_SEGMENT_BYTES, 1 << (max(1, nbytes) - 1).bit_length())
+
+
+class SharedBufferPool:
+    """Pool of reusable SharedMemory segments, bucketed by power-of-two size.
+
+    Idle segments beyond max_idle_bytes are unlinked on release, so the pool
+    never pins more shared memory than the working set plus that slack.
+    """
+
+    def __init__(self, max_idle_bytes=1 << 30):
+        self.max_idle_bytes = max_idle_bytes
+        self._free = {}
+        self._idle_bytes = 0
+        self._segments = {}
+        self._lock = threading.Lock()
+        self.segments_created = 0
+        self.reuses = 0
+
+    def acquire(self, nbytes):
+        size = _segment_size(nbytes)
+        with self._lock:
+            free = self._free.get(size)
+            if free:
+                self.reuses += 1
+                self._idle_bytes -= size
+                return free.pop()
+            segment = shared_memory.SharedMemory(create=True, size=size)
+            self._segments[segment.name] = segment
+            self.segments_created += 1
+            return segment
+
+    def release(self, segment):
+        with self._lock:
+            if segment.name not in self._segments:
+                return
+            if self._idle_bytes + segment.size > self.max_idle_bytes:
+                del self._segments[segment.name]
+                self._destroy(segment)
+                return
+            self._free.setdefault(segment.size, []).append(segment)
+            self._idle_bytes += segment.size
+
+    def close(self):
+        """Unlink every segment the pool created, idle or not."""
+        with self._lock:
+            segments, self._segments, self._free = self._segments, {}, {}
+            self._idle_bytes = 0
+        for segment in segments.values():
+            self._destroy(segment)
+
+    @staticmethod
+    def _destroy(segment):
+        try:
+            segment.close()
+        except BufferError:
+            pass  # An array still views the buffer; the mapping goes away with it.
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedMemoryTransport:
+    """Moves operands into shared memory and wraps results as shared-memory arrays.
+
+    Arrays created with allocate() already live in a pooled segment, so
+    submitting them copies nothing. Other operands are copied once into a
+    pooled segment. Result arrays view their segment directly and return it
+    to the pool when they are garbage collected. bytes_copied counts every
+    byte the transport itself copies.
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool or SharedBufferPool()
+        self._owned = {}
+        self._lock = threading.Lock()
+        self.bytes_copied = 0
+
+    def allocate(self, shape, dtype=np.float64):
+        """Return an uninitialised array backed by a pooled shared memory segment."""
+        array, _ = self._shared_array(shape, np.dtype(dtype))
+        return array
+
+    def _shared_array(self, shape, dtype):
+        shape = tuple(shape)
+        segment = self.pool.acquire(int(np.prod(shape)) * dtype.itemsize)
+        array = np.ndarray(shape, dtype, buffer=segment.buf)
+        self._owned[id(array)] = segment
+        weakref.finalize(array, self._forget, id(array), segment)
+        return array, MatrixDescriptor(segment.name, shape, dtype.str)
+
+    def _forget(self, array_id, segment):
+        self._owned.pop(array_id, None)
+        self.pool.release(segment)
+
+    def describe(self, array):
+        """Return (descriptor, segment lease or None) for an operand.
+
+        The lease must be handed back to release() once the worker is done.
+        """
+        segment = self._owned.get(id(array))
+        if segment is not None:
+            return MatrixDescriptor(segment.name, array.shape, array.dtype.str), None
+        array = np.asarray(array)
+        segment = self.pool.acquire(array.nbytes)
+        np.ndarray(array.shape, array.dtype, buffer=segment.buf)[...] = array
+        with self._lock:
+            self.bytes_copied += array.nbytes
+        return MatrixDescriptor(segment.name, array.shape, array.dtype.str), segment
+
+    def release(self, lease):
+        if lease is not None:
+            self.pool.release(lease)
+
+    def run(self, executor, function, matrix1, matrix2):
+        """Run function(desc1, desc2, out_desc) on executor and return the shared result array."""
+        matrix1, matrix2 = (m if isinstance(m, np.ndarray) else np.asarray(m) for m in (matrix1, matrix2))
+        shape = matmul_shape(matrix1.shape, matrix2.shape)
+        result, out = self._shared_array(shape, np.result_type(matrix1, matrix2))
+        desc1, lease1 = self.describe(matrix1)
+        desc2, lease2 = self.describe(matrix2)
+        try:
+            executor.submit(function, desc1, desc2, out).result()
+        finally:
+            self.release(lease1)
+            self.release(lease2)
+        return result
+
+    def close(self):
+        self.pool.close()
+
+
+def matmul_shape(shape1, shape2):
+    """Result shape of np.matmul for operands with at least two dimensions."""
+    if len(shape1) < 2 or len(shape2) < 2:
+        raise ValueError("Shared memory transport needs operands with at least 2 dimensions")
+    if shape1[-1] != shape2[-2]:
+        raise ValueError(f"matmul: mismatch in core dimension ({shape1} @ {shape2})")
+    return np.broadcast_shapes(shape1[:-2], shape2[:-2]) + (shape1[-2], shape2[-1])
+
+
+# Worker-process side. Attached segments are cached because pooled segments
+# are reused across requests; the cache is bounded so segments the parent has
+# since unlinked do not stay mapped forever.
+_ATTACH_CACHE_SIZE = 64
+_attached = OrderedDict()
+
+
+def attach(descriptor):
+    """Map a descriptor to an ndarray inside the current (worker) process."""
+    segment = _attached.pop(descriptor.name, None)
+    if segment is None:
+        segment = shared_memory.SharedMemory(name=descriptor.name)
+        while len(_attached) >= _ATTACH_CACHE_SIZE:
+            _, stale = _attached.popitem(last=False)
+            try:
+                stale.close()
+            except BufferError:
+                pass
+    _attached[descriptor.name] = segment
+    return np.ndarray(descriptor.shape, np.dtype(descriptor.dtype), buffer=segment.buf)
+
+
+def multiply_shared(desc1, desc2, out):
+    """np.matmul between two shared operands, written straight into the shared result."""
+    np.matmul(attach(desc1), attach(desc2), out=attach(out))
@@ -0,0 +1,301 @@
+import asyncio
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from concurrency import JobQueue, Request, RequestDropped, RequestQueue, RequestRejected
+
+
+@pytest.mark.parametrize("use_multiprocessing", [False, True])
+def test_submit_returns_product(use_multiprocessing):
+    rq = RequestQueue(maxsize=8, use_multiprocessing=use_multiprocessing, num_workers=2)
+    rq.start()
+    pairs = [(np.random.rand(4, 5), np.random.rand(5, 3)) for _ in range(6)]
+    futures = [rq.submit(a, b) for a, b in pairs]
+    for future, (a, b) in zip(futures, pairs):
+        np.testing.assert_allclose(future.result(timeout=30), a @ b)
+    rq.stop()
+
+
+def test_stop_drains_queued_requests():
+    rq = RequestQueue(maxsize=16, num_workers=1)
+    rq.start()
+    futures = [rq.submit(np.eye(3), np.full((3, 3), i)) for i in range(10)]
+    rq.stop()
+    assert all(future.done() and not future.cancelled() for future in futures)
+
+
+class BlockingOperand:
+    """Operand whose matmul waits for an event, to keep a worker busy."""
+
+    def __init__(self, event):
+        self.event = event
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        self.event.wait(5)
+        return np.eye(2)
+
+
+def test_stop_without_drain_cancels_pending():
+    rq = RequestQueue(maxsize=16, num_workers=1)
+    gate = threading.Event()
+    rq.start()
+    running = rq.submit(BlockingOperand(gate), np.eye(2))
+    while not running.running():
+        time.sleep(0.01)
+    pending = [rq.submit(np.eye(2), np.eye(2)) for _ in range(3)]
+    threading.Timer(0.2, gate.set).start()
+    rq.stop(drain=False)
+    assert running.result() is not None
+    assert all(future.cancelled() for future in pending)
+
+
+def test_errors_are_set_on_the_future():
+    rq = RequestQueue(num_workers=1)
+    rq.start()
+    future = rq.submit(np.ones((2, 3)), np.ones((2, 3)))
+    with pytest.raises(ValueError):
+        future.result(timeout=5)
+    rq.stop()
+    with pytest.raises(RuntimeError):
+        rq.submit(np.eye(2), np.eye(2))
+
+
+def test_shared_memory_transport_reuses_segments_and_skips_copies():
+    rq = RequestQueue(maxsize=4, use_multiprocessing=True, num_workers=1)
+    rq.start()
+    a = rq.allocate((8, 8))
+    b = rq.allocate((8, 8))
+    a[...] = np.random.rand(8, 8)
+    b[...] = np.random.rand(8, 8)
+    for _ in range(3):
+        result = rq.submit(a, b).result(timeout=30)
+        np.testing.assert_allclose(result, a @ b)
+        del result
+    assert rq.transport.bytes_copied == 0
+    assert rq.transport.pool.reuses >= 2
+
+    c = np.random.rand(8, 8)
+    np.testing.assert_allclose(rq.submit(c, b).result(timeout=30), c @ b)
+    assert rq.transport.bytes_copied == c.nbytes
+    rq.stop()
+
+
+def test_pickle_transport():
+    rq = RequestQueue(use_multiprocessing=True, num_workers=1, transport="pickle")
+    rq.start()
+    assert rq.transport is None
+    np.testing.assert_allclose(rq.submit(np.eye(3), np.ones((3, 2))).result(timeout=30), np.ones((3, 2)))
+    rq.stop()
+
+
+@pytest.mark.parametrize("use_multiprocessing", [False, True])
+def test_same_shape_requests_are_batched(use_multiprocessing):
+    rq = RequestQueue(maxsize=32, use_multiprocessing=use_multiprocessing, num_workers=1,
+                      max_batch_size=8, max_batch_wait=0.2)
+    pairs = [(np.random.rand(3, 4), np.random.rand(4, 2)) for _ in range(8)]
+    odd_one = (np.random.rand(5, 5), np.random.rand(5, 5))
+    rq.start()
+    futures = [rq.submit(a, b) for a, b in pairs[:4]]
+    odd_future = rq.submit(*odd_one)
+    futures += [rq.submit(a, b) for a, b in pairs[4:]]
+    for future, (a, b) in zip(futures, pairs):
+        np.testing.assert_allclose(future.result(timeout=30), a @ b)
+    np.testing.assert_allclose(odd_future.result(timeout=30), odd_one[0] @ odd_one[1])
+    rq.stop()
+
+    metrics = rq.batch_metrics.snapshot()
+    assert metrics["requests"] == 9
+    assert metrics["batches"] < 9
+    assert max(metrics["recent_size_histogram"]) > 1
+
+
+def test_backpressure_policies():
+    gate = threading.Event()
+    rq = RequestQueue(maxsize=2, num_workers=1, policy="reject")
+    rq.start()
+    running = rq.submit(BlockingOperand(gate), np.eye(2))
+    while not running.running():
+        time.sleep(0.01)
+    queued = [rq.submit(np.eye(2), np.eye(2)) for _ in range(2)]
+    with pytest.raises(RequestRejected):
+        rq.submit(np.eye(2), np.eye(2))
+    assert rq.queue.rejected == 1
+    gate.set()
+    rq.stop()
+    assert all(future.result() is not None for future in queued)
+
+    gate = threading.Event()
+    rq = RequestQueue(maxsize=2, num_workers=1, policy="drop_oldest")
+    rq.start()
+    running = rq.submit(BlockingOperand(gate), np.eye(2))
+    while not running.running():
+        time.sleep(0.01)
+    futures = [rq.submit(np.eye(2), np.full((2, 2), i)) for i in range(4)]
+    gate.set()
+    rq.stop()
+    for future in futures[:2]:
+        with pytest.raises(RequestDropped):
+            future.result()
+    np.testing.assert_allclose(futures[3].result(), np.full((2, 2), 3))
+    assert rq.queue.dropped == 2
+
+
+def test_byte_budget_and_priority_lanes():
+    gate = threading.Event()
+    big = np.ones((64, 64))
+    rq = RequestQueue(maxsize=100, num_workers=1, policy="reject",
+                      max_queued_bytes=3 * big.nbytes, small_request_bytes=1024)
+    rq.start()
+    running = rq.submit(BlockingOperand(gate), np.eye(2))
+    while not running.running():
+        time.sleep(0.01)
+    order = []
+    large = rq.submit(big, big)
+    large.add_done_callback(lambda f: order.append("large"))
+    small = rq.submit(np.eye(2), np.eye(2))
+    small.add_done_callback(lambda f: order.append("small"))
+    with pytest.raises(RequestRejected):
+        rq.submit(big, big)  # two more operands would exceed the byte budget
+    assert not rq.wait_for_capacity(2 * big.nbytes, timeout=0.05)
+    gate.set()
+    rq.stop()
+    assert order == ["small", "large"]
+
+
+@pytest.mark.parametrize("use_multiprocessing", [False, True])
+def test_memmap_operands_run_out_of_core(tmp_path, use_multiprocessing):
+    a = np.memmap(tmp_path / "a.dat", np.float64, "w+", shape=(20, 30))
+    b = np.memmap(tmp_path / "b.dat", np.float64, "w+", shape=(30, 17))
+    a[...] = np.random.rand(20, 30)
+    b[...] = np.random.rand(30, 17)
+    rq = RequestQueue(use_multiprocessing=use_multiprocessing, num_workers=2,
+                      tile_bytes=8 * 8 * 8, spill_dir=tmp_path)
+    rq.start()
+    result = rq.submit(a, b).result(timeout=30)
+    mixed = rq.submit(np.asarray(a) * 2, b).result(timeout=30)
+    rq.stop()
+    assert isinstance(result, np.memmap)
+    np.testing.assert_allclose(result, np.asarray(a) @ np.asarray(b))
+    np.testing.assert_allclose(mixed, 2 * (np.asarray(a) @ np.asarray(b)))
+    assert rq.peak_tile_rss > 0
+    assert len(list(tmp_path.iterdir())) == 4  # operands plus the two results; spills are removed
+
+
+def test_stats_snapshot_and_export(tmp_path):
+    path = tmp_path / "stats.jsonl"
+    rq = RequestQueue(maxsize=1, num_workers=1, policy="reject", stats_path=path, stats_interval=0.05)
+    gate = threading.Event()
+    rq.start()
+    running = rq.submit(BlockingOperand(gate), np.eye(2))
+    while not running.running():
+        time.sleep(0.01)
+    queued = rq.submit(np.ones((4, 5)), np.ones((5, 3)))
+    with pytest.raises(RequestRejected):
+        rq.submit(np.eye(2), np.eye(2))
+    time.sleep(0.15)
+    gate.set()
+    queued.result(timeout=5)
+    rq.stop()
+
+    stats = rq.stats()
+    assert stats["completed"] == 2 and stats["rejected"] == 1
+    assert stats["end_to_end"]["count"] == 2
+    assert stats["enqueue_wait"]["max"] >= 0.1  # the second request waited behind the gate
+    assert stats["gflops_per_job"]["count"] == 1  # the BlockingOperand job has no known FLOP count
+    assert 0 < stats["utilisation"] <= 1
+    assert stats["queue_depth"]["max"] == 1
+    lines = path.read_text().splitlines()
+    assert len(lines) >= 2 and json.loads(lines[-1])["completed"] == 2
+
+
+def test_submit_async_awaits_results():
+    rq = RequestQueue(maxsize=4, num_workers=2)
+    rq.start()
+    pairs = [(np.random.rand(3, 4), np.random.rand(4, 2)) for _ in range(50)]
+
+    async def main():
+        # More in-flight requests than the queue holds: the blocked ones must not block the loop.
+        return await asyncio.gather(*(rq.submit_async(a, b) for a, b in pairs))
+
+    results = asyncio.run(main())
+    rq.stop()
+    for result, (a, b) in zip(results, pairs):
+        np.testing.assert_allclose(result, a @ b)
+
+
+def test_cancelling_submit_async_removes_queued_request():
+    rq = RequestQueue(maxsize=4, num_workers=1)
+    gate = threading.Event()
+    rq.start()
+    running = rq.submit(BlockingOperand(gate), np.eye(2))
+    while not running.running():
+        time.sleep(0.01)
+
+    async def main():
+        task = asyncio.create_task(rq.submit_async(np.eye(2), np.eye(2)))
+        await asyncio.sleep(0.05)
+        assert len(rq.queue) == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert len(rq.queue) == 0
+
+    asyncio.run(main())
+    gate.set()
+    rq.stop()
+    assert rq.stats()["cancelled"] == 1
+
+
+def test_cancelling_submit_async_blocked_on_full_queue():
+    rq = RequestQueue(maxsize=1, num_workers=1)
+    gate = threading.Event()
+    rq.start()
+    running = rq.submit(BlockingOperand(gate), np.eye(2))
+    while not running.running():
+        time.sleep(0.01)
+    queued = rq.submit(np.eye(2), np.eye(2))
+
+    async def main():
+        task = asyncio.create_task(rq.submit_async(np.eye(3), np.eye(3)))
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        gate.set()
+        # Room frees up once the worker moves on; the cancelled request must not take it.
+        await asyncio.wrap_future(queued)
+        return await asyncio.wait_for(rq.submit_async(np.eye(2), np.full((2, 2), 2.0)), 5)
+
+    assert np.array_equal(asyncio.run(main()), np.full((2, 2), 2.0))
+    rq.stop()
+    assert rq.stats()["completed"] == 3
+    assert len(rq.queue) == 0
+
+
+def test_submit_async_times_out_on_full_queue():
+    rq = RequestQueue(maxsize=1, num_workers=1)
+    gate = threading.Event()
+    rq.start()
+    running = rq.submit(BlockingOperand(gate), np.eye(2))
+    while not running.running():
+        time.sleep(0.01)
+    rq.submit(np.eye(2), np.eye(2))
+    with pytest.raises(RequestRejected):
+        asyncio.run(rq.submit_async(np.eye(2), np.eye(2), timeout=0.05))
+    gate.set()
+    rq.stop()
+    assert rq.stats()["rejected"] == 1
+
+
+def test_closed_job_queue_refuses_requests():
+    queue = JobQueue(maxsize=1)
+    queue.close()
+    with pytest.raises(RuntimeError, match="JobQueue is closed"):
+        queue.put(Request(np.eye(2), np.eye(2), 0))
+    with pytest.raises(RuntimeError, match="JobQueue is closed"):
+        asyncio.run(queue.put_async(Request(np.eye(2), np.eye(2), 0)))
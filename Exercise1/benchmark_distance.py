@@ -0,0 +1,136 @@
+"""Benchmarks for the coordinate matching engines in distance.py.
+
+Usage:
+    python benchmark_distance.py closest [--sizes 10000 100000 1000000]
+    python benchmark_distance.py kernel [--points 100000]
+    python benchmark_distance.py workers [--points 1000000] [--workers 1 2 4 8 16 32]
+
+Brute force at large sizes takes hours, so it is timed on a sample of query
+points and extrapolated linearly to the full query set (marked with "~").
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from distance import (
+    find_closest_points,
+    haversine_distance,
+    haversine_many_to_many,
+    haversine_one_to_many,
+    haversine_pairwise,
+    prepare_coordinates,
+)
+
+
+def random_points(n, seed):
+    rng = random.Random(seed)
+    return [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(n)]
+
+
+def time_call(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def bench_closest(sizes, brute_budget):
+    print(f"{'points':>10} {'index (s)':>12} {'brute (s)':>14} {'speedup':>10}")
+    for n in sizes:
+        array1 = random_points(n, seed=1)
+        array2 = random_points(n, seed=2)
+        index_time, matches = time_call(find_closest_points, array1, array2)
+
+        # Scale the sample so the brute-force run costs roughly brute_budget seconds.
+        sample = array1[:max(1, min(n, int(brute_budget * 1e6 / n)))]
+        brute_time, brute_matches = time_call(find_closest_points, sample, array2, method="brute")
+        if brute_matches != matches[:len(sample)]:
+            raise AssertionError(f"index and brute-force results differ at n={n}")
+        estimated = len(sample) < n
+        brute_time *= n / len(sample)
+
+        brute_label = f"{'~' if estimated else ''}{brute_time:.2f}"
+        print(f"{n:>10} {index_time:>12.2f} {brute_label:>14} {brute_time / index_time:>9.0f}x")
+
+
+def bench_kernel(n):
+    """Pairs/second of the scalar haversine_distance vs the vectorized kernels."""
+    points1 = random_points(n, seed=1)
+    points2 = random_points(n, seed=2)
+    scalar_time, scalar = time_call(
+        lambda: [haversine_distance(*p1, *p2) for p1, p2 in zip(points1, points2)]
+    )
+    scalar_rate = n / scalar_time
+    prepared1 = prepare_coordinates(points1)
+    prepared2 = prepare_coordinates(points2)
+
+    rows = max(1, n // 100)
+    cases = [
+        ("pairwise", n, lambda: haversine_pairwise(prepared1, prepared2)),
+        ("one-to-many", n, lambda: haversine_one_to_many(points1[0], prepared2)),
+        (f"many-to-many ({rows}x{n})", rows * n,
+         lambda: haversine_many_to_many(_head(prepared1, rows), prepared2)),
+    ]
+
+    pairwise = haversine_pairwise(prepared1, prepared2)
+    max_error = float(np.max(np.abs(pairwise - np.asarray(scalar))))
+    print(f"scalar haversine_distance: {scalar_rate:,.0f} pairs/s")
+    print(f"max |vectorized - scalar| over {n} pairs: {max_error:.3e} km")
+    print(f"{'kernel':>28} {'pairs/s':>16} {'speedup':>10}")
+    for name, pairs, func in cases:
+        elapsed, _ = time_call(func)
+        rate = pairs / elapsed
+        print(f"{name:>28} {rate:>16,.0f} {rate / scalar_rate:>9.0f}x")
+
+
+def bench_workers(n, worker_counts, method):
+    """Wall time and parallel efficiency of find_closest_points(workers=...)."""
+    array1 = random_points(n, seed=1)
+    array2 = random_points(n, seed=2)
+    print(f"{'workers':>8} {'seconds':>10} {'speedup':>10} {'efficiency':>11}")
+    baseline = None
+    expected = None
+    for workers in worker_counts:
+        elapsed, matches = time_call(find_closest_points, array1, array2, method=method, workers=workers)
+        if expected is None:
+            expected = matches
+        elif matches != expected:
+            raise AssertionError(f"workers={workers} changed the result")
+        baseline = baseline or elapsed * worker_counts[0]
+        speedup = baseline / elapsed
+        print(f"{workers:>8} {elapsed:>10.2f} {speedup:>9.2f}x {speedup / workers:>10.0%}")
+
+
+def _head(prepared, rows):
+    return type(prepared)(*(field[:rows] for field in prepared))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    closest = sub.add_parser("closest", help="KD-tree index vs brute-force find_closest_points")
+    closest.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    closest.add_argument("--brute-budget", type=float, default=5.0,
+                         help="approximate seconds to spend on each brute-force sample")
+
+    kernel = sub.add_parser("kernel", help="scalar vs vectorized haversine throughput")
+    kernel.add_argument("--points", type=int, default=100_000)
+
+    scaling = sub.add_parser("workers", help="multi-process scaling of find_closest_points")
+    scaling.add_argument("--points", type=int, default=1_000_000)
+    scaling.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    scaling.add_argument("--method", choices=["index", "brute"], default="index")
+
+    args = parser.parse_args()
+    if args.command == "closest":
+        bench_closest(args.sizes, args.brute_budget)
+    elif args.command == "kernel":
+        bench_kernel(args.points)
+    elif args.command == "workers":
+        bench_workers(args.points, args.workers, args.method)
+
+
+if __name__ == "__main__":
+    main()
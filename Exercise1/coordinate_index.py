@@ -0,0 +1,249 @@
+import heapq
+import json
+import math
+import struct
+
+import numpy as np
+
+LEAF_SIZE = 16
+# Slack in squared chord units (unit sphere). Points whose chord distance is
+# within floating-point error of the best one are all returned as candidates,
+# so the caller can settle ties with the exact haversine distance.
+CHORD_TOLERANCE = 1e-12
+
+_MAGIC = b"EC530IDX"
+# Byte alignment of each array in a saved index file.
+_ALIGNMENT = 64
+
+
+def to_unit_vectors(lats, lons):
+    """Convert arrays of lat/lon degrees to 3D unit vectors, shape (n, 3)."""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def to_unit_vector(lat, lon):
+    """Scalar version of to_unit_vectors for a single query point."""
+    lat, lon = math.radians(lat), math.radians(lon)
+    cos_lat = math.cos(lat)
+    return cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat)
+
+
+class CoordinateIndex:
+    """Static KD-tree over the 3D unit vectors of a set of (lat, lon) points.
+
+    The straight-line (chord) distance between two unit vectors grows
+    monotonically with their great-circle distance, so the nearest point in 3D
+    is also the nearest point on the sphere. The tree is built once in
+    O(M log M) and each nearest-neighbour query visits O(log M) nodes.
+    """
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        self.coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        xyz = to_unit_vectors(self.coords[:, 0], self.coords[:, 1])
+        order = np.arange(len(self.coords), dtype=np.int64)
+
+        self._starts, self._ends, self._lefts, self._rights = [], [], [], []
+        # Bounding boxes are stored as one list per axis, which keeps
+        # from_arrays cheap and box-distance lookups free of tuple unpacking.
+        self._los, self._his = ([], [], []), ([], [], [])
+        if len(self.coords):
+            self._build(xyz, order, 0, len(self.coords), leaf_size)
+
+        self.order = order
+        self.xyz = np.ascontiguousarray(xyz[order])
+
+    def to_arrays(self):
+        """Return the index as a dict of NumPy arrays (see from_arrays)."""
+        return {
+            "coords": self.coords,
+            "order": self.order,
+            "xyz": self.xyz,
+            "starts": np.array(self._starts, dtype=np.int64),
+            "ends": np.array(self._ends, dtype=np.int64),
+            "lefts": np.array(self._lefts, dtype=np.int64),
+            "rights": np.array(self._rights, dtype=np.int64),
+            "los": np.array(self._los, dtype=np.float64).T.reshape(-1, 3),
+            "his": np.array(self._his, dtype=np.float64).T.reshape(-1, 3),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Rebuild an index from to_arrays() output without re-running the build.
+
+        The point arrays are used as-is, so they may live in shared or
+        memory-mapped buffers.
+        """
+        index = cls.__new__(cls)
+        index.coords = arrays["coords"]
+        index.order = arrays["order"]
+        index.xyz = arrays["xyz"]
+        index._starts = arrays["starts"].tolist()
+        index._ends = arrays["ends"].tolist()
+        index._lefts = arrays["lefts"].tolist()
+        index._rights = arrays["rights"].tolist()
+        index._los = tuple(column.tolist() for column in arrays["los"].T)
+        index._his = tuple(column.tolist() for column in arrays["his"].T)
+        return index
+
+    def __len__(self):
+        return len(self.order)
+
+    def _build(self, xyz, order, start, end, leaf_size):
+        node = len(self._starts)
+        seg = xyz[order[start:end]]
+        lo, hi = seg.min(axis=0), seg.max(axis=0)
+        self._starts.append(start)
+        self._ends.append(end)
+        self._lefts.append(-1)
+        self._rights.append(-1)
+        for axis, value in enumerate(lo.tolist()):
+            self._los[axis].append(value)
+        for axis, value in enumerate(hi.tolist()):
+            self._his[axis].append(value)
+        if end - start <= leaf_size:
+            return node
+
+        dim = int(np.argmax(hi - lo))
+        mid = (start + end) // 2
+        part = np.argpartition(seg[:, dim], mid - start)
+        order[start:end] = order[start:end][part]
+        self._lefts[node] = self._build(xyz, order, start, mid, leaf_size)
+        self._rights[node] = self._build(xyz, order, mid, end, leaf_size)
+        return node
+
+    def _box_distance2(self, node, q):
+        """Squared distance from q to the bounding box of a node."""
+        d2 = 0.0
+        for v, los, his in zip(q, self._los, self._his):
+            lo = los[node]
+            if v < lo:
+                d2 += (lo - v) ** 2
+            elif v > his[node]:
+                d2 += (v - his[node]) ** 2
+        return d2
+
+    def point(self, i):
+        """The (lat, lon) tuple stored at original position i."""
+        lat, lon = self.coords[i].tolist()
+        return lat, lon
+
+    def _search(self, lat, lon, k=None, max_d2=math.inf):
+        """Return (original indices, chord^2) of the k nearest points within max_d2.
+
+        With k=None every point within max_d2 is returned. Points tied with the
+        k-th nearest within CHORD_TOLERANCE are included, so more than k
+        indices can come back. Indices are in ascending order.
+        """
+        q = to_unit_vector(lat, lon)
+        qa = np.array(q)
+        kth = []  # max-heap (negated) of the k smallest squared chords seen so far
+        bound = max_d2
+        leaves = []
+        stack = [(0, 0.0)] if len(self) else []
+        while stack:
+            node, box = stack.pop()
+            if box > bound + CHORD_TOLERANCE:
+                continue
+            left = self._lefts[node]
+            if left < 0:
+                start = self._starts[node]
+                diff = self.xyz[start:self._ends[node]] - qa
+                d2 = np.einsum("ij,ij->i", diff, diff)
+                leaves.append((start, d2))
+                if k is not None:
+                    smallest = np.partition(d2, k - 1)[:k] if len(d2) > k else d2
+                    for value in smallest.tolist():
+                        if len(kth) < k:
+                            heapq.heappush(kth, -value)
+                        elif value < -kth[0]:
+                            heapq.heapreplace(kth, -value)
+                    if len(kth) == k:
+                        bound = min(max_d2, -kth[0])
+                continue
+            right = self._rights[node]
+            d_left = self._box_distance2(left, q)
+            d_right = self._box_distance2(right, q)
+            # Push the farther child first so the nearer one is searched first.
+            if d_left <= d_right:
+                stack.append((right, d_right))
+                stack.append((left, d_left))
+            else:
+                stack.append((left, d_left))
+                stack.append((right, d_right))
+
+        limit = bound + CHORD_TOLERANCE
+        indices, chords = [np.empty(0, dtype=np.int64)], [np.empty(0)]
+        for start, d2 in leaves:
+            keep = np.flatnonzero(d2 <= limit)
+            indices.append(self.order[start + keep])
+            chords.append(d2[keep])
+        indices, chords = np.concatenate(indices), np.concatenate(chords)
+        ascending = np.argsort(indices)
+        return indices[ascending], chords[ascending]
+
+    def nearest_candidates(self, lat, lon):
+        """Return original indices of the point(s) closest to (lat, lon).
+
+        More than one index is returned only when several points are tied
+        within floating-point error; indices are in ascending order.
+        """
+        if not len(self):
+            raise ValueError("Cannot query an empty coordinate index")
+        return self._search(lat, lon, k=1)[0]
+
+    def k_nearest_candidates(self, lat, lon, k):
+        """Original indices that may be among the k points closest to (lat, lon)."""
+        return self._search(lat, lon, k=k)[0]
+
+    def radius_candidates(self, lat, lon, radius_km, earth_radius_km):
+        """Original indices of points that may lie within radius_km of (lat, lon)."""
+        angle = radius_km / earth_radius_km
+        max_d2 = math.inf if angle >= math.pi else (2 * math.sin(angle / 2)) ** 2
+        return self._search(lat, lon, max_d2=max_d2)[0]
+
+    def save(self, path):
+        """Write the index to a single binary file that load() memory-maps."""
+        arrays = self.to_arrays()
+        layout, offset = {}, 0
+        for name, array in arrays.items():
+            layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset += _aligned(array.nbytes)
+        header = json.dumps(layout).encode()
+        data_start = _aligned(len(_MAGIC) + 8 + len(header))
+        with open(path, "wb") as f:
+            f.write(_MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            for name, array in arrays.items():
+                f.seek(data_start + layout[name]["offset"])
+                np.ascontiguousarray(array).tofile(f)
+            f.truncate(data_start + offset)
+
+    @classmethod
+    def load(cls, path):
+        """Open an index written by save() without parsing or rebuilding anything.
+
+        The point arrays are views into a read-only memory map, so start-up
+        cost does not depend on the number of points and pages are shared
+        between processes that load the same file.
+        """
+        with open(path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"Not a coordinate index file: {path}")
+            (header_size,) = struct.unpack("<Q", f.read(8))
+            layout = json.loads(f.read(header_size))
+        data_start = _aligned(len(_MAGIC) + 8 + header_size)
+        mapped = np.memmap(path, dtype=np.uint8, mode="r")
+        arrays = {
+            name: np.ndarray(tuple(spec["shape"]), np.dtype(spec["dtype"]),
+                             buffer=mapped, offset=data_start + spec["offset"])
+            for name, spec in layout.items()
+        }
+        return cls.from_arrays(arrays)
+
+
+def _aligned(nbytes):
+    return -(-nbytes // _ALIGNMENT) * _ALIGNMENT
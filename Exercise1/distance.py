@@ -1,21 +1,130 @@
 
 import math
 import csv
+import multiprocessing
+import os
 import re
+from collections import namedtuple
+from itertools import islice
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from coordinate_index import CoordinateIndex
+
+EARTH_RADIUS_KM = 6371.0
+# Upper bound on distance-matrix elements held in memory at once (~32 MB of float64).
+TILE_ELEMENTS = 1 << 22
+
+# Rows per block yielded by iter_coordinate_chunks.
+CSV_CHUNK_ROWS = 1 << 16
+
+_DMS_PATTERN = re.compile(r"(\d+)[°]?\s*(\d+)?['′]?\s*(\d+)?[\"″]?")
+_DMS_MARKERS = re.compile(r"[°'\"]")
+
+# Points on each side of a query's latitude used to seed the prefilter's distance bound.
+PREFILTER_SEED_POINTS = 8
+
+PreparedCoordinates = namedtuple(
+    "PreparedCoordinates",
+    ["lat", "lon", "cos_lat", "sin_half_lat", "cos_half_lat", "sin_half_lon", "cos_half_lon"],
+)
+# array2 sorted by latitude for method="prefilter"; order maps sorted -> original positions.
+LatitudeSortedCoordinates = namedtuple("LatitudeSortedCoordinates", ["prepared", "order"])
 
 
 def haversine_distance(lat1, lon1, lat2, lon2):
-    R = 6371.0  # Earth's radius in kilometers
+    R = EARTH_RADIUS_KM  # Earth's radius in kilometers
     lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
     dlat, dlon = lat2 - lat1, lon2 - lon1
     a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
     return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
 
+def prepare_coordinates(points):
+    """Convert (lat, lon) degree pairs to radians and cache the per-point trig terms.
+
+    Accepts anything np.asarray turns into shape (n, 2); already prepared
+    coordinates are returned unchanged so callers can prepare once and reuse.
+    """
+    if isinstance(points, PreparedCoordinates):
+        return points
+    coords = np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+    lat = np.ascontiguousarray(coords[:, 0])
+    lon = np.ascontiguousarray(coords[:, 1])
+    return PreparedCoordinates(
+        lat, lon, np.cos(lat),
+        np.sin(lat / 2), np.cos(lat / 2), np.sin(lon / 2), np.cos(lon / 2),
+    )
+
+
+def _select(prepared, index):
+    return PreparedCoordinates(*(field[index] for field in prepared))
+
+
+def _haversine_kernel(p1, p2):
+    """Broadcasting haversine between two PreparedCoordinates.
+
+    sin(dlat / 2) and sin(dlon / 2) are expanded with the angle-difference
+    identity over the cached half-angle terms, so the only trig function
+    evaluated per pair is the final arctan2.
+    """
+    sin_dlat = p2.sin_half_lat * p1.cos_half_lat - p2.cos_half_lat * p1.sin_half_lat
+    sin_dlon = p2.sin_half_lon * p1.cos_half_lon - p2.cos_half_lon * p1.sin_half_lon
+    a = p1.cos_lat * p2.cos_lat
+    a *= sin_dlon
+    a *= sin_dlon
+    a += sin_dlat * sin_dlat
+    np.minimum(a, 1.0, out=a)
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def haversine_one_to_many(point, points2):
+    """Distances in km from one (lat, lon) point to every point in points2."""
+    return _haversine_kernel(prepare_coordinates([point]), prepare_coordinates(points2))
+
+
+def iter_haversine_tiles(points1, points2, tile_elements=TILE_ELEMENTS):
+    """Yield (row_start, block) tiles of the points1 x points2 distance matrix.
+
+    Each block covers whole rows and holds at most tile_elements distances
+    (but always at least one row), so memory stays bounded for any input size.
+    """
+    p1 = prepare_coordinates(points1)
+    p2 = prepare_coordinates(points2)
+    rows = max(1, tile_elements // max(1, len(p2.lat)))
+    for start in range(0, len(p1.lat), rows):
+        yield start, _haversine_kernel(_select(p1, (slice(start, start + rows), None)), p2)
+
+
+def haversine_many_to_many(points1, points2, tile_elements=TILE_ELEMENTS):
+    """Full (len(points1), len(points2)) distance matrix in km, computed tile by tile."""
+    p1 = prepare_coordinates(points1)
+    p2 = prepare_coordinates(points2)
+    out = np.empty((len(p1.lat), len(p2.lat)))
+    for start, block in iter_haversine_tiles(p1, p2, tile_elements):
+        out[start:start + len(block)] = block
+    return out
+
+
+def haversine_pairwise(points1, points2, index1=None, index2=None):
+    """Distances in km between matched pairs of points.
+
+    Without indices, points1[i] is paired with points2[i]. With index arrays,
+    pair k is points1[index1[k]] with points2[index2[k]].
+    """
+    p1 = prepare_coordinates(points1)
+    p2 = prepare_coordinates(points2)
+    if index1 is not None:
+        p1 = _select(p1, np.asarray(index1))
+    if index2 is not None:
+        p2 = _select(p2, np.asarray(index2))
+    return _haversine_kernel(p1, p2)
+
+
 def dms_to_decimal(dms):
     """Convert DMS (degrees, minutes, seconds) to decimal degrees."""
-    pattern = r"(\d+)[°]?\s*(\d+)?['′]?\s*(\d+)?[\"″]?"
-    match = re.match(pattern, dms)
+    match = _DMS_PATTERN.match(dms)
     if match:
         degrees = int(match.group(1))
         minutes = int(match.group(2) or 0)
@@ -27,31 +136,394 @@ def dms_to_decimal(dms):
 def parse_coordinate(coord):
     """Parse a coordinate in either decimal or DMS format."""
     try:
-        if isinstance(coord, str) and ('°' in coord or '\'' in coord or '"' in coord):
+        if isinstance(coord, str) and _DMS_MARKERS.search(coord):
             return dms_to_decimal(coord)
         return float(coord)
     except ValueError as e:
         raise ValueError(f"Invalid coordinate input: {coord}") from e
 
 
-def find_closest_points(array1, array2):
-    return [
-        (point1, min(array2, key=lambda point2: haversine_distance(*point1, *point2)))
-        for point1 in array1
-    ]
+def find_closest_points(array1, array2, method="index", workers=1, stats=None):
+    """Pair every point in array1 with its closest point in array2.
 
+    method="index" builds a KD-tree over array2 once and answers each query in
+    O(log M); method="brute" compares every pair using the vectorized haversine
+    kernel, one memory-bounded tile of array1 at a time; method="prefilter"
+    sorts array2 by latitude and computes the exact haversine distance only
+    for points that a cheap lower bound cannot rule out. All three return the
+    same pairs, with ties going to the earliest point in array2.
 
-def load_coordinates_from_csv(file_path):
-    coordinates = []
+    Pass a PrefilterStats as stats to record, per query, how many exact
+    evaluations method="prefilter" performed and pruned.
+
+    workers > 1 (or None for one per CPU) splits array1 across a process pool.
+    The index and the query points are placed in shared memory once, so each
+    task only carries a (start, stop) range; output order is unchanged.
+    """
+    if method not in ("index", "brute", "prefilter"):
+        raise ValueError(f"Unknown method: {method}")
+    array1 = list(array1)
+    if isinstance(array2, CoordinateIndex):
+        index, lookup, size = array2, array2.point, len(array2)
+    else:
+        array2 = list(array2)
+        index, lookup, size = None, array2.__getitem__, len(array2)
+    if not array1:
+        return []
+    if not size:
+        raise ValueError("array2 must contain at least one point")
+
+    queries = np.asarray(array1, dtype=np.float64).reshape(-1, 2)
+    points2 = index.coords if index is not None else array2
+    if method == "index":
+        engine = index if index is not None else CoordinateIndex(array2)
+    elif method == "brute":
+        engine = prepare_coordinates(points2)
+    else:
+        engine = _sort_by_latitude(points2)
+    evaluated = np.zeros(len(queries), dtype=np.int64) if method == "prefilter" else None
+    workers = os.cpu_count() if workers is None else workers
+    if workers > 1 and len(queries) > 1:
+        closest = _closest_indices_parallel(engine, queries, workers, evaluated)
+    else:
+        closest = _closest_indices(engine, queries, evaluated)
+    if stats is not None and evaluated is not None:
+        stats.record(evaluated, size)
+    return [(point1, lookup(j)) for point1, j in zip(array1, closest.tolist())]
+
+
+def find_k_nearest_points(array1, array2, k):
+    """Pair every point in array1 with its k closest points in array2, nearest first.
+
+    array2 is a list of (lat, lon) points or a CoordinateIndex, e.g. one
+    opened with CoordinateIndex.load. Ties go to the earliest point in array2.
+    """
+    if k < 1:
+        raise ValueError("k must be at least 1")
+    index, lookup = _reference_index(array2)
+    matches = []
+    for point1 in array1:
+        found, _ = _sort_by_distance(index, point1, index.k_nearest_candidates(*point1, k))
+        matches.append((point1, [lookup(j) for j in found[:k].tolist()]))
+    return matches
+
+
+def find_points_within_radius(array1, array2, radius_km):
+    """Pair every point in array1 with all points of array2 within radius_km, nearest first.
+
+    array2 is a list of (lat, lon) points or a CoordinateIndex.
+    """
+    if radius_km < 0:
+        raise ValueError("radius_km must not be negative")
+    index, lookup = _reference_index(array2)
+    matches = []
+    for point1 in array1:
+        candidates = index.radius_candidates(*point1, radius_km, EARTH_RADIUS_KM)
+        found, distances = _sort_by_distance(index, point1, candidates)
+        matches.append((point1, [lookup(j) for j in found[distances <= radius_km].tolist()]))
+    return matches
+
+
+def build_index_from_csv(file_path, index_path, decimal_only=False, report=None):
+    """Load reference points from a CSV, build a CoordinateIndex and save it to index_path.
+
+    Later runs can skip both the CSV parse and the build with
+    CoordinateIndex.load(index_path).
+    """
+    chunks = list(iter_coordinate_chunks(file_path, decimal_only=decimal_only, report=report))
+    index = CoordinateIndex(np.concatenate(chunks) if chunks else [])
+    index.save(index_path)
+    return index
+
+
+def _reference_index(array2):
+    """Return (CoordinateIndex, position -> point lookup) for a list of points or an index."""
+    if isinstance(array2, CoordinateIndex):
+        return array2, array2.point
+    array2 = list(array2)
+    return CoordinateIndex(array2), array2.__getitem__
+
+
+def _sort_by_distance(index, point1, candidates):
+    """Order candidate positions by exact distance from point1, then by position."""
+    distances = haversine_one_to_many(point1, index.coords[candidates])
+    order = np.lexsort((candidates, distances))
+    return candidates[order], distances[order]
+
+
+def _closest_index(index, point1):
+    """Resolve the index's nearest candidates to a single array2 position."""
+    candidates = index.nearest_candidates(*point1)
+    if len(candidates) == 1:
+        return int(candidates[0])
+    return int(min(candidates, key=lambda i: haversine_distance(*point1, *index.coords[i])))
+
+
+class PrefilterStats:
+    """Per-query counts of exact haversine evaluations for method="prefilter".
+
+    evaluated[i] is how many exact distances query i computed and pruned[i]
+    how many of the brute-force evaluations the lower bounds avoided.
+    """
+
+    def __init__(self):
+        self.evaluated = []
+        self.pruned = []
+
+    def record(self, evaluated, candidates):
+        self.evaluated.extend(evaluated.tolist())
+        self.pruned.extend(np.maximum(candidates - evaluated, 0).tolist())
+
+    def summary(self):
+        queries = len(self.evaluated)
+        total = sum(self.evaluated) + sum(self.pruned)
+        pruned = sum(self.pruned) / total if total else 0.0
+        evaluated = sum(self.evaluated) / queries if queries else 0.0
+        return f"{queries} queries, {evaluated:.1f} exact evaluations per query, {pruned:.1%} pruned"
+
+
+def _sort_by_latitude(points2):
+    prepared = prepare_coordinates(points2)
+    order = np.argsort(prepared.lat, kind="stable")
+    return LatitudeSortedCoordinates(_select(prepared, order), order)
+
+
+def _closest_prefiltered(engine, point1):
+    """Closest array2 position to point1 and the number of exact distances computed.
+
+    A few points next to point1's latitude give an upper bound U on the
+    answer. Great-circle distance is at least R * |dlat|, so only the
+    latitude band within U / R (found by binary search) can hold the
+    closest point. Inside the band, hav(d) >= cos(lat1) * cos(lat2) * hav(dlon)
+    bounds |dlon|, and only points passing both tests get the exact haversine.
+    """
+    p2, order = engine
+    p1 = prepare_coordinates([point1])
+    lat1, lon1 = p1.lat[0], p1.lon[0]
+    pos = int(np.searchsorted(p2.lat, lat1))
+    seed = np.arange(max(0, pos - PREFILTER_SEED_POINTS), min(len(p2.lat), pos + PREFILTER_SEED_POINTS))
+    seed_distances = _haversine_kernel(p1, _select(p2, seed))
+    # Relative and absolute slack keep rounding from pruning the true answer.
+    bound = float(seed_distances.min()) * (1 + 1e-9) + 1e-9
+    angle = min(bound / EARTH_RADIUS_KM, math.pi)
+
+    lo = int(np.searchsorted(p2.lat, lat1 - angle, side="left"))
+    hi = int(np.searchsorted(p2.lat, lat1 + angle, side="right"))
+    positions = np.arange(lo, hi)
+    band_max_lat = min(math.pi / 2, abs(lat1) + angle)
+    scale = math.cos(lat1) * math.cos(band_max_lat)
+    hav_bound = math.sin(angle / 2) ** 2
+    if scale > hav_bound:
+        dlon_max = 2 * math.asin(math.sqrt(hav_bound / scale))
+        dlon = np.abs(p2.lon[lo:hi] - lon1) % (2 * math.pi)
+        dlon = np.minimum(dlon, 2 * math.pi - dlon)
+        positions = positions[dlon <= dlon_max]
+
+    # Seed distances are already exact; compute only the rest of the band.
+    positions = positions[(positions < seed[0]) | (positions > seed[-1])]
+    distances = np.concatenate((seed_distances, _haversine_kernel(p1, _select(p2, positions))))
+    positions = np.concatenate((seed, positions))
+    ties = order[positions[distances == distances.min()]]
+    return int(ties.min()), len(positions)
+
+
+def _closest_indices(engine, queries, evaluated=None):
+    """array2 positions of the closest point for each row of queries.
+
+    For the prefilter engine, per-query exact evaluation counts are written
+    into evaluated.
+    """
+    if isinstance(engine, CoordinateIndex):
+        return np.fromiter(
+            (_closest_index(engine, point1) for point1 in queries.tolist()),
+            dtype=np.int64, count=len(queries),
+        )
+    if isinstance(engine, LatitudeSortedCoordinates):
+        closest = np.empty(len(queries), dtype=np.int64)
+        for i, point1 in enumerate(queries.tolist()):
+            closest[i], evaluated[i] = _closest_prefiltered(engine, point1)
+        return closest
+    closest = np.empty(len(queries), dtype=np.int64)
+    for start, block in iter_haversine_tiles(queries, engine):
+        closest[start:start + len(block)] = np.argmin(block, axis=1)
+    return closest
+
+
+def _share_arrays(arrays):
+    """Copy arrays into new shared memory segments; return (segments, picklable specs)."""
+    segments, specs = [], {}
+    for name, array in arrays.items():
+        segment = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        segments.append(segment)
+        np.ndarray(array.shape, array.dtype, buffer=segment.buf)[...] = array
+        specs[name] = (segment.name, array.shape, array.dtype.str)
+    return segments, specs
+
+
+def _attach_arrays(specs):
+    """Map the segments described by _share_arrays specs back to arrays, without copying."""
+    segments, arrays = [], {}
+    for name, (segment_name, shape, dtype) in specs.items():
+        segment = shared_memory.SharedMemory(name=segment_name)
+        segments.append(segment)
+        arrays[name] = np.ndarray(shape, dtype, buffer=segment.buf)
+    return segments, arrays
+
+
+_worker_state = {}
+
+
+def _engine_arrays(engine):
+    """Flatten a matching engine to (kind, dict of arrays) for sharing between processes."""
+    if isinstance(engine, CoordinateIndex):
+        return "index", engine.to_arrays()
+    if isinstance(engine, LatitudeSortedCoordinates):
+        return "prefilter", {**engine.prepared._asdict(), "order": engine.order}
+    return "brute", engine._asdict()
+
+
+def _engine_from_arrays(kind, arrays):
+    if kind == "index":
+        return CoordinateIndex.from_arrays(arrays)
+    prepared = PreparedCoordinates(*(arrays[field] for field in PreparedCoordinates._fields))
+    if kind == "prefilter":
+        return LatitudeSortedCoordinates(prepared, arrays["order"])
+    return prepared
+
+
+def _init_match_worker(kind, engine_specs, io_specs):
+    segments, engine_arrays = _attach_arrays(engine_specs)
+    io_segments, io_arrays = _attach_arrays(io_specs)
+    # Keep the segments referenced so their buffers stay mapped for the worker's lifetime.
+    _worker_state.update(
+        segments=segments + io_segments,
+        engine=_engine_from_arrays(kind, engine_arrays),
+        io=io_arrays,
+    )
+
+
+def _match_range(bounds):
+    start, stop = bounds
+    io = _worker_state["io"]
+    evaluated = io["evaluated"][start:stop] if "evaluated" in io else None
+    io["closest"][start:stop] = _closest_indices(
+        _worker_state["engine"], io["queries"][start:stop], evaluated
+    )
+
+
+def _closest_indices_parallel(engine, queries, workers, evaluated=None):
+    kind, engine_arrays = _engine_arrays(engine)
+    io_arrays = {"queries": queries, "closest": np.empty(len(queries), dtype=np.int64)}
+    if evaluated is not None:
+        io_arrays["evaluated"] = evaluated
+    segments = []
+    try:
+        engine_segments, engine_specs = _share_arrays(engine_arrays)
+        segments += engine_segments
+        io_segments, io_specs = _share_arrays(io_arrays)
+        segments += io_segments
+
+        # A few ranges per worker evens out uneven per-query costs.
+        step = max(1, -(-len(queries) // (workers * 4)))
+        ranges = [(start, min(start + step, len(queries))) for start in range(0, len(queries), step)]
+        with multiprocessing.Pool(
+            workers, initializer=_init_match_worker, initargs=(kind, engine_specs, io_specs)
+        ) as pool:
+            pool.map(_match_range, ranges)
+
+        shared = dict(zip(io_arrays, io_segments))
+        if evaluated is not None:
+            evaluated[...] = np.ndarray(len(queries), np.int64, buffer=shared["evaluated"].buf)
+        return np.ndarray(len(queries), np.int64, buffer=shared["closest"].buf).copy()
+    finally:
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+
+
+class InvalidRowReport:
+    """Counts rows rejected while loading a CSV and keeps the first few for inspection."""
+
+    def __init__(self, max_samples=10):
+        self.count = 0
+        self.max_samples = max_samples
+        self.samples = []
+
+    def add(self, line_number, row, error):
+        self.count += 1
+        if len(self.samples) < self.max_samples:
+            self.samples.append((line_number, row, str(error)))
+
+    def summary(self):
+        lines = [f"Skipped {self.count} invalid row(s)"]
+        lines += [f"  line {n}: {row} ({error})" for n, row, error in self.samples]
+        return "\n".join(lines)
+
+
+def _parse_row(row, decimal_only):
+    if len(row) < 2:
+        raise ValueError(f"Expected 2 columns, got {len(row)}")
+    if decimal_only:
+        try:
+            return float(row[0]), float(row[1])
+        except ValueError as e:
+            raise ValueError(f"Invalid decimal coordinate in row {row}") from e
+    return parse_coordinate(row[0]), parse_coordinate(row[1])
+
+
+def _decimal_block(lines):
+    """Parse a block of plain decimal "lat,lon" lines in C, or return None if any line is not."""
+    # comments=None: a "#" must make the row invalid, not silently cut it short.
+    try:
+        return np.loadtxt(lines, delimiter=',', usecols=(0, 1), dtype=np.float64,
+                          ndmin=2, quotechar='"', comments=None)
+    except ValueError:
+        return None
+
+
+def iter_coordinate_chunks(file_path, chunk_size=CSV_CHUNK_ROWS, decimal_only=False, report=None):
+    """Stream (lat, lon) rows from a CSV as float64 arrays of shape (<= chunk_size, 2).
+
+    Memory use is bounded by chunk_size regardless of file size. Each block of
+    lines is first parsed by np.loadtxt; only blocks it rejects fall back to
+    per-row csv parsing, which also accepts DMS values unless decimal_only is
+    set. Rejected rows are recorded in report (an InvalidRowReport) if given.
+    """
     with open(file_path, newline='') as csvfile:
-        reader = csv.reader(csvfile)
-        for row in reader:
-            try:
-                lat = parse_coordinate(row[0])
-                lon = parse_coordinate(row[1])
-                coordinates.append((lat, lon))
-            except ValueError as e:
-                print(f"Skipping invalid row {row}: {e}")
+        line_number = 0
+        while True:
+            lines = list(islice(csvfile, chunk_size))
+            if not lines:
+                return
+            block = _decimal_block(lines)
+            if block is None:
+                parsed = []
+                for number, row in enumerate(csv.reader(lines), start=line_number + 1):
+                    try:
+                        parsed.append(_parse_row(row, decimal_only))
+                    except ValueError as e:
+                        if report is not None:
+                            report.add(number, row, e)
+                block = np.array(parsed, dtype=np.float64).reshape(-1, 2)
+            line_number += len(lines)
+            yield block
+
+
+def load_coordinates_from_csv(file_path, decimal_only=False, report=None):
+    """Load every (lat, lon) row of a CSV into a list of tuples.
+
+    Invalid rows are skipped. They are collected into report when one is
+    passed, otherwise a single summary is printed once the file is read.
+    """
+    own_report = report is None
+    if own_report:
+        report = InvalidRowReport()
+    coordinates = []
+    for chunk in iter_coordinate_chunks(file_path, decimal_only=decimal_only, report=report):
+        lats, lons = chunk.T.tolist()
+        coordinates.extend(zip(lats, lons))
+    if own_report and report.count:
+        print(report.summary())
     return coordinates
 
 
@@ -1,14 +1,25 @@
 import unittest
 from io import StringIO
 import csv
+import os
+import tempfile
 from unittest.mock import mock_open, patch
-from your_script_name import (
+from distance import (
     haversine_distance,
     dms_to_decimal,
     parse_coordinate,
     find_closest_points,
-    load_coordinates_from_csv
+    load_coordinates_from_csv,
+    haversine_one_to_many,
+    haversine_many_to_many,
+    haversine_pairwise,
+    iter_coordinate_chunks,
+    InvalidRowReport,
+    find_k_nearest_points,
+    find_points_within_radius,
+    PrefilterStats,
 )
+from coordinate_index import CoordinateIndex
 
 
 class TestCoordinateFunctions(unittest.TestCase):
@@ -20,6 +31,25 @@ class TestCoordinateFunctions(unittest.TestCase):
         distance = haversine_distance(lat1, lon1, lat2, lon2)
         self.assertAlmostEqual(distance, 343, delta=5)
 
+    def test_vectorized_haversine_matches_scalar(self):
+        points1 = [(48.8566, 2.3522), (40.7128, -74.0060), (-33.8688, 151.2093)]
+        points2 = [(51.5074, -0.1278), (34.0522, -118.2437), (35.6762, 139.6503), (48.8566, 2.3522)]
+        matrix = haversine_many_to_many(points1, points2, tile_elements=4)
+        for i, p1 in enumerate(points1):
+            row = haversine_one_to_many(p1, points2)
+            for j, p2 in enumerate(points2):
+                expected = haversine_distance(*p1, *p2)
+                self.assertAlmostEqual(matrix[i, j], expected, delta=1e-9)
+                self.assertAlmostEqual(row[j], expected, delta=1e-9)
+        pairs = haversine_pairwise(points1, points2, index1=[0, 2], index2=[3, 2])
+        self.assertAlmostEqual(pairs[0], 0.0, delta=1e-9)
+        self.assertAlmostEqual(pairs[1], haversine_distance(*points1[2], *points2[2]), delta=1e-9)
+        pairs = haversine_pairwise(points1, points2[:3])
+        for k in range(3):
+            self.assertAlmostEqual(pairs[k], haversine_distance(*points1[k], *points2[k]), delta=1e-9)
+        # A tile smaller than one row still covers whole rows.
+        self.assertEqual(haversine_many_to_many(points1, points2, tile_elements=1).tolist(), matrix.tolist())
+
     def test_dms_to_decimal(self):
         self.assertAlmostEqual(dms_to_decimal("45°30'30"""), 45.5083, places=4)
         self.assertAlmostEqual(dms_to_decimal("120°15'0"""), 120.25, places=4)
@@ -29,7 +59,7 @@ class TestCoordinateFunctions(unittest.TestCase):
 
     def test_parse_coordinate(self):
         self.assertEqual(parse_coordinate("45.6789"), 45.6789)
-        self.assertEqual(parse_coordinate("45°30'30"""), 45.5083)
+        self.assertAlmostEqual(parse_coordinate("45°30'30"""), 45.5083, places=4)
         with self.assertRaises(ValueError):
             parse_coordinate("invalid")
     
@@ -39,6 +69,68 @@ class TestCoordinateFunctions(unittest.TestCase):
         result = find_closest_points(array1, array2)
         self.assertEqual(result[0][1], (41.8781, -87.6298))  # Closest to Chicago
 
+    def test_find_closest_points_index_matches_brute(self):
+        array1 = [(lat, lon) for lat in range(-90, 91, 15) for lon in range(-180, 181, 40)]
+        array2 = [(lat + 3.5, lon - 7.25) for lat in range(-80, 81, 20) for lon in range(-170, 171, 30)]
+        array2 += [(0.0, 0.0), (0.0, 0.0), (90.0, 10.0)]  # duplicates and the pole
+        self.assertEqual(
+            find_closest_points(array1, array2, method="index"),
+            find_closest_points(array1, array2, method="brute"),
+        )
+
+    def test_find_closest_points_prefilter_is_exact(self):
+        # Queries clustered around Boston against a mostly local reference set.
+        array1 = [(42.3 + i * 0.01, -71.1 + j * 0.01) for i in range(10) for j in range(10)]
+        array2 = [(42.0 + i * 0.05, -71.5 + j * 0.05) for i in range(20) for j in range(20)]
+        array2 += [(34.0522, -118.2437), (-33.8688, 151.2093), (42.35, -71.05), (42.35, -71.05)]
+        stats = PrefilterStats()
+        result = find_closest_points(array1, array2, method="prefilter", stats=stats)
+        self.assertEqual(result, find_closest_points(array1, array2, method="brute"))
+        self.assertEqual(len(stats.pruned), len(array1))
+        self.assertTrue(all(pruned > 0 for pruned in stats.pruned))
+        self.assertTrue(all(evaluated + pruned == len(array2)
+                            for evaluated, pruned in zip(stats.evaluated, stats.pruned)))
+        # Every evaluation of a one-point reference set is the seed itself.
+        stats = PrefilterStats()
+        find_closest_points(array1, array2[:1], method="prefilter", stats=stats)
+        self.assertEqual(stats.evaluated, [1] * len(array1))
+
+    def test_find_closest_points_workers_preserve_order(self):
+        array1 = [(lat * 0.7, lon * 1.3) for lat in range(-60, 61, 6) for lon in range(-120, 121, 12)]
+        array2 = [(lat, lon) for lat in range(-80, 81, 10) for lon in range(-170, 171, 20)]
+        expected = find_closest_points(array1, array2)
+        self.assertEqual(find_closest_points(array1, array2, workers=2), expected)
+        self.assertEqual(find_closest_points(array1, array2, method="brute", workers=2), expected)
+        serial, parallel = PrefilterStats(), PrefilterStats()
+        find_closest_points(array1, array2, method="prefilter", stats=serial)
+        self.assertEqual(find_closest_points(array1, array2, method="prefilter", workers=2, stats=parallel), expected)
+        self.assertEqual(parallel.evaluated, serial.evaluated)
+
+    def test_find_k_nearest_and_radius(self):
+        new_york = (40.7128, -74.0060)
+        array2 = [(34.0522, -118.2437), (41.8781, -87.6298), (42.3601, -71.0589), (39.9526, -75.1652)]
+        result = find_k_nearest_points([new_york], array2, k=2)
+        self.assertEqual(result[0][1], [(39.9526, -75.1652), (42.3601, -71.0589)])  # Philadelphia, Boston
+        result = find_points_within_radius([new_york], array2, radius_km=1200)
+        self.assertEqual(result[0][1], [(39.9526, -75.1652), (42.3601, -71.0589), (41.8781, -87.6298)])
+        self.assertEqual(len(find_k_nearest_points([new_york], array2, k=10)[0][1]), len(array2))
+        self.assertEqual(find_points_within_radius([new_york], array2 + [new_york], radius_km=0)[0][1], [new_york])
+        with self.assertRaises(ValueError):
+            find_k_nearest_points([new_york], array2, k=0)
+
+    def test_coordinate_index_save_and_load(self):
+        array1 = [(40.7128, -74.0060), (51.5074, -0.1278)]
+        array2 = [(34.0522, -118.2437), (41.8781, -87.6298), (48.8566, 2.3522)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "reference.idx")
+            CoordinateIndex(array2).save(path)
+            index = CoordinateIndex.load(path)
+            self.assertEqual(find_closest_points(array1, index), find_closest_points(array1, array2))
+            self.assertEqual(find_k_nearest_points(array1, index, k=3), find_k_nearest_points(array1, array2, k=3))
+            self.assertEqual(find_points_within_radius(array1, index, radius_km=1500),
+                             find_points_within_radius(array1, array2, radius_km=1500))
+            del index  # release the memory map before the directory is removed
+
     @patch("builtins.open", new_callable=mock_open, read_data="40.7128,-74.0060\n34.0522,-118.2437\n")
     def test_load_coordinates_from_csv(self, mock_file):
         result = load_coordinates_from_csv("fake_path.csv")
@@ -49,6 +141,25 @@ class TestCoordinateFunctions(unittest.TestCase):
         result = load_coordinates_from_csv("fake_path.csv")
         self.assertEqual(result, [])  # Should skip invalid row
 
+    @patch("builtins.open", new_callable=mock_open,
+           read_data="40.7128,-74.0060\n34.0522,-118.2437\nbad,row\n45°30'0\",10\n")
+    def test_iter_coordinate_chunks(self, mock_file):
+        report = InvalidRowReport()
+        chunks = list(iter_coordinate_chunks("fake_path.csv", chunk_size=2, report=report))
+        self.assertEqual([chunk.shape for chunk in chunks], [(2, 2), (1, 2)])
+        self.assertEqual(chunks[0].tolist(), [[40.7128, -74.0060], [34.0522, -118.2437]])
+        self.assertAlmostEqual(chunks[1][0, 0], 45.5, places=4)
+        self.assertEqual(report.count, 1)
+        self.assertEqual(report.samples[0][:2], (3, ["bad", "row"]))
+
+    @patch("builtins.open", new_callable=mock_open, read_data="1,2\n#3,4\n5,6\n7,8 # x\n")
+    def test_iter_coordinate_chunks_rejects_comment_markers(self, mock_file):
+        report = InvalidRowReport()
+        chunks = list(iter_coordinate_chunks("fake_path.csv", report=report))
+        self.assertEqual(chunks[0].tolist(), [[1.0, 2.0], [5.0, 6.0]])
+        self.assertEqual(report.count, 2)
+        self.assertEqual([sample[0] for sample in report.samples], [2, 4])
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,113 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+from fastapi.responses import Response
+
+
+class ResponseCache:
+    """LRU cache of serialized JSON bodies, keyed by resource and version.
+
+    An entry is only served for the version it was stored under, so a write
+    (which changes the version) invalidates it without the writer having to
+    know about the cache, including writes made by other processes sharing
+    a SQLite store. The cache holds at most `max_entries` bodies and
+    `max_bytes` bytes, evicting the least recently used first.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, version: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, version: str, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._entries[key] = (version, body)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def count_not_modified(self) -> None:
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison: W/"x" matches "x".
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def cached_get(repository, item_id: str, if_none_match: Optional[str] = None) -> Optional[Response]:
+    """repository.get(item_id) as a JSON response with an ETag; None if the item does not exist.
+
+    Returns 304 when If-None-Match names the current version, otherwise the
+    cached body for that version, serializing only on a miss. The version is
+    read before the item, so a body is never labelled with a newer version
+    than its own.
+    """
+    version = repository.version(item_id)
+    if version is None:
+        return None
+    etag = f'"{version}"'
+    if etag_matches(if_none_match, etag):
+        cache.count_not_modified()
+        return Response(status_code=304, headers={"ETag": etag})
+    key = (repository.id_field, item_id)
+    body = cache.get(key, version)
+    if body is None:
+        item = repository.get(item_id)
+        if item is None:
+            return None
+        body = item.model_dump_json().encode()
+        cache.put(key, version, body)
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
+cache = ResponseCache(int(os.environ.get("SMARTHOME_CACHE_ENTRIES", "10000")),
+                      int(os.environ.get("SMARTHOME_CACHE_BYTES", str(64 << 20))))
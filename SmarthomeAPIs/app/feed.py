@@ -0,0 +1,146 @@
+import asyncio
+import json
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from .models import Device, House, Room
+
+DEFAULT_QUEUE_SIZE = 1000
+
+
+class Subscription:
+    """One subscriber's queue of serialized change events.
+
+    Created and read on the subscriber's event loop. A subscriber that falls
+    more than `maxsize` events behind loses the oldest ones; `dropped`
+    counts them.
+    """
+
+    def __init__(self, feed: "ChangeFeed", topics: Set[str], maxsize: int):
+        self.feed = feed
+        self.topics = topics
+        self.loop = asyncio.get_running_loop()
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def deliver(self, message: str) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self) -> str:
+        return await self.queue.get()
+
+    def close(self) -> None:
+        self.feed.unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _deliver_all(deliveries) -> None:
+    for subscription, message in deliveries:
+        subscription.deliver(message)
+
+
+class ChangeFeed:
+    """In-process pub/sub of device status changes.
+
+    Subscribers follow topics such as "device:D1", "room:R1" or "house:H1";
+    a device's changes are published to its own topic and to those of the
+    room and house it was placed in by the track_*() methods. Each
+    event is serialized once, however many subscribers receive it, and each
+    publish() hands all of its deliveries to a subscriber loop in a single
+    call_soon_threadsafe, so publishing from request threads never touches
+    subscriber queues directly.
+
+    Only changes made through this process are seen; with several worker
+    processes each has its own feed.
+    """
+
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._room_of: Dict[str, str] = {}
+        self._house_of: Dict[str, str] = {}
+
+    @staticmethod
+    def topics(house_ids: Iterable[str] = (), room_ids: Iterable[str] = (),
+               device_ids: Iterable[str] = ()) -> Set[str]:
+        return ({f"house:{house_id}" for house_id in house_ids}
+                | {f"room:{room_id}" for room_id in room_ids}
+                | {f"device:{device_id}" for device_id in device_ids})
+
+    def track_device(self, device: Device) -> None:
+        if device.room_id is not None:
+            with self._lock:
+                self._room_of[device.device_id] = device.room_id
+
+    def track_room(self, room: Room, house_id: Optional[str] = None) -> None:
+        with self._lock:
+            house_id = house_id or room.house_id
+            if house_id is not None:
+                self._house_of[room.room_id] = house_id
+            for device in room.devices:
+                self._room_of[device.device_id] = room.room_id
+
+    def track_house(self, house: House) -> None:
+        for room in house.rooms:
+            self.track_room(room, house.house_id)
+
+    def subscribe(self, topics: Set[str]) -> Subscription:
+        """Subscribe the running event loop to topics; close() the result when done."""
+        subscription = Subscription(self, topics, self.queue_size)
+        with self._lock:
+            for topic in topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len({subscription for subscribers in self._subscribers.values()
+                        for subscription in subscribers})
+
+    def publish(self, changes: Iterable[Dict[str, str]]) -> None:
+        """Send each change, a dict with device_id and the new field values, to its subscribers."""
+        by_loop: Dict[asyncio.AbstractEventLoop, List] = {}
+        with self._lock:
+            if not self._subscribers:
+                return
+            for change in changes:
+                device_id = change["device_id"]
+                room_id = self._room_of.get(device_id)
+                house_id = self._house_of.get(room_id) if room_id is not None else None
+                topics = [f"device:{device_id}", f"room:{room_id}", f"house:{house_id}"]
+                receivers = [self._subscribers[topic] for topic in topics if topic in self._subscribers]
+                if not receivers:
+                    continue
+                message = json.dumps({**change, "room_id": room_id, "house_id": house_id})
+                # A subscriber following both a device and its house gets the change once.
+                unique = receivers[0] if len(receivers) == 1 else set().union(*receivers)
+                for subscription in unique:
+                    by_loop.setdefault(subscription.loop, []).append((subscription, message))
+        for loop, deliveries in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver_all, deliveries)
+            except RuntimeError:
+                # The subscriber's loop has closed; its subscriptions are dead.
+                for subscription, _ in deliveries:
+                    self.unsubscribe(subscription)
+
+
+feed = ChangeFeed()
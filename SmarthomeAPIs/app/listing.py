@@ -0,0 +1,89 @@
+from typing import Optional, Set, Type
+
+from fastapi import HTTPException, Query, status
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+
+MAX_LIMIT = 10000
+STREAM_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class ListParams:
+    """Query parameters shared by the list endpoints.
+
+    `cursor` is the X-Next-Cursor header of the previous page, `limit` the
+    page size (all remaining items when omitted), `fields` a comma-separated
+    projection such as `device_id,status`, and `format=ndjson` returns one
+    JSON object per line, serialized as it is sent.
+    """
+
+    def __init__(self, cursor: Optional[str] = None,
+                 limit: Optional[int] = Query(None, ge=1, le=MAX_LIMIT),
+                 fields: Optional[str] = None,
+                 response_format: str = Query("json", alias="format", pattern="^(json|ndjson)$")):
+        self.cursor = cursor
+        self.limit = limit
+        self.fields = fields
+        self.format = response_format
+
+
+def _after(params: ListParams) -> Optional[int]:
+    if params.cursor is None:
+        return None
+    try:
+        return int(params.cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid cursor {params.cursor}"
+        )
+
+
+def _projection(model: Type[BaseModel], params: ListParams) -> Optional[Set[str]]:
+    if params.fields is None:
+        return None
+    fields = {field.strip() for field in params.fields.split(",") if field.strip()}
+    unknown = fields - set(model.model_fields)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields for {model.__name__}: {', '.join(sorted(unknown))}"
+        )
+    return fields
+
+
+def list_response(repository, model: Type[BaseModel], params: ListParams, **criteria) -> Response:
+    """One page of repository.page(**criteria) as a JSON array or as NDJSON.
+
+    Items are serialized one at a time straight to JSON text, without an
+    intermediate list of dicts. Without a limit, NDJSON fetches and sends
+    STREAM_PAGE_SIZE items at a time, so memory stays flat however large
+    the collection is.
+    """
+    after = _after(params)
+    include = _projection(model, params)
+    criteria = {field: value for field, value in criteria.items() if value is not None}
+
+    def serialize(item: BaseModel) -> str:
+        return item.model_dump_json(include=include)
+
+    if params.format == "ndjson" and params.limit is None:
+        def stream():
+            cursor = after
+            while True:
+                items, cursor = repository.page(after=cursor, limit=STREAM_PAGE_SIZE, **criteria)
+                if items:
+                    yield "".join(serialize(item) + "\n" for item in items)
+                if cursor is None:
+                    return
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    items, next_cursor = repository.page(after=after, limit=params.limit, **criteria)
+    headers = {NEXT_CURSOR_HEADER: str(next_cursor)} if next_cursor is not None else None
+    if params.format == "ndjson":
+        return StreamingResponse((serialize(item) + "\n" for item in items),
+                                 media_type="application/x-ndjson", headers=headers)
+    return Response("[" + ",".join(serialize(item) for item in items) + "]",
+                    media_type="application/json", headers=headers)
@@ -1,13 +1,20 @@
 from fastapi import FastAPI
-from .routes import user, house, rooms, devices
+from .cache import cache
+from .routes import user, house, rooms, devices, telemetry
 
 app = FastAPI()
 app.include_router(user.router, prefix="/users", tags=["Users"])
 app.include_router(house.router, prefix="/houses", tags=["Houses"])
 app.include_router(rooms.router, prefix="/rooms", tags=["Rooms"])
 app.include_router(devices.router, prefix="/devices", tags=["Devices"])
+app.include_router(telemetry.router, prefix="/telemetry", tags=["Telemetry"])
 
 
 @app.get("/")
 def read_root():
-    return {"message": " The Smart Home API is up and running!"}
\ No newline at end of file
+    return {"message": " The Smart Home API is up and running!"}
+
+
+@app.get("/cache/stats")
+def read_cache_stats():
+    return cache.stats()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import List
+from typing import List, Optional
 
 class User(BaseModel):
     user_id: str = Field(..., min_length=1)
@@ -14,10 +14,20 @@ class Device(BaseModel):
         pattern="^(on|off|idle)$",
         description="Must be 'on', 'off', or 'idle'"
     )
+    room_id: Optional[str] = Field(None, description="room_id of the room the device is in")
+
+class DeviceStatusUpdate(BaseModel):
+    device_id: str = Field(..., min_length=1)
+    status: str = Field(
+        ...,
+        pattern="^(on|off|idle)$",
+        description="Must be 'on', 'off', or 'idle'"
+    )
 
 class Room(BaseModel):
     room_id: str = Field(..., min_length=1)
     name: str = Field(..., min_length=1)
+    house_id: Optional[str] = Field(None, description="house_id of the house the room is in")
     devices: List[Device] = []
 
 class House(BaseModel):
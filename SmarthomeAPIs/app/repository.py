@@ -0,0 +1,352 @@
+import bisect
+import os
+import threading
+import uuid
+from typing import Dict, Generic, Iterable, List, Mapping, Optional, Tuple, TypeVar
+
+from pydantic import BaseModel
+
+Model = TypeVar("Model", bound=BaseModel)
+
+
+class DuplicateIdError(KeyError):
+    pass
+
+
+class BulkWriteError(ValueError):
+    """A bulk write that was rejected as a whole; `errors` maps item positions to messages."""
+
+    def __init__(self, errors: Dict[int, str]):
+        super().__init__(errors)
+        self.errors = errors
+
+
+class Repository(Generic[Model]):
+    """In-memory models keyed by their ID field, with secondary indexes.
+
+    Every add or replace gives the model a new, increasing sequence number;
+    listing order is the order of these numbers. update_many() changes
+    models in place and keeps their position. The
+    collection and each secondary index (field value -> models holding it)
+    are append-only sorted lists of sequence numbers, so lookups by ID or by
+    indexed value are dict lookups and page() resumes after a cursor with a
+    binary search instead of a scan. Numbers left behind by rewritten or
+    removed models are skipped and compacted away once they outnumber the
+    live ones; cursors stay valid across compaction. version() changes on
+    every write to a model, including in-place updates, and is prefixed
+    with a nonce drawn per repository, so versions from another process or
+    an earlier run never coincide with this one's.
+
+    Repositories joined by link() hold related models by reference: a
+    child (e.g. a device) names its parent in a field (room_id) and the
+    parent's list field (Room.devices) is a view of its children, patched
+    whenever one of them is written. Reading a parent, up to a whole house,
+    is then a dict lookup rather than a join.
+    """
+
+    def __init__(self, id_field: str, indexed_fields: Iterable[str] = ()):
+        self.id_field = id_field
+        self._items: Dict[str, Model] = {}
+        self._seqs: Dict[str, int] = {}
+        self._versions: Dict[str, int] = {}
+        self._live: Dict[int, str] = {}
+        self._order: List[int] = []
+        self._indexes: Dict[str, Dict[object, List[int]]] = {field: {} for field in indexed_fields}
+        self._next_seq = 0
+        self._nonce = uuid.uuid4().hex
+        self._lock = threading.RLock()
+        self._parent: Optional[Tuple["Repository", str]] = None
+        self._child: Optional[Tuple["Repository", str]] = None
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._items
+
+    def _id(self, item: Model) -> str:
+        return getattr(item, self.id_field)
+
+    def _store(self, item: Model) -> None:
+        item_id = self._id(item)
+        self._retire(item_id)
+        seq = self._next_seq
+        self._next_seq += 1
+        self._items[item_id] = item
+        self._seqs[item_id] = seq
+        self._versions[item_id] = seq
+        self._live[seq] = item_id
+        self._order.append(seq)
+        for field, index in self._indexes.items():
+            index.setdefault(getattr(item, field), []).append(seq)
+
+    def _retire(self, item_id: str) -> None:
+        seq = self._seqs.pop(item_id, None)
+        if seq is None:
+            return
+        del self._versions[item_id]
+        del self._live[seq]
+        if len(self._order) > 2 * len(self._live) + 1024:
+            self._compact()
+
+    def _compact(self) -> None:
+        live = self._live
+        self._order = [seq for seq in self._order if seq in live]
+        for index in self._indexes.values():
+            for value in list(index):
+                seqs = [seq for seq in index[value] if seq in live]
+                if seqs:
+                    index[value] = seqs
+                else:
+                    del index[value]
+
+    def _update(self, item_id: str, fields: Mapping[str, object]) -> None:
+        self._patch(item_id, self._items[item_id].model_copy(update=fields))
+
+    def _patch(self, item_id: str, new: Model) -> None:
+        """Rewrite a model in place: same position, new version, parent views patched."""
+        old = self._items[item_id]
+        seq = self._seqs[item_id]
+        for field, index in self._indexes.items():
+            before, after = getattr(old, field), getattr(new, field)
+            if before != after:
+                seqs = index[before]
+                del seqs[bisect.bisect_left(seqs, seq)]
+                if not seqs:
+                    del index[before]
+                bisect.insort(index.setdefault(after, []), seq)
+        self._items[item_id] = new
+        self._versions[item_id] = self._next_seq
+        self._next_seq += 1
+        self._propagate(old, new)
+
+    def _propagate(self, old: Optional[Model], new: Optional[Model]) -> None:
+        """Patch the parents whose views held old or should now hold new."""
+        if self._parent is None:
+            return
+        parent, field = self._parent
+        item_id = self._id(new if new is not None else old)
+        for parent_id in {getattr(item, field) for item in (old, new) if item is not None} - {None}:
+            parent._patch_child(parent_id, item_id,
+                                new if new is not None and getattr(new, field) == parent_id else None)
+
+    def _patch_child(self, item_id: str, child_id: str, child: Optional[BaseModel]) -> None:
+        item = self._items.get(item_id)
+        if item is None:
+            return
+        children_repository, field = self._child
+        children = list(getattr(item, field))
+        for position, existing in enumerate(children):
+            if children_repository._id(existing) == child_id:
+                if child is None:
+                    del children[position]
+                else:
+                    children[position] = child
+                break
+        else:
+            if child is None:
+                return
+            children.append(child)
+        self._patch(item_id, item.model_copy(update={field: children}))
+
+    def _keys(self, item: Model) -> set:
+        """(ID field, ID) of a model and of every model embedded in it."""
+        keys = {(self.id_field, self._id(item))}
+        if self._child is not None:
+            children_repository, field = self._child
+            for child in getattr(item, field):
+                keys |= children_repository._keys(child)
+        return keys
+
+    def _check_new(self, item: Model, seen: set, replacing: frozenset = frozenset()) -> None:
+        """Raise DuplicateIdError if the model or anything embedded in it reuses a taken ID."""
+        item_id = self._id(item)
+        key = (self.id_field, item_id)
+        if (item_id in self._items and key not in replacing) or key in seen:
+            raise DuplicateIdError(item_id)
+        seen.add(key)
+        if self._child is not None:
+            children_repository, field = self._child
+            for child in getattr(item, field):
+                children_repository._check_new(child, seen, replacing)
+
+    def _insert(self, item: Model, parent_id: Optional[str] = None) -> Model:
+        """Store a model, moving its embedded children into the child repository.
+
+        The stored model's child list is the view of every child naming it,
+        embedded or added earlier.
+        """
+        if parent_id is not None:
+            item = item.model_copy(update={self._parent[1]: parent_id})
+        if self._child is not None:
+            children_repository, field = self._child
+            item_id = self._id(item)
+            for child in getattr(item, field):
+                children_repository._insert(child, item_id)
+            item = item.model_copy(update={field: children_repository.find(**{children_repository._parent[1]: item_id})})
+        self._store(item)
+        return item
+
+    def _delete(self, item_id: str) -> Optional[Model]:
+        """Remove a model and, like ON DELETE CASCADE, the children in its view."""
+        item = self._items.pop(item_id, None)
+        if item is None:
+            return None
+        self._retire(item_id)
+        if self._child is not None:
+            children_repository, field = self._child
+            for child in getattr(item, field):
+                children_repository._delete(children_repository._id(child))
+        return item
+
+    def add(self, item: Model) -> Model:
+        """Store a new model; raises DuplicateIdError if its ID, or an embedded one, is taken."""
+        with self._lock:
+            self._check_new(item, set())
+            item = self._insert(item)
+            self._propagate(None, item)
+        return item
+
+    def add_many(self, items: List[Model]) -> List[Model]:
+        """Store all of items or none; BulkWriteError lists IDs already taken."""
+        with self._lock:
+            seen = set()
+            errors = {}
+            for position, item in enumerate(items):
+                try:
+                    self._check_new(item, seen)
+                except DuplicateIdError as error:
+                    errors[position] = f"ID {error.args[0]} already exists"
+            if errors:
+                raise BulkWriteError(errors)
+            stored = []
+            for item in items:
+                stored.append(self._insert(item))
+                self._propagate(None, stored[-1])
+        return stored
+
+    def update_many(self, changes: List[Tuple[str, Mapping[str, object]]]) -> int:
+        """Set fields on models by ID, all or none; BulkWriteError lists unknown IDs.
+
+        changes is a list of (ID, {field: value}); returns how many were applied.
+        """
+        with self._lock:
+            errors = {}
+            for position, (item_id, fields) in enumerate(changes):
+                item = self._items.get(item_id)
+                if item is None:
+                    errors[position] = f"ID {item_id} not found"
+                    continue
+                for field in fields:
+                    if (field not in type(item).model_fields or field == self.id_field
+                            or (self._child is not None and field == self._child[1])):
+                        raise ValueError(f"Cannot update {type(item).__name__}.{field}")
+            if errors:
+                raise BulkWriteError(errors)
+            for item_id, fields in changes:
+                self._update(item_id, fields)
+        return len(changes)
+
+    def replace(self, item: Model) -> Model:
+        """Store a model, and the children embedded in it, over the one with the same ID."""
+        with self._lock:
+            old = self._items.get(self._id(item))
+            self._check_new(item, set(), frozenset(self._keys(old)) if old is not None else frozenset())
+            if old is not None:
+                self._delete(self._id(old))
+            item = self._insert(item)
+            self._propagate(old, item)
+        return item
+
+    def remove(self, item_id: str) -> Optional[Model]:
+        with self._lock:
+            item = self._delete(item_id)
+            if item is not None:
+                self._propagate(item, None)
+            return item
+
+    def get(self, item_id: str) -> Optional[Model]:
+        return self._items.get(item_id)
+
+    def version(self, item_id: str) -> Optional[str]:
+        """Token that changes whenever the model is written; None if it does not exist."""
+        version = self._versions.get(item_id)
+        return None if version is None else f"{self._nonce}.{version}"
+
+    def all(self) -> List[Model]:
+        return self.find()
+
+    def find(self, **criteria) -> List[Model]:
+        """Models whose fields equal every given value, e.g. find(status="on")."""
+        return self.page(**criteria)[0]
+
+    def page(self, after: Optional[int] = None, limit: Optional[int] = None,
+             **criteria) -> Tuple[List[Model], Optional[int]]:
+        """Up to limit models matching criteria that come after cursor `after`.
+
+        Returns (models, cursor for the next page or None when there are no
+        more). The most selective indexed criterion picks the candidates;
+        other criteria are checked on those candidates only.
+        """
+        with self._lock:
+            indexed = [field for field in criteria if field in self._indexes]
+            if indexed:
+                seqs = min((self._indexes[field].get(criteria[field], []) for field in indexed), key=len)
+            else:
+                seqs = self._order
+            start = 0 if after is None else bisect.bisect_right(seqs, after)
+            items, last = [], None
+            for position in range(start, len(seqs)):
+                item_id = self._live.get(seqs[position])
+                if item_id is None:
+                    continue
+                item = self._items[item_id]
+                if any(getattr(item, field) != value for field, value in criteria.items()):
+                    continue
+                if limit is not None and len(items) == limit:
+                    return items, last
+                items.append(item)
+                last = seqs[position]
+            return items, None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._seqs.clear()
+            self._versions.clear()
+            self._live.clear()
+            self._order.clear()
+            for index in self._indexes.values():
+                index.clear()
+
+
+def link(parent: Repository, child: Repository, child_field: str, parent_field: str) -> None:
+    """Make parent.<child_field> a view of the child models whose <parent_field> is its ID.
+
+    The child repository should index parent_field. Linked repositories
+    share one lock, so a write and the views it patches change together.
+    """
+    parent._child = (child, child_field)
+    child._parent = (parent, parent_field)
+    repository = child
+    while repository is not None:
+        repository._lock = parent._lock
+        repository = repository._child[0] if repository._child is not None else None
+
+
+def _create_repositories():
+    """In-memory repositories, or SQLite-backed ones when SMARTHOME_DB names a database file."""
+    path = os.environ.get("SMARTHOME_DB")
+    if path:
+        from .sqlite_store import SqliteStore
+        store = SqliteStore(path, pool_size=int(os.environ.get("SMARTHOME_DB_POOL_SIZE", "8")))
+        return store.users, store.houses, store.rooms, store.devices
+    houses = Repository("house_id", ["owner_id"])
+    rooms = Repository("room_id", ["house_id"])
+    devices = Repository("device_id", ["status", "device_type", "room_id"])
+    link(houses, rooms, "rooms", "house_id")
+    link(rooms, devices, "devices", "room_id")
+    return Repository("user_id"), houses, rooms, devices
+
+
+users, houses, rooms, devices = _create_repositories()
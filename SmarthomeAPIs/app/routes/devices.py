@@ -1,22 +1,112 @@
-from fastapi import APIRouter
-from ..models import Device
+import asyncio
+from typing import List, Optional, Set
 
-router = APIRouter()
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from ..cache import cached_get
+from ..feed import feed
+from ..listing import ListParams, list_response
+from ..models import Device, DeviceStatusUpdate
+from ..repository import BulkWriteError, DuplicateIdError, devices
+from ..telemetry import telemetry
 
-fake_devices_db = []
+router = APIRouter()
 
 @router.get("/")
-def get_all_devices():
-    return fake_devices_db
+def get_all_devices(device_status: Optional[str] = Query(None, alias="status"),
+                    device_type: Optional[str] = None, room_id: Optional[str] = None,
+                    params: ListParams = Depends()):
+    return list_response(devices, Device, params, status=device_status, device_type=device_type,
+                         room_id=room_id)
+
+def bulk_error(error: BulkWriteError, device_ids: List[str]) -> HTTPException:
+    # Nothing was written; report every rejected item by its position in the body.
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=[{"index": index, "device_id": device_ids[index], "error": message}
+                for index, message in sorted(error.errors.items())]
+    )
+
+@router.post("/bulk")
+def create_devices(new_devices: List[Device]):
+    try:
+        devices.add_many(new_devices)
+    except BulkWriteError as error:
+        raise bulk_error(error, [device.device_id for device in new_devices])
+    telemetry.record_many((device.device_id, device.status) for device in new_devices)
+    for device in new_devices:
+        feed.track_device(device)
+    return {"created": len(new_devices)}
+
+@router.patch("/status")
+def update_device_status(updates: List[DeviceStatusUpdate]):
+    try:
+        updated = devices.update_many([(update.device_id, {"status": update.status}) for update in updates])
+    except BulkWriteError as error:
+        raise bulk_error(error, [update.device_id for update in updates])
+    telemetry.record_many((update.device_id, update.status) for update in updates)
+    feed.publish({"device_id": update.device_id, "status": update.status} for update in updates)
+    return {"updated": updated}
+
+def feed_topics(house_id: Optional[List[str]] = Query(None), room_id: Optional[List[str]] = Query(None),
+                device_id: Optional[List[str]] = Query(None)) -> Set[str]:
+    return feed.topics(house_id or (), room_id or (), device_id or ())
+
+@router.websocket("/feed")
+async def device_feed(websocket: WebSocket, topics: Set[str] = Depends(feed_topics)):
+    if not topics:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION,
+                              reason="Subscribe to a house_id, room_id or device_id")
+        return
+    with feed.subscribe(topics) as subscription:
+        await websocket.accept()
+
+        async def forward():
+            while True:
+                await websocket.send_text(await subscription.get())
+
+        sender = asyncio.ensure_future(forward())
+        try:
+            # Nothing is expected from the client; receiving is how a disconnect is noticed.
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
+
+@router.get("/feed")
+async def device_feed_events(topics: Set[str] = Depends(feed_topics)):
+    if not topics:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Subscribe to a house_id, room_id or device_id"
+        )
+    subscription = feed.subscribe(topics)
+
+    async def events():
+        with subscription:
+            while True:
+                yield f"data: {await subscription.get()}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 @router.get("/{device_id}")
-def get_device(device_id: str):
-    for d in fake_devices_db:
-        if d.device_id == device_id:
-            return d
-    return {"error": "Device not found"}
+def get_device(device_id: str, if_none_match: Optional[str] = Header(None)):
+    response = cached_get(devices, device_id, if_none_match)
+    if response is None:
+        return {"error": "Device not found"}
+    return response
 
 @router.post("/")
 def create_device(device: Device):
-    fake_devices_db.append(device)
+    try:
+        device = devices.add(device)
+    except DuplicateIdError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Device ID {device.device_id} already exists"
+        )
+    telemetry.record(device.device_id, device.status)
+    feed.track_device(device)
     return device
@@ -1,22 +1,41 @@
-from fastapi import APIRouter
-from ..models import House
+from typing import Optional
 
-router = APIRouter()
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from ..cache import cached_get
+from ..feed import feed
+from ..listing import ListParams, list_response
+from ..models import House, Room
+from ..repository import DuplicateIdError, houses, rooms
+from ..telemetry import telemetry
 
-fake_houses_db = []
+router = APIRouter()
 
 @router.get("/")
-def get_all_houses():
-    return fake_houses_db
+def get_all_houses(owner_id: Optional[str] = None, params: ListParams = Depends()):
+    return list_response(houses, House, params, owner_id=owner_id)
 
 @router.get("/{house_id}")
-def get_house(house_id: str):
-    for h in fake_houses_db:
-        if h.house_id == house_id:
-            return h
-    return {"error": "House not found"}
+def get_house(house_id: str, if_none_match: Optional[str] = Header(None)):
+    response = cached_get(houses, house_id, if_none_match)
+    if response is None:
+        return {"error": "House not found"}
+    return response
+
+@router.get("/{house_id}/rooms")
+def get_house_rooms(house_id: str, params: ListParams = Depends()):
+    return list_response(rooms, Room, params, house_id=house_id)
 
 @router.post("/")
 def create_house(house: House):
-    fake_houses_db.append(house)
-    return house
\ No newline at end of file
+    try:
+        stored = houses.add(house)
+    except DuplicateIdError as error:
+        # The taken ID may belong to an embedded room or device.
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"ID {error.args[0]} already exists"
+        )
+    # Only the devices posted here are new; the stored house also lists earlier ones.
+    telemetry.record_many((device.device_id, device.status) for room in house.rooms for device in room.devices)
+    feed.track_house(stored)
+    return stored
@@ -1,15 +1,40 @@
-from fastapi import APIRouter
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from ..cache import cached_get
+from ..feed import feed
+from ..listing import ListParams, list_response
 from ..models import Room
+from ..repository import DuplicateIdError, rooms
+from ..telemetry import telemetry
 
 router = APIRouter()
 
-fake_rooms_db = []
-
 @router.get("/")
-def get_all_rooms():
-    return fake_rooms_db
+def get_all_rooms(house_id: Optional[str] = None, params: ListParams = Depends()):
+    return list_response(rooms, Room, params, house_id=house_id)
+
+@router.get("/{room_id}")
+def get_room(room_id: str, if_none_match: Optional[str] = Header(None)):
+    response = cached_get(rooms, room_id, if_none_match)
+    if response is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Room with ID {room_id} not found"
+        )
+    return response
 
 @router.post("/")
 def create_room(room: Room):
-    fake_rooms_db.append(room)
-    return room
\ No newline at end of file
+    try:
+        stored = rooms.add(room)
+    except DuplicateIdError as error:
+        # The taken ID may belong to an embedded device.
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"ID {error.args[0]} already exists"
+        )
+    # Only the devices posted here are new; the stored room also lists earlier ones.
+    telemetry.record_many((device.device_id, device.status) for device in room.devices)
+    feed.track_room(stored)
+    return stored
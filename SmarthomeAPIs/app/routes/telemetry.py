@@ -0,0 +1,52 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+import numpy as np
+from fastapi import APIRouter, HTTPException, status
+from ..repository import devices, rooms
+from ..telemetry import DAY, STATUSES, status_counts, telemetry, time_in_status
+
+MAX_DAYS = 366
+
+router = APIRouter()
+
+def day_boundaries(start: Optional[date], end: Optional[date]):
+    """UTC midnights from start to the day after end (both inclusive, default: the last 7 days)."""
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=6)
+    days = (end - start).days + 1
+    if not 0 < days <= MAX_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"start must be on or before end, at most {MAX_DAYS} days apart"
+        )
+    first = datetime(start.year, start.month, start.day, tzinfo=timezone.utc).timestamp()
+    return [start + timedelta(days=i) for i in range(days)], first + DAY * np.arange(days + 1)
+
+@router.get("/devices/{device_id}/uptime")
+def get_device_uptime(device_id: str, start: Optional[date] = None, end: Optional[date] = None):
+    if device_id not in devices:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Device with ID {device_id} not found"
+        )
+    dates, boundaries = day_boundaries(start, end)
+    times, codes = telemetry.history(device_id, boundaries[0], boundaries[-1])
+    # Time after now has not happened yet, whatever the current status.
+    seconds = time_in_status(times, codes, "on", np.minimum(boundaries, datetime.now(timezone.utc).timestamp()))
+    return [{"date": day.isoformat(), "uptime_seconds": float(uptime)} for day, uptime in zip(dates, seconds)]
+
+@router.get("/rooms/{room_id}/status-counts")
+def get_room_status_counts(room_id: str, start: Optional[date] = None, end: Optional[date] = None):
+    room = rooms.get(room_id)
+    if room is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Room with ID {room_id} not found"
+        )
+    dates, boundaries = day_boundaries(start, end)
+    histories = [telemetry.history(device.device_id, boundaries[0], boundaries[-1]) for device in room.devices]
+    times = np.concatenate([np.empty(0)] + [times for times, _ in histories])
+    codes = np.concatenate([np.empty(0, np.int8)] + [codes for _, codes in histories])
+    counts = status_counts(times, codes, boundaries)
+    return [{"date": day.isoformat(), **dict(zip(STATUSES, map(int, row)))} for day, row in zip(dates, counts)]
@@ -1,30 +1,33 @@
-from fastapi import APIRouter, HTTPException, status
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from ..cache import cached_get
+from ..listing import ListParams, list_response
 from ..models import User
+from ..repository import DuplicateIdError, users
 
 router = APIRouter()
 
-fake_users_db = {}
-
 @router.get("/", response_model=list[User])
-def get_all_users():
-    return list(fake_users_db.values())
+def get_all_users(params: ListParams = Depends()):
+    return list_response(users, User, params)
 
 @router.get("/{user_id}", response_model=User)
-def get_user(user_id: str):
-    user = fake_users_db.get(user_id)
-    if not user:
+def get_user(user_id: str, if_none_match: Optional[str] = Header(None)):
+    response = cached_get(users, user_id, if_none_match)
+    if response is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"User with ID {user_id} not found"
         )
-    return user
+    return response
 
 @router.post("/", response_model=User, status_code=status.HTTP_201_CREATED)
 def create_user(user: User):
-    if user.user_id in fake_users_db:
+    try:
+        return users.add(user)
+    except DuplicateIdError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"User ID {user.user_id} already exists"
-        )
-    fake_users_db[user.user_id] = user
-    return user
\ No newline at end of file
+        )
\ No newline at end of file
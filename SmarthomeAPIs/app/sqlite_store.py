@@ -0,0 +1,429 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple, Type
+
+from pydantic import BaseModel
+
+from .models import Device, House, Room, User
+from .repository import BulkWriteError, DuplicateIdError
+
+# seq orders rows by when they were added or replaced (a replace is a delete
+# plus an insert; update_many updates in place) and is what page() cursors
+# point at; AUTOINCREMENT never hands out a seq twice, so a cursor cannot be
+# overtaken by reused numbers. Secondary indexes implicitly end in seq, so
+# filtered pages are index range scans.
+#
+# room_id and house_id are plain references rather than foreign keys: a device
+# may name a room that is created later, as in the in-memory repositories.
+# Deleting a room or house deletes its children explicitly (_delete).
+#
+# PRAGMA user_version records SCHEMA_VERSION; bump it with every change to
+# SCHEMA and teach _migrate how to bring older databases up to date.
+#
+# version counts in-place writes to a row. Triggers carry a change to a device
+# up to its room and from there to its house, since both embed it; seq and
+# version together identify one state of a model (see SqliteRepository.version).
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL UNIQUE,
+    version INTEGER NOT NULL DEFAULT 0,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS houses (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    house_id TEXT NOT NULL UNIQUE,
+    version INTEGER NOT NULL DEFAULT 0,
+    address TEXT NOT NULL,
+    owner_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS houses_owner_id ON houses (owner_id);
+CREATE TABLE IF NOT EXISTS rooms (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    room_id TEXT NOT NULL UNIQUE,
+    version INTEGER NOT NULL DEFAULT 0,
+    name TEXT NOT NULL,
+    house_id TEXT
+);
+CREATE INDEX IF NOT EXISTS rooms_house_id ON rooms (house_id);
+CREATE TABLE IF NOT EXISTS devices (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id TEXT NOT NULL UNIQUE,
+    version INTEGER NOT NULL DEFAULT 0,
+    device_type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    room_id TEXT
+);
+CREATE INDEX IF NOT EXISTS devices_status ON devices (status);
+CREATE INDEX IF NOT EXISTS devices_device_type ON devices (device_type);
+CREATE INDEX IF NOT EXISTS devices_room_id ON devices (room_id);
+CREATE TRIGGER IF NOT EXISTS devices_insert_touches_room AFTER INSERT ON devices BEGIN
+    UPDATE rooms SET version = version + 1 WHERE room_id = NEW.room_id;
+END;
+CREATE TRIGGER IF NOT EXISTS devices_update_touches_room AFTER UPDATE ON devices BEGIN
+    UPDATE rooms SET version = version + 1 WHERE room_id = NEW.room_id;
+END;
+CREATE TRIGGER IF NOT EXISTS devices_delete_touches_room AFTER DELETE ON devices BEGIN
+    UPDATE rooms SET version = version + 1 WHERE room_id = OLD.room_id;
+END;
+CREATE TRIGGER IF NOT EXISTS rooms_insert_touches_house AFTER INSERT ON rooms BEGIN
+    UPDATE houses SET version = version + 1 WHERE house_id = NEW.house_id;
+END;
+CREATE TRIGGER IF NOT EXISTS rooms_update_touches_house AFTER UPDATE ON rooms BEGIN
+    UPDATE houses SET version = version + 1 WHERE house_id = NEW.house_id;
+END;
+CREATE TRIGGER IF NOT EXISTS rooms_delete_touches_house AFTER DELETE ON rooms BEGIN
+    UPDATE houses SET version = version + 1 WHERE house_id = OLD.house_id;
+END;
+"""
+
+
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections to one database file in WAL mode.
+
+    WAL lets any number of readers, in this and other processes, run next to
+    a single writer. Each connection keeps its own cache of prepared
+    statements, so reusing connections also reuses compiled SQL. A pool
+    belongs to the process that created it: after a fork (e.g. uvicorn
+    --workers) the child opens fresh connections on first use.
+    """
+
+    def __init__(self, path: str, size: int = 8, timeout: float = 30.0):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                                     isolation_level=None, cached_statements=256)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        return connection
+
+    def _ensure_process(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Connections inherited over fork must not be used; drop them.
+                self._idle = queue.LifoQueue()
+                for _ in range(self.size):
+                    self._idle.put(self._connect())
+                self._pid = os.getpid()
+
+    @contextmanager
+    def connection(self):
+        self._ensure_process()
+        connection = self._idle.get()
+        try:
+            yield connection
+        finally:
+            self._idle.put(connection)
+
+    @contextmanager
+    def transaction(self):
+        """A pooled connection inside BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error)."""
+        with self.connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            while not self._idle.empty():
+                self._idle.get_nowait().close()
+            self._pid = None
+
+
+class Table:
+    """How one model maps onto one table.
+
+    `parent_column` links rows to the model that embeds them (a room's
+    devices, a house's rooms); `child` is the Table embedded in this model's
+    `child_field` list.
+    """
+
+    def __init__(self, name: str, model: Type[BaseModel], id_field: str, columns: Sequence[str],
+                 parent_column: Optional[str] = None, child: Optional["Table"] = None,
+                 child_field: Optional[str] = None):
+        self.name = name
+        self.model = model
+        self.id_field = id_field
+        self.columns = list(columns)
+        self.parent_column = parent_column
+        self.child = child
+        self.child_field = child_field
+        self.stored = stored = self.columns + ([parent_column] if parent_column and parent_column not in columns else [])
+        self.insert_sql = (f"INSERT INTO {name} ({', '.join(stored)}) "
+                           f"VALUES ({', '.join('?' for _ in stored)})")
+        self.select_sql = f"SELECT {', '.join(stored)} FROM {name}"
+        self.page_sql = f"SELECT {', '.join(stored)}, seq FROM {name}"
+
+    def row(self, item: BaseModel, parent_id: Optional[str] = None) -> tuple:
+        values = [getattr(item, column) for column in self.columns]
+        if self.parent_column and self.parent_column not in self.columns:
+            values.append(parent_id)
+        elif self.parent_column and parent_id is not None:
+            values[self.columns.index(self.parent_column)] = parent_id
+        return tuple(values)
+
+
+DEVICES = Table("devices", Device, "device_id", ["device_id", "device_type", "status", "room_id"],
+                parent_column="room_id")
+ROOMS = Table("rooms", Room, "room_id", ["room_id", "name", "house_id"],
+              parent_column="house_id", child=DEVICES, child_field="devices")
+HOUSES = Table("houses", House, "house_id", ["house_id", "address", "owner_id"],
+               child=ROOMS, child_field="rooms")
+USERS = Table("users", User, "user_id", ["user_id", "name", "email"])
+
+
+TABLES = [USERS, HOUSES, ROOMS, DEVICES]  # parents before children
+
+
+def _statements(script: str):
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ""
+
+
+def _migrate(connection: sqlite3.Connection, path: str) -> None:
+    """Create the schema, or bring an existing database up to SCHEMA_VERSION.
+
+    Databases written before the schema was versioned (user_version 0) hold
+    the same model columns in older table layouts; the tables are rebuilt
+    and their rows copied across in insertion order, which renumbers seq and
+    so invalidates outstanding cursors. A database from newer code is refused
+    rather than misread. Runs in one write transaction, so concurrent
+    workers opening the same file migrate it once.
+    """
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(f"{path} has schema version {version}, newer than the "
+                               f"supported version {SCHEMA_VERSION}; upgrade SmarthomeAPIs to open it")
+        if version < SCHEMA_VERSION:
+            names = [table.name for table in TABLES]
+            placeholders = ", ".join("?" for _ in names)
+            legacy = {name for (name,) in connection.execute(
+                f"SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders})", names)}
+            for kind, name in connection.execute(
+                    f"SELECT type, name FROM sqlite_master WHERE type IN ('index', 'trigger') "
+                    f"AND sql IS NOT NULL AND tbl_name IN ({placeholders})", names).fetchall():
+                connection.execute(f"DROP {kind.upper()} {name}")
+            for name in legacy:
+                connection.execute(f"ALTER TABLE {name} RENAME TO legacy_{name}")
+            for statement in _statements(SCHEMA):
+                connection.execute(statement)
+            for table in TABLES:
+                if table.name in legacy:
+                    columns = ", ".join(table.stored)
+                    connection.execute(f"INSERT INTO {table.name} ({columns}) "
+                                       f"SELECT {columns} FROM legacy_{table.name} ORDER BY rowid")
+            # Children first, so no legacy foreign key is left dangling.
+            for table in reversed(TABLES):
+                if table.name in legacy:
+                    connection.execute(f"DROP TABLE legacy_{table.name}")
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+class SqliteRepository:
+    """Repository (see app.repository) stored in one SQLite table.
+
+    Embedded lists are normalized: a house's rooms live in `rooms` with its
+    house_id, a room's devices in `devices` with its room_id, and they are
+    joined back when a model is read. Adding a model writes it and its
+    embedded children in one transaction.
+    """
+
+    def __init__(self, pool: ConnectionPool, table: Table):
+        self.pool = pool
+        self.table = table
+        self.id_field = table.id_field
+
+    def __len__(self) -> int:
+        with self.pool.connection() as connection:
+            return connection.execute(f"SELECT COUNT(*) FROM {self.table.name}").fetchone()[0]
+
+    def __contains__(self, item_id: str) -> bool:
+        sql = f"SELECT 1 FROM {self.table.name} WHERE {self.id_field} = ?"
+        with self.pool.connection() as connection:
+            return connection.execute(sql, (item_id,)).fetchone() is not None
+
+    def _insert(self, connection, table: Table, item: BaseModel, parent_id=None) -> None:
+        try:
+            connection.execute(table.insert_sql, table.row(item, parent_id))
+        except sqlite3.IntegrityError:
+            raise DuplicateIdError(getattr(item, table.id_field))
+        if table.child is not None:
+            item_id = getattr(item, table.id_field)
+            for child in getattr(item, table.child_field):
+                self._insert(connection, table.child, child, item_id)
+
+    def _delete(self, connection, table: Table, item_id: str) -> None:
+        if table.child is not None:
+            sql = f"SELECT {table.child.id_field} FROM {table.child.name} WHERE {table.child.parent_column} = ?"
+            for (child_id,) in connection.execute(sql, (item_id,)).fetchall():
+                self._delete(connection, table.child, child_id)
+        connection.execute(f"DELETE FROM {table.name} WHERE {table.id_field} = ?", (item_id,))
+
+    def _load(self, connection, table: Table, rows: List[tuple]) -> List[BaseModel]:
+        children: Dict[str, list] = {}
+        if table.child is not None and rows:
+            ids = [row[0] for row in rows]
+            child_rows = []
+            # Stay under SQLite's limit on bound parameters per statement.
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                child_rows += connection.execute(
+                    f"{table.child.select_sql} WHERE {table.child.parent_column} IN "
+                    f"({', '.join('?' for _ in chunk)})", chunk).fetchall()
+            link = table.child.columns.index(table.child.parent_column) \
+                if table.child.parent_column in table.child.columns else len(table.child.columns)
+            for child_row, child in zip(child_rows, self._load(connection, table.child, child_rows)):
+                children.setdefault(child_row[link], []).append(child)
+        items = []
+        for row in rows:
+            fields = dict(zip(table.columns, row))
+            if table.child is not None:
+                fields[table.child_field] = children.get(row[0], [])
+            items.append(table.model.model_construct(**fields))
+        return items
+
+    def add(self, item: BaseModel) -> BaseModel:
+        with self.pool.transaction() as connection:
+            self._insert(connection, self.table, item)
+        return item
+
+    def add_many(self, items: List[BaseModel]) -> List[BaseModel]:
+        errors = {}
+        with self.pool.transaction() as connection:
+            for position, item in enumerate(items):
+                # A savepoint per item undoes a partly inserted item (e.g. a
+                # house whose third room is a duplicate) while checking the rest.
+                connection.execute("SAVEPOINT item")
+                try:
+                    self._insert(connection, self.table, item)
+                except DuplicateIdError as error:
+                    connection.execute("ROLLBACK TO item")
+                    errors[position] = f"ID {error.args[0]} already exists"
+                connection.execute("RELEASE item")
+            if errors:
+                raise BulkWriteError(errors)
+        return items
+
+    def update_many(self, changes: List[Tuple[str, Dict[str, object]]]) -> int:
+        errors = {}
+        with self.pool.transaction() as connection:
+            for position, (item_id, fields) in enumerate(changes):
+                for field in fields:
+                    if field not in self.table.columns or field == self.id_field:
+                        raise ValueError(f"Cannot update {self.table.name}.{field}")
+                sql = (f"UPDATE {self.table.name} SET {', '.join(f'{field} = ?' for field in fields)}, "
+                       f"version = version + 1 WHERE {self.id_field} = ?")
+                if connection.execute(sql, (*fields.values(), item_id)).rowcount == 0:
+                    errors[position] = f"ID {item_id} not found"
+            if errors:
+                raise BulkWriteError(errors)
+        return len(changes)
+
+    def replace(self, item: BaseModel) -> BaseModel:
+        with self.pool.transaction() as connection:
+            self._delete(connection, self.table, getattr(item, self.id_field))
+            self._insert(connection, self.table, item)
+        return item
+
+    def remove(self, item_id: str) -> Optional[BaseModel]:
+        with self.pool.transaction() as connection:
+            items, _ = self._select(connection, {self.id_field: item_id})
+            if items:
+                self._delete(connection, self.table, item_id)
+        return items[0] if items else None
+
+    def _select(self, connection, criteria: Dict[str, object], after: Optional[int] = None,
+                limit: Optional[int] = None) -> Tuple[List[BaseModel], Optional[int]]:
+        for field in criteria:
+            if field not in self.table.columns:
+                raise ValueError(f"Unknown field for {self.table.name}: {field}")
+        conditions = [f"{field} = ?" for field in criteria]
+        params = list(criteria.values())
+        if after is not None:
+            conditions.append("seq > ?")
+            params.append(after)
+        sql = self.table.page_sql
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY seq"
+        if limit is not None:
+            # One extra row tells whether another page follows.
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+        rows = connection.execute(sql, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1][-1]
+        return self._load(connection, self.table, rows), next_cursor
+
+    def get(self, item_id: str) -> Optional[BaseModel]:
+        with self.pool.connection() as connection:
+            items, _ = self._select(connection, {self.id_field: item_id})
+        return items[0] if items else None
+
+    def version(self, item_id: str) -> Optional[str]:
+        sql = f"SELECT seq, version FROM {self.table.name} WHERE {self.id_field} = ?"
+        with self.pool.connection() as connection:
+            row = connection.execute(sql, (item_id,)).fetchone()
+        return None if row is None else f"{row[0]}.{row[1]}"
+
+    def all(self) -> List[BaseModel]:
+        return self.find()
+
+    def find(self, **criteria) -> List[BaseModel]:
+        return self.page(**criteria)[0]
+
+    def page(self, after: Optional[int] = None, limit: Optional[int] = None,
+             **criteria) -> Tuple[List[BaseModel], Optional[int]]:
+        """Same contract as Repository.page; cursors are row seq numbers."""
+        with self.pool.connection() as connection:
+            return self._select(connection, criteria, after, limit)
+
+    def clear(self) -> None:
+        with self.pool.transaction() as connection:
+            connection.execute(f"DELETE FROM {self.table.name}")
+
+
+class SqliteStore:
+    """The four SmarthomeAPIs repositories backed by one SQLite database."""
+
+    def __init__(self, path: str, pool_size: int = 8):
+        self.pool = ConnectionPool(path, pool_size)
+        with self.pool.connection() as connection:
+            _migrate(connection, path)
+        self.users = SqliteRepository(self.pool, USERS)
+        self.houses = SqliteRepository(self.pool, HOUSES)
+        self.rooms = SqliteRepository(self.pool, ROOMS)
+        self.devices = SqliteRepository(self.pool, DEVICES)
+
+    def close(self) -> None:
+        self.pool.close()
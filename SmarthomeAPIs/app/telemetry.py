@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+import numpy as np
+
+STATUSES = ("off", "on", "idle")
+STATUS_CODES = {name: code for code, name in enumerate(STATUSES)}
+DAY = 86400.0
+INITIAL_CAPACITY = 64
+
+
+class Segment:
+    """Status changes of one device within one time window, as two growing columns."""
+
+    __slots__ = ("start", "times", "codes", "size")
+
+    def __init__(self, start: float, capacity: int = INITIAL_CAPACITY):
+        self.start = start
+        self.times = np.empty(capacity, np.float64)
+        self.codes = np.empty(capacity, np.int8)
+        self.size = 0
+
+    def append(self, timestamp: float, code: int) -> None:
+        if self.size == len(self.times):
+            self.times = np.resize(self.times, 2 * self.size)
+            self.codes = np.resize(self.codes, 2 * self.size)
+        self.times[self.size] = timestamp
+        self.codes[self.size] = code
+        self.size += 1
+
+    def columns(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self.times[:self.size], self.codes[:self.size]
+
+
+class Series:
+    """All segments of one device: sealed ones in time order, then the active one.
+
+    Sealed segments are (times, codes) arrays in memory, or file paths that
+    are memory-mapped when read.
+    """
+
+    __slots__ = ("sealed", "active")
+
+    def __init__(self):
+        self.sealed: List[object] = []
+        self.active: Optional[Segment] = None
+
+
+class TelemetryStore:
+    """Append-only history of device status changes.
+
+    Each device's changes are stored column-wise (float64 timestamps, int8
+    status codes) in segments covering `segment_seconds` of time. Appending
+    writes into preallocated arrays; once a change falls into a later
+    window, the active segment is sealed and, if `directory` is given,
+    written to disk as .npy files and dropped from memory. Reads return
+    plain arrays, so aggregates are computed with NumPy rather than loops
+    over records.
+    """
+
+    def __init__(self, directory: Optional[str] = None, segment_seconds: float = DAY):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self._series: Dict[str, Series] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, device_id: str) -> str:
+        # Quoted and prefixed so that no device ID can name another directory.
+        return os.path.join(self.directory, "d-" + quote(device_id, safe=""))
+
+    def _get_series(self, device_id: str) -> Series:
+        series = self._series.get(device_id)
+        if series is None:
+            series = self._series[device_id] = Series()
+            if self.directory is not None and os.path.isdir(self._path(device_id)):
+                names = [name[:-len("-times.npy")] for name in os.listdir(self._path(device_id))
+                         if name.endswith("-times.npy")]
+                series.sealed = [os.path.join(self._path(device_id), name) for name in sorted(names, key=int)]
+        return series
+
+    def _seal(self, device_id: str, series: Series) -> None:
+        times, codes = series.active.columns()
+        series.active = None
+        if self.directory is None:
+            series.sealed.append((times.copy(), codes.copy()))
+            return
+        os.makedirs(self._path(device_id), exist_ok=True)
+        # Named by the first change in microseconds, which orders segments on reload.
+        path = os.path.join(self._path(device_id), str(int(times[0] * 1e6)))
+        np.save(path + "-codes.npy", codes)
+        np.save(path + "-times.npy", times)
+        series.sealed.append(path)
+
+    def record(self, device_id: str, status: str, timestamp: Optional[float] = None) -> None:
+        self.record_many([(device_id, status)], timestamp)
+
+    def record_many(self, changes: Iterable[Tuple[str, str]], timestamp: Optional[float] = None) -> None:
+        """Append (device_id, status) changes, all at `timestamp` (default: now)."""
+        timestamp = time.time() if timestamp is None else timestamp
+        window = timestamp - timestamp % self.segment_seconds
+        with self._lock:
+            for device_id, status in changes:
+                series = self._get_series(device_id)
+                active = series.active
+                if active is not None and window > active.start:
+                    self._seal(device_id, series)
+                    active = None
+                if active is None:
+                    active = series.active = Segment(window)
+                # Keeps each series sorted even if the clock steps back.
+                if active.size and timestamp < active.times[active.size - 1]:
+                    active.append(active.times[active.size - 1], STATUS_CODES[status])
+                else:
+                    active.append(timestamp, STATUS_CODES[status])
+
+    def close(self) -> None:
+        """Seal every active segment, writing it to disk when a directory is set."""
+        with self._lock:
+            for device_id, series in self._series.items():
+                if series.active is not None:
+                    self._seal(device_id, series)
+
+    def history(self, device_id: str, start: float, end: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Changes with start <= time < end, preceded by the last change before start if any."""
+        with self._lock:
+            series = self._series.get(device_id)
+            if series is None and self.directory is not None:
+                series = self._get_series(device_id)
+            if series is None:
+                return np.empty(0, np.float64), np.empty(0, np.int8)
+            segments = list(series.sealed)
+            if series.active is not None:
+                times, codes = series.active.columns()
+                segments.append((times.copy(), codes.copy()))
+        columns = []
+        for segment in reversed(segments):
+            if isinstance(segment, str):
+                segment = (np.load(segment + "-times.npy", mmap_mode="r"),
+                           np.load(segment + "-codes.npy", mmap_mode="r"))
+            times, codes = segment
+            if len(times) == 0 or times[0] >= end:
+                continue
+            first = np.searchsorted(times, start, side="right") - 1
+            stop = np.searchsorted(times, end, side="left")
+            columns.append((times[max(first, 0):stop], codes[max(first, 0):stop]))
+            if first >= 0:
+                break
+        if not columns:
+            return np.empty(0, np.float64), np.empty(0, np.int8)
+        columns.reverse()
+        return (np.concatenate([times for times, _ in columns]),
+                np.concatenate([codes for _, codes in columns]))
+
+
+def time_in_status(times: np.ndarray, codes: np.ndarray, status: str, boundaries: np.ndarray) -> np.ndarray:
+    """Seconds spent in status between consecutive boundaries.
+
+    times/codes are a device's changes in order; before the first change the
+    device counts as not in status.
+    """
+    if len(times) == 0:
+        return np.zeros(len(boundaries) - 1)
+    inside = codes == STATUS_CODES[status]
+    # accumulated[i]: seconds in status from times[0] to times[i].
+    accumulated = np.concatenate(([0.0], np.cumsum(np.diff(times) * inside[:-1])))
+    last = np.searchsorted(times, boundaries, side="right") - 1
+    clipped = np.maximum(last, 0)
+    total = np.where(last >= 0, accumulated[clipped] + (boundaries - times[clipped]) * inside[clipped], 0.0)
+    return np.diff(total)
+
+
+def status_counts(times: np.ndarray, codes: np.ndarray, boundaries: np.ndarray) -> np.ndarray:
+    """Changes to each status per interval between boundaries, shape (intervals, len(STATUSES))."""
+    intervals = len(boundaries) - 1
+    keep = (times >= boundaries[0]) & (times < boundaries[-1])
+    interval = np.searchsorted(boundaries, times[keep], side="right") - 1
+    counts = np.bincount(interval * len(STATUSES) + codes[keep], minlength=intervals * len(STATUSES))
+    return counts.reshape(intervals, len(STATUSES))
+
+
+telemetry = TelemetryStore(os.environ.get("SMARTHOME_TELEMETRY_DIR"))
@@ -0,0 +1,77 @@
+"""Items/sec of single-device POSTs versus the bulk create and status-update endpoints.
+
+Usage:
+    python benchmark_bulk.py [--items 5000] [--batch-sizes 100,1000,5000]
+
+Requests go through the whole FastAPI stack (routing, body parsing and
+validation, serialization) via an in-process TestClient, so the numbers
+show per-request overhead rather than network cost. Set SMARTHOME_DB to
+measure the SQLite store instead of the in-memory one.
+"""
+import argparse
+import itertools
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+STATUSES = ["on", "off", "idle"]
+_runs = itertools.count()
+
+
+def make_devices(count):
+    run = next(_runs)
+    return [{"device_id": f"bench{run}-{i}", "device_type": "sensor", "status": STATUSES[i % 3]}
+            for i in range(count)]
+
+
+def single_posts(client, items):
+    start = time.perf_counter()
+    for device in make_devices(items):
+        assert client.post("/devices/", json=device).status_code == 200
+    return time.perf_counter() - start
+
+
+def bulk_posts(client, items, batch_size):
+    devices = make_devices(items)
+    start = time.perf_counter()
+    for offset in range(0, items, batch_size):
+        assert client.post("/devices/bulk", json=devices[offset:offset + batch_size]).status_code == 200
+    return time.perf_counter() - start
+
+
+def bulk_status_updates(client, items, batch_size):
+    devices = make_devices(items)
+    client.post("/devices/bulk", json=devices)
+    updates = [{"device_id": device["device_id"], "status": "on"} for device in devices]
+    start = time.perf_counter()
+    for offset in range(0, items, batch_size):
+        assert client.patch("/devices/status", json=updates[offset:offset + batch_size]).status_code == 200
+    return time.perf_counter() - start
+
+
+def report(name, items, elapsed, baseline=None):
+    speedup = f"  {baseline / elapsed:6.1f}x" if baseline else ""
+    print(f"{name:>28} {items / elapsed:>12,.0f} items/s{speedup}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--batch-sizes", default="100,1000,5000")
+    args = parser.parse_args()
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+
+    client = TestClient(app)
+    baseline = single_posts(client, args.items)
+    report("single POST /devices/", args.items, baseline)
+    for batch_size in batch_sizes:
+        report(f"POST /devices/bulk x{batch_size}", args.items, bulk_posts(client, args.items, batch_size), baseline)
+    for batch_size in batch_sizes:
+        report(f"PATCH /devices/status x{batch_size}", args.items,
+               bulk_status_updates(client, args.items, batch_size), baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Read-load benchmark: in-memory Repository versus the SQLite (WAL) store.
+
+Usage:
+    python benchmark_storage.py [--devices 100000] [--ops 20000] [--threads 4] [--processes 4]
+
+Each run loads --devices devices spread over 100 device types, then issues
+--ops reads per worker: 90% get-by-ID and 10% find(device_type=...). The
+in-memory store can only be shared by threads; the SQLite store is also read
+by --processes separate processes, the way uvicorn --workers would.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from app.models import Device
+from app.repository import Repository
+from app.sqlite_store import DEVICES, SqliteStore
+
+DEVICE_TYPES = 100
+STATUSES = ["on", "off", "idle"]
+
+
+def make_devices(count):
+    return [Device(device_id=f"D{i}", device_type=f"type{i % DEVICE_TYPES}", status=STATUSES[i % 3])
+            for i in range(count)]
+
+
+def read_load(repository, ops, device_count, seed):
+    """Run ops reads and return their latencies in seconds."""
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(ops):
+        start = time.perf_counter()
+        if rng.random() < 0.9:
+            repository.get(f"D{rng.randrange(device_count)}")
+        else:
+            repository.find(device_type=f"type{rng.randrange(DEVICE_TYPES)}")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run_threads(repository, threads, ops, device_count):
+    results = [None] * threads
+
+    def work(i):
+        results[i] = read_load(repository, ops, device_count, seed=i)
+
+    workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start, [latency for result in results for latency in result]
+
+
+def _process_reader(path, ops, device_count, seed, barrier, queue):
+    store = SqliteStore(path)
+    barrier.wait()
+    start = time.perf_counter()
+    latencies = read_load(store.devices, ops, device_count, seed)
+    queue.put((time.perf_counter() - start, latencies))
+    store.close()
+
+
+def run_processes(path, processes, ops, device_count):
+    """Read from separate processes, timing only the reads.
+
+    Every process starts up and opens the store before a barrier releases
+    them together, so interpreter start-up and imports are not counted.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    barrier = ctx.Barrier(processes)
+    workers = [ctx.Process(target=_process_reader, args=(path, ops, device_count, i, barrier, queue))
+               for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    results = [queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    # All readers start together, so the run lasts as long as the slowest one.
+    return max(elapsed for elapsed, _ in results), [latency for _, result in results for latency in result]
+
+
+def report(name, elapsed, latencies):
+    p50, p99 = (statistics.quantiles(latencies, n=100)[i] for i in (49, 98))
+    print(f"{name:>26} {len(latencies) / elapsed:>12,.0f} ops/s "
+          f"p50 {p50 * 1e6:>8.1f} us  p99 {p99 * 1e6:>8.1f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=100000)
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    devices = make_devices(args.devices)
+    memory = Repository("device_id", ["status", "device_type"])
+    for device in devices:
+        memory.add(device)
+
+    report("memory, 1 thread", *run_threads(memory, 1, args.ops, args.devices))
+    report(f"memory, {args.threads} threads", *run_threads(memory, args.threads, args.ops, args.devices))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "smarthome.db")
+        store = SqliteStore(path, pool_size=args.threads)
+        with store.pool.transaction() as connection:
+            connection.executemany(DEVICES.insert_sql, [DEVICES.row(device) for device in devices])
+        report("sqlite, 1 thread", *run_threads(store.devices, 1, args.ops, args.devices))
+        report(f"sqlite, {args.threads} threads", *run_threads(store.devices, args.threads, args.ops, args.devices))
+        report(f"sqlite, {args.processes} processes", *run_processes(path, args.processes, args.ops, args.devices))
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
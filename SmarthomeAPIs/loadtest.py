@@ -0,0 +1,365 @@
+'''
+In-process load test for the SmarthomeAPIs app and bookapi.
+
+Requests go through an httpx ASGI transport straight into the FastAPI app, so
+there is no network or server process: every millisecond measured is spent in
+routing, validation, the endpoints and serialization. Each app is seeded with
+data and then driven by a weighted mix of reads and writes at each
+--concurrency level (that many clients, each sending its next request as soon
+as the previous one returns) for --requests requests.
+
+For every app and level the report has p50/p95/p99 latency, throughput, the
+error count and RSS growth, plus per-operation latencies. A saved JSON report
+can be used as a baseline: a p95 or p99 that got slower, or a throughput that
+dropped, by more than --threshold is flagged and the exit status is 1.
+
+    python loadtest.py --concurrency 1 8 32 --requests 2000 --json baseline.json
+    python loadtest.py --concurrency 1 8 32 --requests 2000 --baseline baseline.json --threshold 0.2
+'''
+import abc
+import argparse
+import asyncio
+import gc
+import importlib.util
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import time
+
+import httpx
+
+from pr import percentile, write_json
+
+BOOKAPI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bookapi', 'main.py')
+STATUSES = ['on', 'off', 'idle']
+_runs = itertools.count()
+
+
+def rss_bytes():
+    '''
+    Current resident set size; peak RSS where /proc is not available.
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Scenario(abc.ABC):
+    '''
+    An app, how to seed it and the weighted operations of its request mix.
+
+    Each operation is an async method taking (client, rng) that sends one or
+    more requests and raises AssertionError on an unexpected response.
+    '''
+    name = None
+    operations = {}
+
+    @abc.abstractmethod
+    def load_app(self):
+        pass
+
+    async def setup(self, client):
+        pass
+
+    def pick(self, rng):
+        names = list(self.operations)
+        return rng.choices(names, weights=[self.operations[name] for name in names])[0]
+
+
+def expect(response, *statuses):
+    assert response.status_code in statuses, f'{response.request.method} {response.request.url.path}: ' \
+                                             f'{response.status_code} {response.text[:200]}'
+
+
+class SmarthomeScenario(Scenario):
+    '''
+    Dashboards reading devices and whole houses (partly with ETags), hubs
+    pushing batches of status changes, and new devices being installed.
+    '''
+    name = 'smarthome'
+    operations = {'get_device': 35, 'list_devices': 10, 'get_house': 20, 'get_house_cached': 15,
+                  'bulk_status': 10, 'create_device': 10}
+
+    def __init__(self, houses=50, rooms_per_house=5, devices_per_room=10):
+        self.houses, self.rooms_per_house, self.devices_per_room = houses, rooms_per_house, devices_per_room
+        self.prefix = f'lt{os.getpid()}-{next(_runs)}-'
+        self.new_ids = itertools.count()
+        self.etags = {}
+
+    def load_app(self):
+        from app.main import app
+        return app
+
+    async def setup(self, client):
+        self.house_ids, self.room_ids, self.device_ids = [], [], []
+        for h in range(self.houses):
+            house_id = f'{self.prefix}H{h}'
+            rooms = []
+            for r in range(self.rooms_per_house):
+                room_id = f'{house_id}R{r}'
+                devices = [{'device_id': f'{room_id}D{d}', 'device_type': f'type{d}', 'status': STATUSES[d % 3]}
+                           for d in range(self.devices_per_room)]
+                rooms.append({'room_id': room_id, 'name': f'Room {r}', 'devices': devices})
+                self.room_ids.append(room_id)
+                self.device_ids += [device['device_id'] for device in devices]
+            expect(await client.post('/houses/', json={'house_id': house_id, 'address': f'{h} Load Street',
+                                                       'owner_id': f'{self.prefix}U{h % 10}', 'rooms': rooms}), 200)
+            self.house_ids.append(house_id)
+
+    async def get_device(self, client, rng):
+        expect(await client.get(f'/devices/{rng.choice(self.device_ids)}'), 200)
+
+    async def list_devices(self, client, rng):
+        expect(await client.get('/devices/', params={'status': rng.choice(STATUSES), 'limit': 100}), 200)
+
+    async def get_house(self, client, rng):
+        expect(await client.get(f'/houses/{rng.choice(self.house_ids)}'), 200)
+
+    async def get_house_cached(self, client, rng):
+        house_id = rng.choice(self.house_ids)
+        headers = {'If-None-Match': self.etags[house_id]} if house_id in self.etags else {}
+        response = await client.get(f'/houses/{house_id}', headers=headers)
+        expect(response, 200, 304)
+        self.etags[house_id] = response.headers['ETag']
+
+    async def bulk_status(self, client, rng):
+        updates = [{'device_id': device_id, 'status': rng.choice(STATUSES)}
+                   for device_id in rng.sample(self.device_ids, 20)]
+        expect(await client.patch('/devices/status', json=updates), 200)
+
+    async def create_device(self, client, rng):
+        device = {'device_id': f'{self.prefix}N{next(self.new_ids)}', 'device_type': 'sensor',
+                  'status': rng.choice(STATUSES), 'room_id': rng.choice(self.room_ids)}
+        expect(await client.post('/devices/', json=device), 200)
+
+
+class BookScenario(Scenario):
+    '''
+    Mostly single-book reads, some full listings and searches, and a steady
+    trickle of new, edited and short-lived books.
+    '''
+    name = 'bookapi'
+    operations = {'get_book': 45, 'list_books': 10, 'search_books': 10, 'create_book': 15, 'update_book': 15,
+                  'churn_book': 5}
+
+    def __init__(self, books=1000):
+        self.books = books
+        # bookapi IDs are ints; each run takes a block of its own.
+        self.new_ids = itertools.count(10_000_000 * (next(_runs) + 1))
+
+    def load_app(self):
+        module = sys.modules.get('bookapi_main')
+        if module is None:
+            spec = importlib.util.spec_from_file_location('bookapi_main', BOOKAPI_PATH)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            sys.modules['bookapi_main'] = module
+        return module.app
+
+    def book(self, book_id, rng):
+        return {'id': book_id, 'title': f'Title {book_id}', 'author': f'Author {rng.randrange(100)}',
+                'description': 'Load test book'}
+
+    async def setup(self, client):
+        rng = random.Random(0)
+        self.book_ids = []
+        for _ in range(self.books):
+            book_id = next(self.new_ids)
+            expect(await client.post('/books', json=self.book(book_id, rng)), 200)
+            self.book_ids.append(book_id)
+
+    async def get_book(self, client, rng):
+        expect(await client.get(f'/books/{rng.choice(self.book_ids)}'), 200)
+
+    async def list_books(self, client, rng):
+        expect(await client.get('/books'), 200)
+
+    async def search_books(self, client, rng):
+        expect(await client.get('/books/search', params={'q': f'author {rng.randrange(100)}'}), 200)
+
+    async def create_book(self, client, rng):
+        book_id = next(self.new_ids)
+        expect(await client.post('/books', json=self.book(book_id, rng)), 200)
+        self.book_ids.append(book_id)
+
+    async def update_book(self, client, rng):
+        book_id = rng.choice(self.book_ids)
+        expect(await client.put(f'/books/{book_id}', json=self.book(book_id, rng)), 200)
+
+    async def churn_book(self, client, rng):
+        book_id = next(self.new_ids)
+        expect(await client.post('/books', json=self.book(book_id, rng)), 200)
+        expect(await client.delete(f'/books/{book_id}'), 200)
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (SmarthomeScenario, BookScenario)}
+
+
+def latency_summary(latencies):
+    return {
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'max': max(latencies),
+    }
+
+
+async def run_level(scenario, client, concurrency, requests, seed):
+    '''
+    Send `requests` operations from `concurrency` concurrent clients.
+    '''
+    remaining = itertools.count()
+    latencies = {name: [] for name in scenario.operations}
+    errors = []
+
+    async def user(rng):
+        while next(remaining) < requests:
+            name = scenario.pick(rng)
+            start = time.perf_counter()
+            try:
+                await getattr(scenario, name)(client, rng)
+            except AssertionError as error:
+                errors.append(str(error))
+            latencies[name].append(time.perf_counter() - start)
+
+    gc.collect()
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    await asyncio.gather(*(user(random.Random(seed * 1000 + i)) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    every = [latency for values in latencies.values() for latency in values]
+    return dict(
+        app=scenario.name, concurrency=concurrency, requests=len(every), errors=len(errors),
+        elapsed=elapsed, throughput=len(every) / elapsed, rss_growth=rss_bytes() - rss_before,
+        **latency_summary(every),
+        operations={name: dict(count=len(values), **latency_summary(values))
+                    for name, values in latencies.items() if values},
+        first_errors=errors[:5],
+    )
+
+
+async def run_app(scenario, concurrency_levels, requests, warmup, seed):
+    transport = httpx.ASGITransport(app=scenario.load_app())
+    async with httpx.AsyncClient(transport=transport, base_url='http://loadtest') as client:
+        rss_start = rss_bytes()
+        await scenario.setup(client)
+        if warmup:
+            await run_level(scenario, client, 1, warmup, seed)
+        results = []
+        for concurrency in concurrency_levels:
+            results.append(await run_level(scenario, client, concurrency, requests, seed))
+        for result in results:
+            result['rss_since_start'] = rss_bytes() - rss_start
+        return results
+
+
+def run(apps, concurrency_levels, requests, warmup=50, seed=0):
+    results = []
+    for name in apps:
+        results += asyncio.run(run_app(SCENARIOS[name](), concurrency_levels, requests, warmup, seed))
+    return results
+
+
+def compare(results, baseline, threshold):
+    '''
+    p95/p99 latencies more than `threshold` (a fraction) above the baseline's,
+    and throughputs more than `threshold` below it, for the same app and
+    concurrency.
+    '''
+    base = {(result['app'], result['concurrency']): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = base.get((result['app'], result['concurrency']))
+        if before is None:
+            continue
+        for metric in ('p95', 'p99'):
+            if before[metric] and result[metric] > before[metric] * (1 + threshold):
+                regressions.append({'app': result['app'], 'concurrency': result['concurrency'], 'metric': metric,
+                                    'baseline': before[metric], 'value': result[metric],
+                                    'ratio': result[metric] / before[metric]})
+        if before['throughput'] and result['throughput'] < before['throughput'] / (1 + threshold):
+            regressions.append({'app': result['app'], 'concurrency': result['concurrency'], 'metric': 'throughput',
+                                'baseline': before['throughput'], 'value': result['throughput'],
+                                'ratio': result['throughput'] / before['throughput']})
+    return regressions
+
+
+def print_table(results):
+    print(f"{'app':<10} {'conc':>5} {'requests':>9} {'errors':>6} {'req/s':>10} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RSS +MiB':>9}")
+    for r in results:
+        print(f"{r['app']:<10} {r['concurrency']:>5} {r['requests']:>9} {r['errors']:>6} {r['throughput']:>10.0f} "
+              f"{r['p50'] * 1e3:>8.2f} {r['p95'] * 1e3:>8.2f} {r['p99'] * 1e3:>8.2f} {r['rss_growth'] / 2**20:>9.1f}")
+
+
+def metadata(args):
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': sys.version,
+        'platform': platform.platform(),
+        'cpu_count': multiprocessing.cpu_count(),
+        'apps': args.apps,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'warmup': args.warmup,
+        'seed': args.seed,
+        'storage': 'sqlite' if os.environ.get('SMARTHOME_DB') else 'memory',
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='In-process load test for SmarthomeAPIs and bookapi.')
+    parser.add_argument('--apps', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--requests', type=int, default=2000, help='requests per concurrency level')
+    parser.add_argument('--warmup', type=int, default=100, help='requests sent before measuring')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="write the full report here ('-' for stdout)")
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.20,
+                        help='p95/p99 slowdown or throughput drop flagged as a regression (default 0.20)')
+    parser.add_argument('--quiet', action='store_true', help='do not print the table')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args.apps, args.concurrency, args.requests, args.warmup, args.seed)
+    report = {'metadata': metadata(args), 'results': results}
+    if not args.quiet:
+        print_table(results)
+    if args.json:
+        write_json(report, args.json)
+    status = 0
+    for result in results:
+        for error in result['first_errors']:
+            print(f"ERROR {result['app']} concurrency={result['concurrency']}: {error}", file=sys.stderr)
+        if result['errors']:
+            status = 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key in ('requests', 'cpu_count', 'storage'):
+            if baseline['metadata'].get(key) != report['metadata'][key]:
+                print(f'warning: baseline {key}={baseline["metadata"].get(key)} differs from '
+                      f'this run ({report["metadata"][key]})', file=sys.stderr)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print('REGRESSION {app} concurrency={concurrency} {metric}: {value:.6g} vs baseline '
+                  '{baseline:.6g} ({ratio:.2f}x)'.format(**regression), file=sys.stderr)
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,37 @@
+'''
+Concurrency benchmark: CPU-bound and I/O-bound work on threads, processes,
+executor pools and asyncio, for 1..2*cpu_count workers.
+
+Every configuration gets warmup runs and then repeated timed trials
+(time.perf_counter); the table shows the median and the JSON/CSV output keeps
+every trial plus percentile statistics. A saved JSON report can be used as
+a baseline: medians that got slower by more than --threshold are flagged and
+the exit status is 1.
+
+--overhead splits process costs apart for each start method (fork, spawn,
+forkserver): start-up of bare processes and of a pool, the IPC round trip
+to a running pool, and compute on a running pool versus a fresh process per
+task, plus how many batches it takes for a persistent pool to pay off.
+
+    python pr.py 100000 --repeats 7 --json baseline.json
+    python pr.py 100000 --repeats 7 --baseline baseline.json --threshold 0.1
+    python pr.py 100000 --overhead --start-methods fork spawn
+'''
+import argparse
+import asyncio
+import csv
+import functools
+import json
+import math
 import multiprocessing
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
 import threading
 import time
-import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 def cpu_func(result, niters):
     '''
@@ -43,30 +73,355 @@ class IoProcess(multiprocessing.Process):
     def run(self):
         time.sleep(self.sleep)
 
-if __name__ == '__main__':
-    cpu_n_iters = int(sys.argv[1])
-    sleep = 1
+def cpu_task(niters):
+    return cpu_func(1, niters)
+
+def io_task(sleep):
+    time.sleep(sleep)
+    return sleep
+
+def run_workers(worker_class, nworkers, work_size):
+    '''
+    Start nworkers Thread/Process subclasses and wait for all of them.
+    '''
+    workers = [worker_class(work_size) for _ in range(nworkers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+def run_pool(executor_class, task, nworkers, work_size):
+    '''
+    Create an executor with nworkers workers and run one task per worker.
+    '''
+    with executor_class(max_workers=nworkers) as pool:
+        list(pool.map(task, [work_size] * nworkers))
+
+async def _cpu_coroutine(niters):
+    return cpu_func(1, niters)
+
+def run_asyncio_cpu(nworkers, niters):
+    '''
+    CPU work as asyncio tasks: they share one thread, so they run one after another.
+    '''
+    async def main():
+        await asyncio.gather(*(_cpu_coroutine(niters) for _ in range(nworkers)))
+    asyncio.run(main())
+
+def run_asyncio_io(nworkers, sleep):
+    async def main():
+        await asyncio.gather(*(asyncio.sleep(sleep) for _ in range(nworkers)))
+    asyncio.run(main())
+
+# name -> (kind of work, runner(nworkers, work_size)); kind picks the work size.
+EXECUTORS = {
+    'CpuThread': ('cpu', functools.partial(run_workers, CpuThread)),
+    'CpuProcess': ('cpu', functools.partial(run_workers, CpuProcess)),
+    'IoThread': ('io', functools.partial(run_workers, IoThread)),
+    'IoProcess': ('io', functools.partial(run_workers, IoProcess)),
+    'CpuThreadPool': ('cpu', functools.partial(run_pool, ThreadPoolExecutor, cpu_task)),
+    'CpuProcessPool': ('cpu', functools.partial(run_pool, ProcessPoolExecutor, cpu_task)),
+    'IoThreadPool': ('io', functools.partial(run_pool, ThreadPoolExecutor, io_task)),
+    'IoProcessPool': ('io', functools.partial(run_pool, ProcessPoolExecutor, io_task)),
+    'CpuAsyncio': ('cpu', run_asyncio_cpu),
+    'IoAsyncio': ('io', run_asyncio_io),
+}
+# Executors whose behaviour depends on the GIL, rerun under a free-threaded interpreter.
+THREAD_EXECUTORS = ['CpuThread', 'CpuThreadPool', 'IoThread', 'IoThreadPool']
+FREE_THREADED_SUFFIX = '[free-threaded]'
+FREE_THREADED_PYTHONS = ['python3.14t', 'python3.13t']
+
+def measure(runner, nworkers, work_size, warmup, repeats):
+    '''
+    Wall time in seconds of each of `repeats` runs, after `warmup` untimed runs.
+    '''
+    for _ in range(warmup):
+        runner(nworkers, work_size)
+    trials = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        runner(nworkers, work_size)
+        trials.append(time.perf_counter() - start)
+    return trials
+
+def percentile(values, q):
+    '''
+    q-th percentile (0-100) of values, interpolating linearly between ranks.
+    '''
+    values = sorted(values)
+    rank = (len(values) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+def summarize(trials):
+    return {
+        'min': min(trials),
+        'median': statistics.median(trials),
+        'mean': statistics.fmean(trials),
+        'stdev': statistics.stdev(trials) if len(trials) > 1 else 0.0,
+        'p90': percentile(trials, 90),
+        'p95': percentile(trials, 95),
+        'max': max(trials),
+    }
+
+def gil_enabled():
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+def metadata(args):
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': sys.version,
+        'implementation': platform.python_implementation(),
+        'gil_enabled': gil_enabled(),
+        'platform': platform.platform(),
+        'cpu_count': multiprocessing.cpu_count(),
+        'start_method': multiprocessing.get_start_method(),
+        'cpu_n_iters': args.cpu_n_iters,
+        'sleep': args.sleep,
+        'warmup': args.warmup,
+        'repeats': args.repeats,
+    }
+
+def run_suite(executors, worker_counts, cpu_n_iters, sleep, warmup, repeats):
+    results = []
+    for nworkers in worker_counts:
+        for name in executors:
+            kind, runner = EXECUTORS[name]
+            work_size = cpu_n_iters if kind == 'cpu' else sleep
+            trials = measure(runner, nworkers, work_size, warmup, repeats)
+            results.append({'executor': name, 'nworkers': nworkers, 'trials': trials, **summarize(trials)})
+    return results
+
+def noop(_=None):
+    return None
+
+def run_context_processes(ctx, target, args, nworkers):
+    '''
+    Start nworkers processes of the given multiprocessing context and wait for them.
+    '''
+    processes = [ctx.Process(target=target, args=args) for _ in range(nworkers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+def start_pool(ctx, nworkers):
+    '''
+    Create a process pool and wait until it has answered nworkers no-op tasks.
+    '''
+    pool = ProcessPoolExecutor(max_workers=nworkers, mp_context=ctx)
+    list(pool.map(noop, range(nworkers)))
+    return pool
+
+def measure_pool_start(ctx, nworkers, warmup, repeats):
+    '''
+    Like measure() for start_pool; shutting the pool down is not timed.
+    '''
+    trials = []
+    for trial in range(warmup + repeats):
+        start = time.perf_counter()
+        pool = start_pool(ctx, nworkers)
+        elapsed = time.perf_counter() - start
+        pool.shutdown()
+        if trial >= warmup:
+            trials.append(elapsed)
+    return trials
+
+# Components reported by --overhead for each start method:
+#   ProcessStart    start and join nworkers processes that do nothing
+#   PoolStart       create a pool and get one answer from each of its processes
+#   IpcRoundTrip    nworkers no-op tasks on an already running pool
+#   PoolCompute     nworkers cpu tasks on an already running pool
+#   ProcessCompute  nworkers cpu tasks, one fresh process each (what CpuProcess does)
+OVERHEAD_COMPONENTS = ['ProcessStart', 'PoolStart', 'IpcRoundTrip', 'PoolCompute', 'ProcessCompute']
+
+def run_overhead(start_methods, worker_counts, cpu_n_iters, warmup, repeats):
+    '''
+    Time each OVERHEAD_COMPONENTS entry per start method, reported as
+    "<component>[<start method>]" results.
+    '''
+    results = []
+    for method in start_methods:
+        ctx = multiprocessing.get_context(method)
+        for nworkers in worker_counts:
+            trials = {
+                'ProcessStart': measure(lambda n, _: run_context_processes(ctx, noop, (), n),
+                                        nworkers, None, warmup, repeats),
+                'PoolStart': measure_pool_start(ctx, nworkers, warmup, repeats),
+                'ProcessCompute': measure(lambda n, w: run_context_processes(ctx, cpu_task, (w,), n),
+                                          nworkers, cpu_n_iters, warmup, repeats),
+            }
+            pool = start_pool(ctx, nworkers)
+            try:
+                trials['IpcRoundTrip'] = measure(lambda n, _: list(pool.map(noop, range(n))),
+                                                 nworkers, None, warmup, repeats)
+                trials['PoolCompute'] = measure(lambda n, w: list(pool.map(cpu_task, [w] * n)),
+                                                nworkers, cpu_n_iters, warmup, repeats)
+            finally:
+                pool.shutdown()
+            for component in OVERHEAD_COMPONENTS:
+                results.append({'executor': f'{component}[{method}]', 'nworkers': nworkers,
+                                'trials': trials[component], **summarize(trials[component])})
+    return results
+
+def break_even(results):
+    '''
+    For each start method and worker count, how many batches of nworkers tasks
+    it takes before a persistent pool (PoolStart once, then PoolCompute per
+    batch) beats a fresh process per task (ProcessCompute per batch).
+    '''
+    medians = {(result['executor'], result['nworkers']): result['median'] for result in results}
+    rows = []
+    for executor, nworkers in medians:
+        if not executor.startswith('PoolStart['):
+            continue
+        method = executor[len('PoolStart['):-1]
+        saving = medians[(f'ProcessCompute[{method}]', nworkers)] - medians[(f'PoolCompute[{method}]', nworkers)]
+        pool_start = medians[(executor, nworkers)]
+        rows.append({'start_method': method, 'nworkers': nworkers, 'pool_start': pool_start,
+                     'saving_per_batch': saving,
+                     'break_even_batches': math.ceil(pool_start / saving) if saving > 0 else None})
+    return rows
+
+def find_free_threaded_python(requested):
+    '''
+    Path of a free-threaded interpreter: `requested`, or the first one on PATH for "auto".
+    '''
+    if requested != 'auto':
+        return requested
+    for name in FREE_THREADED_PYTHONS:
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+def run_free_threaded(python, args):
+    '''
+    Rerun the thread executors under another interpreter and tag their results.
+    '''
+    executors = [name for name in args.executors if name in THREAD_EXECUTORS]
+    if not executors:
+        return []
+    command = [python, __file__, str(args.cpu_n_iters), '--sleep', str(args.sleep),
+               '--warmup', str(args.warmup), '--repeats', str(args.repeats),
+               '--workers', *map(str, args.workers), '--executors', *executors,
+               '--json', '-', '--quiet']
+    report = json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout)
+    if report['metadata']['gil_enabled']:
+        print(f'{python} runs with the GIL enabled; skipping free-threaded results', file=sys.stderr)
+        return []
+    for result in report['results']:
+        result['executor'] += FREE_THREADED_SUFFIX
+    return report['results']
+
+def print_table(results):
+    executors = list(dict.fromkeys(result['executor'] for result in results))
+    medians = {(result['executor'], result['nworkers']): result['median'] for result in results}
+    print(' '.join(['nthreads'] + executors))
+    for nworkers in sorted({result['nworkers'] for result in results}):
+        row = [nworkers] + [medians.get((name, nworkers), float('nan')) for name in executors]
+        print(' '.join([str(row[0])] + ['{:.6e}'.format(value) for value in row[1:]]))
+
+def write_json(report, path):
+    text = json.dumps(report, indent=2)
+    if path == '-':
+        print(text)
+    else:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+
+CSV_FIELDS = ['executor', 'nworkers', 'min', 'median', 'mean', 'stdev', 'p90', 'p95', 'max']
+
+def write_csv(results, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+
+def compare(results, baseline, threshold):
+    '''
+    Results whose median is more than `threshold` (a fraction) slower than the
+    baseline's median for the same executor and worker count.
+    '''
+    base = {(result['executor'], result['nworkers']): result['median'] for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = base.get((result['executor'], result['nworkers']))
+        if before and result['median'] > before * (1 + threshold):
+            regressions.append({'executor': result['executor'], 'nworkers': result['nworkers'],
+                                'baseline': before, 'median': result['median'],
+                                'ratio': result['median'] / before})
+    return regressions
+
+def parse_args(argv=None):
     cpu_count = multiprocessing.cpu_count()
-    input_params = [
-        (CpuThread, cpu_n_iters),
-        (CpuProcess, cpu_n_iters),
-        (IoThread, sleep),
-        (IoProcess, sleep),
-    ]
-    header = ['nthreads']
-    for thread_class, _ in input_params:
-        header.append(thread_class.__name__)
-    print(' '.join(header))
-    for nthreads in range(1, 2 * cpu_count):
-        results = [nthreads]
-        for thread_class, work_size in input_params:
-            start_time = time.time()
-            threads = []
-            for i in range(nthreads):
-                thread = thread_class(work_size)
-                threads.append(thread)
-                thread.start()
-            for i, thread in enumerate(threads):
-                thread.join()
-            results.append(time.time() - start_time)
-        print(' '.join('{:.6e}'.format(result) for result in results))
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Thread/process/asyncio concurrency benchmark.')
+    parser.add_argument('cpu_n_iters', type=int, nargs='?', default=100000)
+    parser.add_argument('--sleep', type=float, default=1, help='seconds slept by each I/O task')
+    parser.add_argument('--workers', type=int, nargs='+', default=list(range(1, 2 * cpu_count)))
+    parser.add_argument('--executors', nargs='+', choices=list(EXECUTORS), default=list(EXECUTORS))
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--json', help="write the full report here ('-' for stdout)")
+    parser.add_argument('--csv', help='write per-configuration statistics here')
+    parser.add_argument('--baseline', help='JSON report to compare medians against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='slowdown fraction flagged as a regression (default 0.10)')
+    parser.add_argument('--free-threaded', metavar='PYTHON',
+                        help="also run the thread executors under this free-threaded interpreter ('auto' to search PATH)")
+    parser.add_argument('--overhead', action='store_true',
+                        help='separate process start-up, IPC round trip and steady-state compute '
+                             'per start method instead of running the executors')
+    parser.add_argument('--start-methods', nargs='+', choices=multiprocessing.get_all_start_methods(),
+                        default=multiprocessing.get_all_start_methods())
+    parser.add_argument('--quiet', action='store_true', help='do not print the table')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.overhead:
+        results = run_overhead(args.start_methods, args.workers, args.cpu_n_iters, args.warmup, args.repeats)
+    else:
+        results = run_suite(args.executors, args.workers, args.cpu_n_iters, args.sleep, args.warmup, args.repeats)
+    if args.free_threaded and not args.overhead:
+        python = find_free_threaded_python(args.free_threaded)
+        if python is None:
+            print('No free-threaded interpreter found; skipping', file=sys.stderr)
+        else:
+            results += run_free_threaded(python, args)
+    report = {'metadata': metadata(args), 'results': results}
+    if args.overhead:
+        report['break_even'] = break_even(results)
+
+    if not args.quiet:
+        print_table(results)
+        for row in report.get('break_even', []):
+            if row['break_even_batches'] is None:
+                verdict = 'a fresh process per task is never slower'
+            else:
+                verdict = f"a persistent pool wins after {row['break_even_batches']} batch(es)"
+            print(f"{row['start_method']}, {row['nworkers']} workers: pool start "
+                  f"{row['pool_start']:.3e}s, saves {row['saving_per_batch']:.3e}s per batch; {verdict}")
+    if args.json:
+        write_json(report, args.json)
+    if args.csv:
+        write_csv(results, args.csv)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key in ('cpu_n_iters', 'sleep', 'cpu_count'):
+            if baseline['metadata'].get(key) != report['metadata'][key]:
+                print(f'warning: baseline {key}={baseline["metadata"].get(key)} differs from '
+                      f'this run ({report["metadata"][key]})', file=sys.stderr)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print('REGRESSION {executor} nworkers={nworkers}: median {median:.6e}s vs baseline '
+                  '{baseline:.6e}s ({ratio:.2f}x)'.format(**regression), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
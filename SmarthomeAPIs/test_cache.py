@@ -0,0 +1,52 @@
+from fastapi.testclient import TestClient
+from app.cache import ResponseCache, etag_matches
+from app.main import app
+from app.models import Device
+from app.repository import Repository
+
+client = TestClient(app)
+
+def test_conditional_get_returns_304_until_the_device_changes():
+    client.post("/devices/", json={"device_id": "D950", "device_type": "light", "status": "off"})
+    first = client.get("/devices/D950")
+    etag = first.headers["ETag"]
+    assert first.json() == {"device_id": "D950", "device_type": "light", "status": "off", "room_id": None}
+    hits = client.get("/cache/stats").json()["hits"]
+    assert client.get("/devices/D950").content == first.content
+    assert client.get("/cache/stats").json()["hits"] == hits + 1
+
+    not_modified = client.get("/devices/D950", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304 and not_modified.headers["ETag"] == etag
+
+    client.patch("/devices/status", json=[{"device_id": "D950", "status": "on"}])
+    changed = client.get("/devices/D950", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.json()["status"] == "on"
+    assert changed.headers["ETag"] != etag
+
+def test_cached_get_keeps_not_found_responses():
+    assert client.get("/devices/missing", headers={"If-None-Match": "*"}).json() == {"error": "Device not found"}
+    assert client.get("/rooms/missing").status_code == 404
+
+def test_lru_bounds_entries_and_bytes():
+    cache = ResponseCache(max_entries=2, max_bytes=10)
+    cache.put("a", "1", b"aaaa")
+    cache.put("b", "1", b"bbbb")
+    assert cache.get("a", "1") == b"aaaa"
+    cache.put("c", "1", b"cccc")
+    assert cache.get("b", "1") is None and cache.get("a", "1") == b"aaaa"
+    cache.put("a", "2", b"aaaaaaaa")
+    assert cache.get("a", "1") is None and cache.get("c", "1") is None
+    stats = cache.stats()
+    assert stats["entries"] == 1 and stats["bytes"] == 8 and stats["evictions"] == 2
+
+def test_etag_matching():
+    assert etag_matches('"1", W/"2"', '"2"')
+    assert etag_matches("*", '"3"')
+    assert not etag_matches('"1"', '"2"') and not etag_matches(None, '"1"')
+
+def test_memory_versions_differ_between_repository_instances():
+    device = Device(device_id="D951", device_type="light", status="off")
+    first, second = Repository("device_id"), Repository("device_id")
+    first.add(device)
+    second.add(device)
+    assert first.version("D951") != second.version("D951")
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+from fastapi import WebSocketDisconnect
+from fastapi.testclient import TestClient
+from app.feed import ChangeFeed
+from app.main import app
+from app.models import Device, Room
+
+client = TestClient(app)
+
+def test_create_and_get_device():
+    payload = {"device_id": "D100", "device_type": "light", "status": "on"}
+    response = client.post("/devices/", json=payload)
+    assert response.status_code == 200
+    assert client.get("/devices/D100").json() == {**payload, "room_id": None}
+
+def test_duplicate_device_rejected():
+    payload = {"device_id": "D101", "device_type": "fan", "status": "off"}
+    assert client.post("/devices/", json=payload).status_code == 200
+    response = client.post("/devices/", json=payload)
+    assert response.status_code == 400
+    assert "already exists" in response.json()["detail"]
+
+def test_filter_devices_by_status_and_type():
+    client.post("/devices/", json={"device_id": "D102", "device_type": "heater", "status": "idle"})
+    client.post("/devices/", json={"device_id": "D103", "device_type": "heater", "status": "on"})
+    ids = [d["device_id"] for d in client.get("/devices/?device_type=heater&status=idle").json()]
+    assert ids == ["D102"]
+    ids = [d["device_id"] for d in client.get("/devices/?device_type=heater").json()]
+    assert ids == ["D102", "D103"]
+
+def test_get_nonexistent_device():
+    assert client.get("/devices/missing").json() == {"error": "Device not found"}
+
+def test_paginate_devices_with_cursor():
+    for i in range(5):
+        client.post("/devices/", json={"device_id": f"D2{i:02}", "device_type": "sensor", "status": "on"})
+    ids, cursor = [], None
+    while True:
+        params = {"device_type": "sensor", "limit": 2}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = client.get("/devices/", params=params)
+        ids += [d["device_id"] for d in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert ids == [f"D2{i:02}" for i in range(5)]
+
+def test_project_and_stream_devices():
+    client.post("/devices/", json={"device_id": "D300", "device_type": "lock", "status": "on"})
+    client.post("/devices/", json={"device_id": "D301", "device_type": "lock", "status": "off"})
+    response = client.get("/devices/?device_type=lock&fields=device_id,status")
+    assert response.json() == [{"device_id": "D300", "status": "on"}, {"device_id": "D301", "status": "off"}]
+    response = client.get("/devices/?device_type=lock&format=ndjson&fields=device_id")
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert response.text.splitlines() == ['{"device_id":"D300"}', '{"device_id":"D301"}']
+
+def test_invalid_list_parameters_rejected():
+    assert client.get("/devices/?cursor=abc").status_code == 400
+    assert client.get("/devices/?fields=nope").status_code == 400
+    assert client.get("/devices/?limit=0").status_code == 422
+
+def test_bulk_create_devices():
+    batch = [{"device_id": f"D4{i:02}", "device_type": "plug", "status": "off"} for i in range(3)]
+    response = client.post("/devices/bulk", json=batch)
+    assert response.json() == {"created": 3}
+    assert [d["device_id"] for d in client.get("/devices/?device_type=plug").json()] == ["D400", "D401", "D402"]
+
+def test_bulk_create_is_all_or_nothing():
+    client.post("/devices/", json={"device_id": "D500", "device_type": "camera", "status": "on"})
+    batch = [{"device_id": "D501", "device_type": "camera", "status": "on"},
+             {"device_id": "D500", "device_type": "camera", "status": "on"},
+             {"device_id": "D501", "device_type": "camera", "status": "on"}]
+    response = client.post("/devices/bulk", json=batch)
+    assert response.status_code == 400
+    assert [(e["index"], e["device_id"]) for e in response.json()["detail"]] == [(1, "D500"), (2, "D501")]
+    assert client.get("/devices/D501").json() == {"error": "Device not found"}
+    invalid = [{"device_id": "D502", "device_type": "camera", "status": "on"},
+               {"device_id": "D503", "device_type": "camera", "status": "broken"}]
+    response = client.post("/devices/bulk", json=invalid)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", 1, "status"]
+
+def test_bulk_update_device_status():
+    batch = [{"device_id": f"D6{i:02}", "device_type": "vent", "status": "off"} for i in range(3)]
+    client.post("/devices/bulk", json=batch)
+    updates = [{"device_id": "D600", "status": "on"}, {"device_id": "D602", "status": "idle"}]
+    assert client.patch("/devices/status", json=updates).json() == {"updated": 2}
+    assert client.get("/devices/D600").json()["status"] == "on"
+    ids = [d["device_id"] for d in client.get("/devices/?device_type=vent&status=off").json()]
+    assert ids == ["D601"]
+    response = client.patch("/devices/status", json=[{"device_id": "D601", "status": "on"},
+                                                     {"device_id": "missing", "status": "on"}])
+    assert response.status_code == 400
+    assert response.json()["detail"] == [{"index": 1, "device_id": "missing", "error": "ID missing not found"}]
+    assert client.get("/devices/D601").json()["status"] == "off"
+
+def test_feed_sends_status_changes_for_subscribed_house():
+    room = {"room_id": "R700", "name": "Kitchen",
+            "devices": [{"device_id": "D700", "device_type": "kettle", "status": "off"}]}
+    client.post("/houses/", json={"house_id": "H700", "address": "7 Main Street", "owner_id": "U700", "rooms": [room]})
+    client.post("/devices/bulk", json=[{"device_id": "D700", "device_type": "kettle", "status": "off"},
+                                       {"device_id": "D701", "device_type": "kettle", "status": "off"}])
+    with client.websocket_connect("/devices/feed?house_id=H700") as websocket:
+        client.patch("/devices/status", json=[{"device_id": "D701", "status": "on"}])
+        client.patch("/devices/status", json=[{"device_id": "D700", "status": "on"}])
+        assert websocket.receive_json() == {"device_id": "D700", "status": "on", "room_id": "R700", "house_id": "H700"}
+
+def test_feed_requires_a_topic():
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/devices/feed"):
+            pass
+    assert client.get("/devices/feed").status_code == 400
+
+def test_feed_fans_out_each_event_once_per_subscriber():
+    feed = ChangeFeed()
+
+    async def run():
+        subscriptions = [feed.subscribe(feed.topics(house_ids=["H1"], device_ids=["D1"])) for _ in range(10000)]
+        feed.track_room(Room(room_id="R1", name="Hall", house_id="H1",
+                             devices=[Device(device_id="D1", device_type="light", status="on")]))
+        await asyncio.to_thread(feed.publish, [{"device_id": "D1", "status": "off"}])
+        messages = [await subscription.get() for subscription in subscriptions]
+        assert all(subscription.queue.empty() for subscription in subscriptions)
+        for subscription in subscriptions:
+            subscription.close()
+        return messages
+
+    messages = asyncio.run(run())
+    assert len(messages) == 10000 and len({id(message) for message in messages}) == 1
+    assert feed.subscriber_count() == 0
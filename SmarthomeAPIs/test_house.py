@@ -0,0 +1,51 @@
+import json
+
+from fastapi.testclient import TestClient
+from app.main import app
+
+client = TestClient(app)
+
+def test_create_house_and_filter_by_owner():
+    payload = {"house_id": "H100", "address": "1 Main Street", "owner_id": "U100"}
+    assert client.post("/houses/", json=payload).status_code == 200
+    client.post("/houses/", json={"house_id": "H101", "address": "2 Main Street", "owner_id": "U101"})
+    assert client.get("/houses/H100").json()["owner_id"] == "U100"
+    ids = [h["house_id"] for h in client.get("/houses/?owner_id=U100").json()]
+    assert ids == ["H100"]
+
+def test_duplicate_house_rejected():
+    payload = {"house_id": "H102", "address": "3 Main Street", "owner_id": "U100"}
+    assert client.post("/houses/", json=payload).status_code == 200
+    assert client.post("/houses/", json=payload).status_code == 400
+
+def test_duplicate_embedded_room_named_in_error():
+    client.post("/rooms/", json={"room_id": "R104", "name": "Attic"})
+    payload = {"house_id": "H103", "address": "4 Main Street", "owner_id": "U100",
+               "rooms": [{"room_id": "R104", "name": "Attic"}]}
+    response = client.post("/houses/", json=payload)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "ID R104 already exists"
+    assert client.get("/houses/H103").json() == {"error": "House not found"}
+
+def test_get_nonexistent_house():
+    assert client.get("/houses/missing").json() == {"error": "House not found"}
+
+def test_stream_houses_with_embedded_rooms():
+    room = {"room_id": "R900", "name": "Hall", "house_id": "H900",
+            "devices": [{"device_id": "D900", "device_type": "light", "status": "on"}]}
+    client.post("/houses/", json={"house_id": "H900", "address": "9 Main Street", "owner_id": "U900", "rooms": [room]})
+    lines = client.get("/houses/?owner_id=U900&format=ndjson").text.splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["rooms"][0]["devices"][0]["device_id"] == "D900"
+
+def test_house_view_includes_rooms_and_devices_added_later():
+    client.post("/houses/", json={"house_id": "H910", "address": "10 Main Street", "owner_id": "U910"})
+    client.post("/rooms/", json={"room_id": "R910", "name": "Garage", "house_id": "H910"})
+    client.post("/devices/", json={"device_id": "D910", "device_type": "door", "status": "off", "room_id": "R910"})
+    etag = client.get("/houses/H910").headers["ETag"]
+    client.patch("/devices/status", json=[{"device_id": "D910", "status": "on"}])
+    response = client.get("/houses/H910", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["rooms"][0]["devices"] == [
+        {"device_id": "D910", "device_type": "door", "status": "on", "room_id": "R910"}]
+    assert [d["device_id"] for d in client.get("/devices/?room_id=R910").json()] == ["D910"]
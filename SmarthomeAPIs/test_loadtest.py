@@ -0,0 +1,34 @@
+import json
+
+import loadtest
+
+
+def test_run_reports_latency_throughput_and_memory():
+    results = loadtest.run(['smarthome', 'bookapi'], [1, 4], requests=60, warmup=0)
+    assert [(r['app'], r['concurrency']) for r in results] == [
+        ('smarthome', 1), ('smarthome', 4), ('bookapi', 1), ('bookapi', 4)]
+    for result in results:
+        assert result['errors'] == 0, result['first_errors']
+        assert result['requests'] == 60 and result['throughput'] > 0
+        assert result['p50'] <= result['p95'] <= result['p99'] <= result['max']
+        assert 'rss_growth' in result and sum(op['count'] for op in result['operations'].values()) == 60
+
+
+def test_compare_flags_latency_and_throughput_regressions():
+    result = {'app': 'bookapi', 'concurrency': 4, 'p95': 0.002, 'p99': 0.003, 'throughput': 500.0}
+    baseline = {'results': [dict(result, p95=0.001, throughput=1000.0)]}
+    regressions = loadtest.compare([result], baseline, threshold=0.2)
+    assert [r['metric'] for r in regressions] == ['p95', 'throughput']
+    assert loadtest.compare([result], {'results': [result]}, threshold=0.2) == []
+
+
+def test_main_fails_against_a_faster_baseline(tmp_path):
+    report_path = tmp_path / 'report.json'
+    args = ['--apps', 'bookapi', '--concurrency', '2', '--requests', '40', '--warmup', '0', '--quiet']
+    assert loadtest.main(args + ['--json', str(report_path)]) == 0
+    report = json.loads(report_path.read_text())
+    assert report['metadata']['requests'] == 40
+    for result in report['results']:
+        result.update(p95=result['p95'] / 100, p99=result['p99'] / 100, throughput=result['throughput'] * 100)
+    report_path.write_text(json.dumps(report))
+    assert loadtest.main(args + ['--baseline', str(report_path)]) == 1
@@ -0,0 +1,40 @@
+import json
+
+import pr
+
+
+def test_percentile_and_summary():
+    assert pr.percentile([4, 1, 3, 2], 50) == 2.5
+    assert pr.percentile([1, 2, 3], 100) == 3
+    summary = pr.summarize([1.0, 2.0, 3.0])
+    assert summary['median'] == 2.0 and summary['min'] == 1.0 and summary['max'] == 3.0
+
+
+def test_run_suite_and_baseline_comparison(tmp_path):
+    results = pr.run_suite(['CpuThread', 'IoAsyncio'], [1, 2], 1000, 0.001, warmup=1, repeats=3)
+    assert [(r['executor'], r['nworkers']) for r in results] == [
+        ('CpuThread', 1), ('IoAsyncio', 1), ('CpuThread', 2), ('IoAsyncio', 2)]
+    assert all(len(r['trials']) == 3 for r in results)
+
+    baseline = {'results': [dict(r, median=r['median'] / 2) for r in results]}
+    regressions = pr.compare(results, baseline, threshold=0.5)
+    assert len(regressions) == 4 and all(r['ratio'] > 1.5 for r in regressions)
+    assert pr.compare(results, {'results': results}, threshold=0.1) == []
+
+
+def test_main_writes_json_and_csv(tmp_path):
+    report_path, csv_path = tmp_path / 'report.json', tmp_path / 'report.csv'
+    args = ['1000', '--sleep', '0.001', '--workers', '1', '--executors', 'CpuThread', 'IoThreadPool',
+            '--repeats', '2', '--quiet', '--json', str(report_path), '--csv', str(csv_path)]
+    assert pr.main(args) == 0
+    report = json.loads(report_path.read_text())
+    assert report['metadata']['repeats'] == 2
+    assert len(csv_path.read_text().splitlines()) == 3
+    assert pr.main(args + ['--baseline', str(report_path), '--threshold', '100']) == 0
+
+
+def test_overhead_components_and_break_even():
+    results = pr.run_overhead(['fork'], [1], 1000, warmup=0, repeats=2)
+    assert [r['executor'] for r in results] == [f'{c}[fork]' for c in pr.OVERHEAD_COMPONENTS]
+    rows = pr.break_even(results)
+    assert len(rows) == 1 and rows[0]['start_method'] == 'fork' and rows[0]['pool_start'] > 0
@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.models import Device, House, Room
+from app.repository import DuplicateIdError, Repository, link
+from app.sqlite_store import SqliteStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        store = SqliteStore(str(tmp_path / "smarthome.db"), pool_size=2)
+        yield store
+        store.close()
+        return
+    houses = Repository("house_id", ["owner_id"])
+    rooms = Repository("room_id", ["house_id"])
+    devices = Repository("device_id", ["status", "device_type", "room_id"])
+    link(houses, rooms, "rooms", "house_id")
+    link(rooms, devices, "devices", "room_id")
+    yield SimpleNamespace(houses=houses, rooms=rooms, devices=devices)
+
+
+def test_house_view_follows_separately_written_rooms_and_devices(store):
+    store.houses.add(House(house_id="H1", address="1 Main Street", owner_id="U1"))
+    store.rooms.add(Room(room_id="R1", name="Kitchen", house_id="H1"))
+    store.devices.add(Device(device_id="D1", device_type="light", status="on", room_id="R1"))
+    # A device may name its room before the room exists.
+    store.devices.add(Device(device_id="D2", device_type="fan", status="off", room_id="R2"))
+    store.rooms.add(Room(room_id="R2", name="Hall", house_id="H1"))
+    version = store.houses.version("H1")
+
+    store.devices.update_many([("D1", {"status": "idle"})])
+    house = store.houses.get("H1")
+    assert store.houses.version("H1") != version
+    assert [(r.room_id, [(d.device_id, d.status) for d in r.devices]) for r in house.rooms] == [
+        ("R1", [("D1", "idle")]), ("R2", [("D2", "off")])]
+    assert store.rooms.get("R1").devices[0].status == "idle"
+
+    store.devices.remove("D2")
+    assert store.houses.get("H1").rooms[1].devices == []
+
+
+def test_embedded_models_are_stored_by_reference(store):
+    room = Room(room_id="R1", name="Kitchen", devices=[Device(device_id="D1", device_type="light", status="on")])
+    store.houses.add(House(house_id="H1", address="1 Main Street", owner_id="U1", rooms=[room]))
+    assert store.rooms.get("R1").house_id == "H1"
+    assert store.devices.get("D1").room_id == "R1"
+    with pytest.raises(DuplicateIdError):
+        store.devices.add(Device(device_id="D1", device_type="light", status="on"))
+
+
+def test_replace_and_remove_cascade_to_children(store):
+    rooms = [Room(room_id="R1", name="Kitchen", devices=[Device(device_id="D1", device_type="light", status="on")])]
+    store.houses.add(House(house_id="H1", address="1 Main Street", owner_id="U1", rooms=rooms))
+    store.rooms.replace(Room(room_id="R1", name="Pantry", house_id="H1",
+                             devices=[Device(device_id="D2", device_type="fan", status="off")]))
+    assert "D1" not in store.devices
+    room = store.houses.get("H1").rooms[0]
+    assert room.name == "Pantry" and [d.device_id for d in room.devices] == ["D2"]
+
+    store.houses.remove("H1")
+    assert len(store.houses) == 0 and len(store.rooms) == 0 and len(store.devices) == 0
@@ -0,0 +1,28 @@
+from fastapi.testclient import TestClient
+from app.main import app
+
+client = TestClient(app)
+
+def test_rooms_by_house():
+    client.post("/rooms/", json={"room_id": "R100", "name": "Kitchen", "house_id": "H200"})
+    client.post("/rooms/", json={"room_id": "R101", "name": "Bedroom", "house_id": "H200"})
+    client.post("/rooms/", json={"room_id": "R102", "name": "Garage", "house_id": "H201"})
+    ids = [r["room_id"] for r in client.get("/rooms/?house_id=H200").json()]
+    assert ids == ["R100", "R101"]
+    assert [r["room_id"] for r in client.get("/houses/H201/rooms").json()] == ["R102"]
+    assert client.get("/rooms/R100").json()["name"] == "Kitchen"
+
+def test_duplicate_room_rejected():
+    payload = {"room_id": "R103", "name": "Office"}
+    assert client.post("/rooms/", json=payload).status_code == 200
+    assert client.post("/rooms/", json=payload).status_code == 400
+
+def test_duplicate_embedded_device_named_in_error():
+    client.post("/devices/", json={"device_id": "D105", "device_type": "lamp", "status": "on"})
+    payload = {"room_id": "R105", "name": "Study", "devices": [{"device_id": "D105", "device_type": "lamp", "status": "on"}]}
+    response = client.post("/rooms/", json=payload)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "ID D105 already exists"
+
+def test_get_nonexistent_room():
+    assert client.get("/rooms/missing").status_code == 404
@@ -0,0 +1,105 @@
+import multiprocessing
+import sqlite3
+
+import pytest
+
+from app.models import Device, House, Room
+from app.repository import DuplicateIdError
+from app.sqlite_store import SCHEMA_VERSION, SqliteStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteStore(str(tmp_path / "smarthome.db"), pool_size=2)
+    yield store
+    store.close()
+
+
+def make_house():
+    devices = [Device(device_id="D1", device_type="light", status="on"),
+               Device(device_id="D2", device_type="fan", status="off")]
+    return House(house_id="H1", address="1 Main Street", owner_id="U1",
+                 rooms=[Room(room_id="R1", name="Kitchen", devices=devices)])
+
+
+def test_nested_house_round_trip(store):
+    store.houses.add(make_house())
+    house = store.houses.get("H1")
+    assert house.rooms[0].room_id == "R1" and house.rooms[0].house_id == "H1"
+    assert [d.device_id for d in house.rooms[0].devices] == ["D1", "D2"]
+    assert [r.room_id for r in store.rooms.find(house_id="H1")] == ["R1"]
+    assert [d.device_id for d in store.devices.find(status="on")] == ["D1"]
+    assert [h.house_id for h in store.houses.find(owner_id="U1")] == ["H1"]
+
+    store.houses.remove("H1")
+    assert len(store.houses) == 0 and len(store.rooms) == 0 and len(store.devices) == 0
+
+
+def test_device_update_changes_room_and_house_versions(store):
+    store.houses.add(make_house())
+    versions = [store.houses.version("H1"), store.rooms.version("R1"), store.devices.version("D1")]
+    store.devices.update_many([("D1", {"status": "idle"})])
+    assert all(new != old for new, old in zip(
+        [store.houses.version("H1"), store.rooms.version("R1"), store.devices.version("D1")], versions))
+    assert store.houses.get("H1").rooms[0].devices[0].status == "idle"
+    assert store.houses.version("missing") is None
+
+
+def test_duplicate_ids_roll_back_the_whole_model(store):
+    store.devices.add(Device(device_id="D2", device_type="fan", status="idle"))
+    with pytest.raises(DuplicateIdError):
+        store.houses.add(make_house())  # its room embeds D2 again
+    assert "H1" not in store.houses and "R1" not in store.rooms
+    assert store.devices.get("D2").status == "idle"
+
+
+def _count_devices(path, queue):
+    queue.put(len(SqliteStore(path).devices.find(device_type="light")))
+
+
+def test_other_processes_read_committed_data(store, tmp_path):
+    for i in range(20):
+        store.devices.add(Device(device_id=f"D{i}", device_type="light", status="on"))
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    processes = [ctx.Process(target=_count_devices, args=(store.pool.path, queue)) for _ in range(2)]
+    for process in processes:
+        process.start()
+    counts = [queue.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join()
+    assert counts == [20, 20]
+
+
+def test_unversioned_database_is_migrated(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    # The first SQLite layout: text primary keys, no seq or version columns.
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE rooms (room_id TEXT PRIMARY KEY, name TEXT NOT NULL, house_id TEXT);
+        CREATE TABLE devices (device_id TEXT PRIMARY KEY, device_type TEXT NOT NULL, status TEXT NOT NULL,
+                              room_id TEXT REFERENCES rooms (room_id) ON DELETE CASCADE);
+        CREATE INDEX devices_status ON devices (status);
+        INSERT INTO rooms VALUES ('R1', 'Kitchen', NULL);
+        INSERT INTO devices VALUES ('D2', 'fan', 'off', 'R1'), ('D1', 'light', 'on', 'R1');
+    """)
+    connection.close()
+
+    store = SqliteStore(path, pool_size=1)
+    assert [d.device_id for d in store.devices.all()] == ["D2", "D1"]
+    assert [d.device_id for d in store.rooms.get("R1").devices] == ["D2", "D1"]
+    assert store.devices.version("D1") is not None
+    store.rooms.remove("R1")
+    assert len(store.devices) == 0
+    store.close()
+    # Opening again leaves a current database alone.
+    SqliteStore(path, pool_size=1).close()
+
+
+def test_newer_schema_is_refused(tmp_path):
+    path = str(tmp_path / "newer.db")
+    connection = sqlite3.connect(path)
+    connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+    connection.close()
+    with pytest.raises(RuntimeError, match="newer"):
+        SqliteStore(path, pool_size=1)
@@ -0,0 +1,73 @@
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from fastapi.testclient import TestClient
+from app.main import app
+from app.telemetry import DAY, STATUS_CODES, TelemetryStore, status_counts, telemetry, time_in_status
+
+client = TestClient(app)
+
+MIDNIGHT = datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp()
+
+def test_uptime_per_day_from_status_changes():
+    store = TelemetryStore()
+    store.record("D1", "on", MIDNIGHT + 3600)
+    store.record("D1", "off", MIDNIGHT + 7200)
+    store.record("D1", "on", MIDNIGHT + DAY - 600)
+    store.record("D1", "idle", MIDNIGHT + DAY + 1200)
+    times, codes = store.history("D1", MIDNIGHT, MIDNIGHT + 2 * DAY)
+    uptime = time_in_status(times, codes, "on", MIDNIGHT + DAY * np.arange(3))
+    assert uptime.tolist() == [3600 + 600, 1200]
+
+def test_history_carries_status_from_before_start():
+    store = TelemetryStore()
+    store.record("D1", "on", MIDNIGHT - 5)
+    store.record("D1", "off", MIDNIGHT + DAY + 10)
+    times, codes = store.history("D1", MIDNIGHT + DAY, MIDNIGHT + 2 * DAY)
+    assert times.tolist() == [MIDNIGHT - 5, MIDNIGHT + DAY + 10]
+    uptime = time_in_status(times, codes, "on", np.array([MIDNIGHT + DAY, MIDNIGHT + 2 * DAY]))
+    assert uptime.tolist() == [10]
+
+def test_segments_roll_over_to_disk(tmp_path):
+    store = TelemetryStore(str(tmp_path))
+    for day in range(3):
+        for i in range(100):
+            store.record("room/../D1", "on" if i % 2 else "off", MIDNIGHT + day * DAY + i)
+    assert len(store._series["room/../D1"].sealed) == 2
+    store.close()
+    reopened = TelemetryStore(str(tmp_path))
+    times, codes = reopened.history("room/../D1", MIDNIGHT, MIDNIGHT + 3 * DAY)
+    assert len(times) == 300 and np.all(np.diff(times) > 0)
+    counts = status_counts(times, codes, MIDNIGHT + DAY * np.arange(4))
+    assert counts[:, :2].tolist() == [[50, 50]] * 3
+    assert [path.name for path in tmp_path.iterdir()] == ["d-room%2F..%2FD1"]
+
+def test_status_changes_are_recorded():
+    client.post("/devices/bulk", json=[{"device_id": "D800", "device_type": "lamp", "status": "off"}])
+    client.patch("/devices/status", json=[{"device_id": "D800", "status": "on"}])
+    times, codes = telemetry.history("D800", 0, time.time() + 1)
+    assert codes.tolist() == [STATUS_CODES["off"], STATUS_CODES["on"]]
+    today = datetime.now(timezone.utc).date().isoformat()
+    uptime = client.get(f"/telemetry/devices/D800/uptime?start={today}").json()
+    assert len(uptime) == 1 and uptime[0]["date"] == today and uptime[0]["uptime_seconds"] >= 0
+    assert client.get("/telemetry/devices/missing/uptime").status_code == 404
+
+def test_devices_created_inside_a_house_are_recorded():
+    house = {"house_id": "H820", "owner_id": "U820", "address": "1 Main St", "rooms": [
+        {"room_id": "R820", "name": "Hall", "devices": [{"device_id": "D820", "device_type": "lamp", "status": "on"}]}]}
+    client.post("/houses/", json=house)
+    times, codes = telemetry.history("D820", 0, time.time() + 1)
+    assert codes.tolist() == [STATUS_CODES["on"]]
+    assert client.get("/telemetry/rooms/R820/status-counts").json()[-1]["on"] == 1
+
+def test_room_status_counts_endpoint():
+    room = {"room_id": "R810", "name": "Office",
+            "devices": [{"device_id": "D810", "device_type": "lamp", "status": "off"},
+                        {"device_id": "D811", "device_type": "fan", "status": "off"}]}
+    client.post("/rooms/", json=room)
+    telemetry.record_many([("D810", "on"), ("D811", "on"), ("D811", "idle")])
+    counts = client.get("/telemetry/rooms/R810/status-counts").json()
+    assert len(counts) == 7
+    assert counts[-1] == {"date": datetime.now(timezone.utc).date().isoformat(), "off": 2, "on": 2, "idle": 1}
+    assert client.get("/telemetry/rooms/R810/status-counts?start=2026-02-01&end=2026-01-01").status_code == 400
@@ -1,6 +1,12 @@
-from fastapi import FastAPI, HTTPException
+import bisect
+import heapq
+import math
+import re
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from fastapi import FastAPI, HTTPException, Query
 from pydantic import BaseModel
-from typing import List, Optional
 
 app = FastAPI()
 
@@ -12,45 +18,229 @@ class Book(BaseModel):
     description: Optional[str] = None
 
 
-books_db = [
-    Book(id=1, title="1984", author="George Orwell", description="Dystopian novel"),
-    Book(id=2, title="Brave New World", author="Aldous Huxley", description="Science fiction novel"),
-]
+class SearchResult(BaseModel):
+    score: float
+    book: Book
+
+
+class DuplicateBookError(KeyError):
+    pass
+
+
+TOKEN_RE = re.compile(r"\w+")
+STOP_WORDS = frozenset("a an and are as at be by for from in is it of on or the to with".split())
+# A match in the title counts three times as much as one in the description.
+FIELD_WEIGHTS = {"title": 3.0, "author": 2.0, "description": 1.0}
+# BM25 term-frequency saturation and length normalization.
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+
+
+class BookStore:
+    """Books by id, with an ordered id index and an inverted index for search.
+
+    Lookups by id are dict lookups; listing walks a sorted list of ids from
+    a binary-searched starting point. Deleted ids stay in that list until
+    they outnumber the live ones and are compacted away, so deletes do not
+    shift it. The inverted index maps each token of title, author and
+    description to the books containing it and its field-weighted count.
+
+    A book's BM25 score for one term depends only on that count and the
+    book's length, so each term also groups its books by (count, length).
+    Search visits those groups best first and stops once no remaining group
+    can beat the current top results, instead of scoring every book that
+    contains a common term.
+    """
+
+    def __init__(self):
+        self._books: Dict[int, Book] = {}
+        self._ids: List[int] = []
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._impacts: Dict[str, Dict[Tuple[float, float], Set[int]]] = {}
+        self._lengths: Dict[int, float] = {}
+        self._total_length = 0.0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._books)
+
+    def __contains__(self, book_id: int) -> bool:
+        return book_id in self._books
+
+    @staticmethod
+    def _terms(book: Book) -> Dict[str, float]:
+        terms: Dict[str, float] = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(getattr(book, field) or ""):
+                terms[token] = terms.get(token, 0.0) + weight
+        return terms
+
+    def _index(self, book: Book) -> None:
+        terms = self._terms(book)
+        length = sum(terms.values())
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[book.id] = frequency
+            self._impacts.setdefault(term, {}).setdefault((frequency, length), set()).add(book.id)
+        self._lengths[book.id] = length
+        self._total_length += length
+
+    def _unindex(self, book: Book) -> None:
+        length = self._lengths.pop(book.id)
+        for term in self._terms(book):
+            postings = self._postings[term]
+            impacts = self._impacts[term]
+            key = (postings.pop(book.id), length)
+            impacts[key].discard(book.id)
+            if not impacts[key]:
+                del impacts[key]
+            if not postings:
+                del self._postings[term]
+                del self._impacts[term]
+        self._total_length -= length
+
+    def get(self, book_id: int) -> Optional[Book]:
+        return self._books.get(book_id)
+
+    def add(self, book: Book) -> Book:
+        with self._lock:
+            if book.id in self._books:
+                raise DuplicateBookError(book.id)
+            self._books[book.id] = book
+            position = bisect.bisect_left(self._ids, book.id)
+            # The id may still be listed from a deleted book.
+            if position == len(self._ids) or self._ids[position] != book.id:
+                self._ids.insert(position, book.id)
+            self._index(book)
+        return book
+
+    def replace(self, book_id: int, book: Book) -> Optional[Book]:
+        """Put book in place of the one stored under book_id; None if there is none."""
+        with self._lock:
+            if book_id not in self._books:
+                return None
+            if book.id != book_id and book.id in self._books:
+                raise DuplicateBookError(book.id)
+            self.remove(book_id)
+            return self.add(book)
+
+    def remove(self, book_id: int) -> Optional[Book]:
+        with self._lock:
+            book = self._books.pop(book_id, None)
+            if book is None:
+                return None
+            self._unindex(book)
+            if len(self._ids) > 2 * len(self._books) + 1024:
+                self._ids = [listed for listed in self._ids if listed in self._books]
+            return book
+
+    def page(self, after_id: Optional[int] = None, limit: Optional[int] = None) -> List[Book]:
+        """Books in id order, starting after after_id, at most limit of them."""
+        with self._lock:
+            start = 0 if after_id is None else bisect.bisect_right(self._ids, after_id)
+            books = []
+            for position in range(start, len(self._ids)):
+                book = self._books.get(self._ids[position])
+                if book is None:
+                    continue
+                if limit is not None and len(books) == limit:
+                    break
+                books.append(book)
+            return books
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[float, Book]]:
+        """The best limit books containing every term of query, ranked by BM25."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            if not all(term in self._postings for term in terms):
+                return []
+            # Only books holding the rarest term can match, so its groups drive the search.
+            terms = sorted(terms, key=lambda term: len(self._postings[term]))
+            count = len(self._books)
+            average_length = self._total_length / count
+            idfs = [math.log(1 + (count - len(self._postings[term]) + 0.5) / (len(self._postings[term]) + 0.5))
+                    for term in terms]
+
+            def term_score(idf: float, frequency: float, length: float) -> float:
+                return idf * frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * length / average_length))
+
+            others = [(idf, self._postings[term]) for idf, term in zip(idfs[1:], terms[1:])]
+            others_best = sum(max(term_score(idf, *key) for key in self._impacts[term])
+                              for idf, term in zip(idfs[1:], terms[1:]))
+            groups = sorted(((term_score(idfs[0], *key), key) for key in self._impacts[terms[0]]), reverse=True)
+            # Min-heap of (score, -id): equal scores rank by lower id. A group
+            # whose bound only ties the weakest result may still hold a lower
+            # id with that score, so scanning stops only on a strict win.
+            best: List[Tuple[float, int]] = []
+            for group_score, key in groups:
+                bound = group_score + others_best
+                if len(best) == limit and best[0][0] > bound:
+                    break
+                for book_id in self._impacts[terms[0]][key]:
+                    if not all(book_id in posting for _, posting in others):
+                        continue
+                    length = self._lengths[book_id]
+                    entry = (group_score + sum(term_score(idf, posting[book_id], length) for idf, posting in others),
+                             -book_id)
+                    if len(best) < limit:
+                        heapq.heappush(best, entry)
+                    elif entry > best[0]:
+                        heapq.heapreplace(best, entry)
+                    if len(best) == limit and best[0][0] > bound:
+                        break
+            return [(round(value, 6), self._books[-negative_id]) for value, negative_id in sorted(best, reverse=True)]
+
+
+books_db = BookStore()
+books_db.add(Book(id=1, title="1984", author="George Orwell", description="Dystopian novel"))
+books_db.add(Book(id=2, title="Brave New World", author="Aldous Huxley", description="Science fiction novel"))
 
 
 @app.get("/books", response_model=List[Book])
-def get_books():
-    return books_db
+def get_books(after_id: Optional[int] = None, limit: Optional[int] = Query(None, ge=1)):
+    return books_db.page(after_id, limit)
+
+
+# Ranked full-text search over title, author and description
+@app.get("/books/search", response_model=List[SearchResult])
+def search_books(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=100)):
+    return [SearchResult(score=score, book=book) for score, book in books_db.search(q, limit)]
 
 
 @app.get("/books/{book_id}", response_model=Book)
 def get_book(book_id: int):
-    for book in books_db:
-        if book.id == book_id:
-            return book
-    raise HTTPException(status_code=404, detail="Book not found")
+    book = books_db.get(book_id)
+    if book is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return book
 
 
 @app.post("/books", response_model=Book)
 def create_book(book: Book):
-    
-    books_db.append(book)
-    return book
+    try:
+        return books_db.add(book)
+    except DuplicateBookError:
+        raise HTTPException(status_code=400, detail=f"Book ID {book.id} already exists")
 
 # Update an existing book
 @app.put("/books/{book_id}", response_model=Book)
 def update_book(book_id: int, updated_book: Book):
-    for index, existing_book in enumerate(books_db):
-        if existing_book.id == book_id:
-            books_db[index] = updated_book
-            return updated_book
-    raise HTTPException(status_code=404, detail="Book not found")
+    try:
+        book = books_db.replace(book_id, updated_book)
+    except DuplicateBookError:
+        raise HTTPException(status_code=400, detail=f"Book ID {updated_book.id} already exists")
+    if book is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return book
 
 # Delete a book
 @app.delete("/books/{book_id}")
 def delete_book(book_id: int):
-    for index, existing_book in enumerate(books_db):
-        if existing_book.id == book_id:
-            del books_db[index]
-            return {"message": "Book deleted successfully"}
-    raise HTTPException(status_code=404, detail="Book not found")
+    if books_db.remove(book_id) is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return {"message": "Book deleted successfully"}
@@ -0,0 +1,99 @@
+import math
+import random
+
+from fastapi.testclient import TestClient
+from main import B, K1, Book, BookStore, app, tokenize
+
+client = TestClient(app)
+
+def book(book_id, title, author="Anon", description=None):
+    return {"id": book_id, "title": title, "author": author, "description": description}
+
+def brute_force(store, query):
+    """(score, id) of every book matching all terms of query, best first, scored from scratch."""
+    terms = set(tokenize(query))
+    books = list(store.page())
+    fields = [store._terms(b) for b in books]
+    average_length = sum(sum(terms_of.values()) for terms_of in fields) / len(books)
+    results = []
+    for b, terms_of in zip(books, fields):
+        if not terms or not all(term in terms_of for term in terms):
+            continue
+        length = sum(terms_of.values())
+        score = 0.0
+        for term in terms:
+            df = sum(term in other for other in fields)
+            idf = math.log(1 + (len(books) - df + 0.5) / (df + 0.5))
+            frequency = terms_of[term]
+            score += idf * frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * length / average_length))
+        results.append((score, b.id))
+    results.sort(key=lambda result: (-round(result[0], 9), result[1]))
+    return results
+
+def test_duplicate_book_rejected():
+    assert client.post("/books", json=book(100, "Dune")).status_code == 200
+    response = client.post("/books", json=book(100, "Dune Messiah"))
+    assert response.status_code == 400
+    assert "already exists" in response.json()["detail"]
+    assert client.get("/books/100").json()["title"] == "Dune"
+
+def test_update_onto_existing_id_rejected():
+    client.post("/books", json=book(101, "Emma"))
+    client.post("/books", json=book(102, "Persuasion"))
+    response = client.put("/books/101", json=book(102, "Emma"))
+    assert response.status_code == 400
+    assert client.get("/books/101").json()["title"] == "Emma"
+    assert client.get("/books/102").json()["title"] == "Persuasion"
+    assert client.put("/books/103", json=book(103, "Missing")).status_code == 404
+
+def test_paginate_books_after_id():
+    for i in range(110, 115):
+        client.post("/books", json=book(i, f"Volume {i}"))
+    client.delete("/books/112")
+    ids, after_id = [], 109
+    while True:
+        page = client.get("/books", params={"after_id": after_id, "limit": 2}).json()
+        page = [b["id"] for b in page if b["id"] < 115]
+        if not page:
+            break
+        ids += page
+        after_id = page[-1]
+    assert ids == [110, 111, 113, 114]
+    assert client.get("/books", params={"limit": 0}).status_code == 422
+
+def test_replace_and_delete_update_search_index():
+    client.post("/books", json=book(120, "Quixotic Voyages", "Zeno Marlowe"))
+    assert [r["book"]["id"] for r in client.get("/books/search", params={"q": "quixotic"}).json()] == [120]
+    client.put("/books/120", json=book(121, "Peregrine Voyages", "Zeno Marlowe"))
+    assert client.get("/books/search", params={"q": "quixotic"}).json() == []
+    assert [r["book"]["id"] for r in client.get("/books/search", params={"q": "peregrine"}).json()] == [121]
+    assert client.delete("/books/121").status_code == 200
+    assert client.get("/books/search", params={"q": "peregrine marlowe"}).json() == []
+    assert client.delete("/books/121").status_code == 404
+
+def test_search_ranks_title_matches_first():
+    store = BookStore()
+    store.add(Book(id=1, title="Gardens", author="Ann Lee", description="A book about roses"))
+    store.add(Book(id=2, title="Roses", author="Bob Ray", description="Growing them"))
+    store.add(Book(id=3, title="Tulips", author="Cy Roses"))
+    assert [b.id for _, b in store.search("roses")] == [2, 3, 1]
+    assert [b.id for _, b in store.search("roses growing")] == [2]
+    assert store.search("the") == []
+
+def test_search_matches_brute_force_including_ties():
+    rng = random.Random(5)
+    words = [f"w{i}" for i in range(12)]
+    store = BookStore()
+    for i in range(400):
+        # Few distinct texts, so many books tie on score.
+        store.add(Book(id=rng.randrange(10 ** 6) * 1000 + i, title=" ".join(rng.choices(words[:4], k=rng.randint(1, 2))),
+                       author=rng.choice(["Ada", "Bo"]), description=rng.choice(["", "w5", "w5 w6"])))
+    for book_id in rng.sample([b.id for b in store.page()], 50):
+        store.remove(book_id)
+    for _ in range(100):
+        query = " ".join(rng.choices(words[:7] + ["ada"], k=rng.randint(1, 2)))
+        limit = rng.randint(1, 30)
+        expected = brute_force(store, query)[:limit]
+        results = store.search(query, limit)
+        assert [b.id for _, b in results] == [book_id for _, book_id in expected], query
+        assert all(abs(score - round(best, 6)) < 1e-9 for (score, _), (best, _) in zip(results, expected))